@@ -1,8 +1,38 @@
 import os
 from celery import Celery
+from celery.signals import worker_init, worker_process_init, worker_process_shutdown, worker_shutdown
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
 
 app = Celery('core')
 app.config_from_object('django.conf:settings', namespace='CELERY')
-app.autodiscover_tasks()
\ No newline at end of file
+app.autodiscover_tasks()
+
+
+@worker_process_init.connect
+def start_worker_event_loop(**kwargs):
+    """Создание event loop на всё время жизни дочернего процесса (prefork)."""
+    from core import event_loop
+    event_loop.start()
+
+
+@worker_process_shutdown.connect
+@worker_shutdown.connect
+def stop_worker_event_loop(**kwargs):
+    """Закрытие общих async-ресурсов и event loop при остановке worker."""
+    from core import event_loop
+    event_loop.shutdown()
+
+
+@worker_init.connect
+def start_worker_metrics_exporter(**kwargs):
+    """Экспортер Prometheus-метрик в главном процессе worker."""
+    from payments.metrics import start_worker_exporter
+    start_worker_exporter()
+
+
+@worker_process_shutdown.connect
+def mark_worker_metrics_dead(pid=None, **kwargs):
+    """Очистка multiprocess-метрик завершившегося дочернего процесса."""
+    from payments.metrics import mark_worker_process_dead
+    mark_worker_process_dead(pid or os.getpid())
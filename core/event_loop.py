@@ -0,0 +1,99 @@
+"""
+Event loop, живущий всё время работы Celery worker процесса.
+
+Loop создаётся на worker_process_init (prefork) или лениво при первой задаче
+(solo), и закрывается на shutdown worker'а. Async-клиенты и пулы соединений,
+зарегистрированные через get_resource, переживают отдельные задачи и
+корректно закрываются вместе с loop.
+"""
+import asyncio
+import logging
+import threading
+from typing import Any, Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+_state = threading.local()
+
+
+def _get_state():
+    if not hasattr(_state, 'loop'):
+        _state.loop = None
+        _state.resources = {}
+        _state.shutdown_callbacks = []
+    return _state
+
+
+def start() -> asyncio.AbstractEventLoop:
+    """Создание event loop для текущего потока (если ещё не создан)."""
+    state = _get_state()
+    if state.loop is None or state.loop.is_closed():
+        state.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(state.loop)
+        logger.info('[Loop] Создан event loop worker процесса')
+    return state.loop
+
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    """Текущий event loop worker процесса."""
+    return start()
+
+
+def run(coro: Awaitable) -> Any:
+    """Выполнение корутины на event loop worker процесса."""
+    return get_loop().run_until_complete(coro)
+
+
+def get_resource(
+    name: str,
+    factory: Callable[[], Any],
+    close: Optional[Callable[[Any], Awaitable]] = None,
+) -> Any:
+    """
+    Общий async-ресурс (клиент, пул соединений), живущий вместе с loop.
+
+    Args:
+        name: Имя ресурса
+        factory: Функция создания ресурса, вызывается один раз
+        close: Корутина-функция закрытия ресурса при shutdown
+
+    Returns:
+        Созданный ранее или новый ресурс
+    """
+    start()
+    state = _get_state()
+    if name not in state.resources:
+        resource = factory()
+        state.resources[name] = resource
+        if close is not None:
+            state.shutdown_callbacks.append((name, lambda: close(resource)))
+    return state.resources[name]
+
+
+def on_shutdown(callback: Callable[[], Awaitable]) -> Callable[[], Awaitable]:
+    """Регистрация корутины-функции, выполняемой перед закрытием loop."""
+    _get_state().shutdown_callbacks.append((callback.__name__, callback))
+    return callback
+
+
+def shutdown() -> None:
+    """Закрытие ресурсов и event loop (идемпотентно)."""
+    state = _get_state()
+    loop = state.loop
+    if loop is None or loop.is_closed():
+        return
+
+    try:
+        for name, callback in reversed(state.shutdown_callbacks):
+            try:
+                loop.run_until_complete(callback())
+            except Exception as exc:
+                logger.error(f'[Loop] Ошибка закрытия {name}: {exc}')
+        loop.run_until_complete(loop.shutdown_asyncgens())
+        loop.run_until_complete(loop.shutdown_default_executor())
+    finally:
+        loop.close()
+        state.loop = None
+        state.resources = {}
+        state.shutdown_callbacks = []
+        logger.info('[Loop] Event loop worker процесса закрыт')
@@ -40,6 +40,7 @@ INSTALLED_APPS = [
     'drf_spectacular',
     'django_filters',
     'corsheaders',
+    'django_celery_beat',
     
     'payments',
 ]
@@ -161,14 +162,26 @@ SPECTACULAR_SETTINGS = {
     },
 }
 
-# Celery
+# Redis
 
 if env("DJANGO_ENV") == "production":
-    CELERY_BROKER_URL = 'redis://redis:6379/0'
-    CELERY_RESULT_BACKEND = 'redis://redis:6379/0'
+    REDIS_URL = 'redis://redis:6379'
 else:
-    CELERY_BROKER_URL = 'redis://localhost:6379/0'
-    CELERY_RESULT_BACKEND = 'redis://localhost:6379/0'
+    REDIS_URL = 'redis://localhost:6379'
+
+# Cache
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': f'{REDIS_URL}/1',
+    },
+}
+
+# Celery
+
+CELERY_BROKER_URL = f'{REDIS_URL}/0'
+CELERY_RESULT_BACKEND = f'{REDIS_URL}/0'
 
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
@@ -176,6 +189,165 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TIMEZONE = 'Europe/Moscow'
 CELERY_TASK_TRACK_STARTED = True
 CELERY_TASK_TIME_LIMIT = 60
+CELERY_TASK_ROUTES = ('payments.routing.route_task',)
+CELERY_BEAT_SCHEDULER = 'django_celery_beat.schedulers:DatabaseScheduler'
+
+# Prometheus
+
+PROMETHEUS_WORKER_PORT = env.int("PROMETHEUS_WORKER_PORT", default=None)
+PROMETHEUS_METRICS_TOKEN = env("PROMETHEUS_METRICS_TOKEN", default='')
+PROMETHEUS_METRICS_ALLOWED_IPS = env.list("PROMETHEUS_METRICS_ALLOWED_IPS", default=[])
+PROMETHEUS_DB_METRICS_TTL = env.float("PROMETHEUS_DB_METRICS_TTL", default=15.0)
+
+# Payouts
+
+PAYOUT_BATCH_CONCURRENCY = env.int("PAYOUT_BATCH_CONCURRENCY", default=20)
+PAYOUT_BULK_MAX_ITEMS = env.int("PAYOUT_BULK_MAX_ITEMS", default=5000)
+PAYOUT_BULK_CHUNK_SIZE = env.int("PAYOUT_BULK_CHUNK_SIZE", default=100)
+PAYOUT_BULK_TRANSITION_MAX_IDS = env.int("PAYOUT_BULK_TRANSITION_MAX_IDS", default=50000)
+PAYOUT_BULK_TRANSITION_CHUNK_SIZE = env.int("PAYOUT_BULK_TRANSITION_CHUNK_SIZE", default=1000)
+PAYOUT_EXPORT_CHUNK_SIZE = env.int("PAYOUT_EXPORT_CHUNK_SIZE", default=2000)
+PAYOUT_RECIPIENT_CACHE_SIZE = env.int("PAYOUT_RECIPIENT_CACHE_SIZE", default=10000)
+PAYOUT_RECIPIENT_CACHE_TTL = env.int("PAYOUT_RECIPIENT_CACHE_TTL", default=3600)
+PAYOUT_RECIPIENT_CACHE_NEGATIVE_TTL = env.int("PAYOUT_RECIPIENT_CACHE_NEGATIVE_TTL", default=60)
+PAYOUT_IDEMPOTENCY_CACHE_TTL = env.int("PAYOUT_IDEMPOTENCY_CACHE_TTL", default=86400)
+PAYOUT_GATEWAY_RESULT_TTL = env.int("PAYOUT_GATEWAY_RESULT_TTL", default=86400)
+PAYOUT_CACHE_TTL = env.int("PAYOUT_CACHE_TTL", default=10)
+PAYOUT_CACHE_FINAL_TTL = env.int("PAYOUT_CACHE_FINAL_TTL", default=86400)
+PAYOUT_CACHE_LOCK_TIMEOUT = env.int("PAYOUT_CACHE_LOCK_TIMEOUT", default=5)
+PAYOUT_CACHE_LOCK_WAIT = env.float("PAYOUT_CACHE_LOCK_WAIT", default=1.0)
+PAYOUT_CACHE_LOCK_POLL = env.float("PAYOUT_CACHE_LOCK_POLL", default=0.02)
+PAYOUT_STATUS_MAX_WAIT = env.int("PAYOUT_STATUS_MAX_WAIT", default=30)
+PAYOUT_STATUS_POLL_INTERVAL = env.float("PAYOUT_STATUS_POLL_INTERVAL", default=5.0)
+PAYOUT_STATS_SHARDS = env.int("PAYOUT_STATS_SHARDS", default=8)
+PAYOUT_TIME_IN_STATE_MAX_DAYS = env.int("PAYOUT_TIME_IN_STATE_MAX_DAYS", default=31)
+
+# Payout write-behind
+
+PAYOUT_WRITE_BEHIND = env.bool("PAYOUT_WRITE_BEHIND", default=False)
+PAYOUT_WRITE_BEHIND_MAX_ITEMS = env.int("PAYOUT_WRITE_BEHIND_MAX_ITEMS", default=200)
+PAYOUT_WRITE_BEHIND_FLUSH_INTERVAL = env.float("PAYOUT_WRITE_BEHIND_FLUSH_INTERVAL", default=0.05)
+
+# Payout status events (Redis pub/sub, SSE)
+
+PAYOUT_EVENTS_REDIS_URL = env("PAYOUT_EVENTS_REDIS_URL", default=f'{REDIS_URL}/2')
+PAYOUT_EVENTS_CHANNEL = env("PAYOUT_EVENTS_CHANNEL", default='payouts:status')
+PAYOUT_EVENTS_QUEUE_SIZE = env.int("PAYOUT_EVENTS_QUEUE_SIZE", default=16)
+PAYOUT_EVENTS_KEEPALIVE = env.float("PAYOUT_EVENTS_KEEPALIVE", default=15.0)
+PAYOUT_EVENTS_MAX_DURATION = env.int("PAYOUT_EVENTS_MAX_DURATION", default=300)
+PAYOUT_EVENTS_PUBLISH_TIMEOUT = env.float("PAYOUT_EVENTS_PUBLISH_TIMEOUT", default=0.25)
+PAYOUT_EVENTS_PUBLISH_QUEUE_SIZE = env.int("PAYOUT_EVENTS_PUBLISH_QUEUE_SIZE", default=10000)
+PAYOUT_EVENTS_RETRY_INTERVAL = env.float("PAYOUT_EVENTS_RETRY_INTERVAL", default=5.0)
+
+# Payout sweeper
+
+PAYOUT_SWEEP_INTERVAL = env.int("PAYOUT_SWEEP_INTERVAL", default=60)
+PAYOUT_STUCK_PROCESSING_AFTER = env.int("PAYOUT_STUCK_PROCESSING_AFTER", default=300)
+PAYOUT_STUCK_PENDING_AFTER = env.int("PAYOUT_STUCK_PENDING_AFTER", default=600)
+PAYOUT_SWEEP_BATCH_SIZE = env.int("PAYOUT_SWEEP_BATCH_SIZE", default=500)
+PAYOUT_SWEEP_MAX_BATCHES = env.int("PAYOUT_SWEEP_MAX_BATCHES", default=20)
+
+# Payout outbox
+
+PAYOUT_OUTBOX_BATCH_SIZE = env.int("PAYOUT_OUTBOX_BATCH_SIZE", default=500)
+PAYOUT_OUTBOX_MAX_BATCHES = env.int("PAYOUT_OUTBOX_MAX_BATCHES", default=20)
+PAYOUT_OUTBOX_POLL_INTERVAL = env.float("PAYOUT_OUTBOX_POLL_INTERVAL", default=0.5)
+PAYOUT_OUTBOX_RELAY_INTERVAL = env.int("PAYOUT_OUTBOX_RELAY_INTERVAL", default=10)
+
+# Payout archive
+
+PAYOUT_ARCHIVE_INTERVAL = env.int("PAYOUT_ARCHIVE_INTERVAL", default=3600)
+PAYOUT_ARCHIVE_AFTER_DAYS = env.int("PAYOUT_ARCHIVE_AFTER_DAYS", default=30)
+PAYOUT_ARCHIVE_BATCH_SIZE = env.int("PAYOUT_ARCHIVE_BATCH_SIZE", default=1000)
+PAYOUT_ARCHIVE_MAX_BATCHES = env.int("PAYOUT_ARCHIVE_MAX_BATCHES", default=50)
+
+# Payout webhooks
+
+PAYOUT_WEBHOOK_BATCH_SIZE = env.int("PAYOUT_WEBHOOK_BATCH_SIZE", default=1000)
+PAYOUT_WEBHOOK_MAX_BATCHES = env.int("PAYOUT_WEBHOOK_MAX_BATCHES", default=20)
+PAYOUT_WEBHOOK_POLL_INTERVAL = env.float("PAYOUT_WEBHOOK_POLL_INTERVAL", default=0.5)
+PAYOUT_WEBHOOK_DELIVER_INTERVAL = env.int("PAYOUT_WEBHOOK_DELIVER_INTERVAL", default=10)
+PAYOUT_WEBHOOK_TIMEOUT = env.float("PAYOUT_WEBHOOK_TIMEOUT", default=10.0)
+# Аренда взятых в доставку строк: должна быть больше таймаута запроса
+PAYOUT_WEBHOOK_LEASE = env.int("PAYOUT_WEBHOOK_LEASE", default=60)
+PAYOUT_WEBHOOK_MAX_ATTEMPTS = env.int("PAYOUT_WEBHOOK_MAX_ATTEMPTS", default=12)
+PAYOUT_WEBHOOK_BACKOFF_BASE = env.float("PAYOUT_WEBHOOK_BACKOFF_BASE", default=2.0)
+PAYOUT_WEBHOOK_BACKOFF_MAX = env.float("PAYOUT_WEBHOOK_BACKOFF_MAX", default=3600.0)
+PAYOUT_WEBHOOK_MAX_CONNECTIONS = env.int("PAYOUT_WEBHOOK_MAX_CONNECTIONS", default=200)
+PAYOUT_WEBHOOK_ENDPOINTS_TTL = env.int("PAYOUT_WEBHOOK_ENDPOINTS_TTL", default=30)
+
+# Записывается в PeriodicTask при старте beat (DatabaseScheduler), дальше правится в админке
+CELERY_BEAT_SCHEDULE = {
+    'sweep-stuck-payouts': {
+        'task': 'payments.tasks.sweep_stuck_payouts',
+        'schedule': PAYOUT_SWEEP_INTERVAL,
+    },
+    # Страховка на случай, если процесс run_outbox_relay не запущен
+    'relay-payout-outbox': {
+        'task': 'payments.tasks.relay_payout_outbox',
+        'schedule': PAYOUT_OUTBOX_RELAY_INTERVAL,
+    },
+    'archive-finalized-payouts': {
+        'task': 'payments.tasks.archive_finalized_payouts',
+        'schedule': PAYOUT_ARCHIVE_INTERVAL,
+    },
+    # Страховка на случай, если процесс run_webhook_dispatcher не запущен
+    'deliver-payout-webhooks': {
+        'task': 'payments.tasks.deliver_payout_webhooks',
+        'schedule': PAYOUT_WEBHOOK_DELIVER_INTERVAL,
+    },
+}
+
+# Payout queues
+
+PAYOUT_QUEUE_HIGH = env("PAYOUT_QUEUE_HIGH", default='payouts_high')
+PAYOUT_QUEUE_DEFAULT = env("PAYOUT_QUEUE_DEFAULT", default='payouts')
+PAYOUT_QUEUE_LOW = env("PAYOUT_QUEUE_LOW", default='payouts_low')
+# Отдельные полосы для валют, например PAYOUT_CURRENCY_QUEUES=USD=payouts_fx,EUR=payouts_fx
+PAYOUT_CURRENCY_QUEUES = env.dict("PAYOUT_CURRENCY_QUEUES", default={})
+# Сумма, начиная с которой заявка идёт в срочную очередь
+PAYOUT_HIGH_VALUE_AMOUNTS = {
+    'RUB': '1000000',
+    'USD': '10000',
+    'EUR': '10000',
+    'GBP': '10000',
+    'CNY': '70000',
+    'AED': '40000',
+}
+
+# Payment gateway
+
+PAYOUT_GATEWAY_URL = env("PAYOUT_GATEWAY_URL", default='')
+
+if PAYOUT_GATEWAY_URL:
+    PAYOUT_GATEWAY = {
+        'BACKEND': 'payments.gateway.HttpGateway',
+        'OPTIONS': {
+            'base_url': PAYOUT_GATEWAY_URL,
+            'http2': env.bool("PAYOUT_GATEWAY_HTTP2", default=False),
+            'max_connections': env.int("PAYOUT_GATEWAY_MAX_CONNECTIONS", default=100),
+            'max_keepalive_connections': env.int("PAYOUT_GATEWAY_MAX_KEEPALIVE", default=20),
+            'timeouts': {
+                'connect': env.float("PAYOUT_GATEWAY_CONNECT_TIMEOUT", default=2.0),
+                'read': env.float("PAYOUT_GATEWAY_READ_TIMEOUT", default=10.0),
+                'write': 5.0,
+                'pool': 5.0,
+            },
+        },
+    }
+else:
+    PAYOUT_GATEWAY = {
+        'BACKEND': 'payments.gateway.SimulatedGateway',
+        'OPTIONS': {},
+    }
+
+PAYOUT_GATEWAY_CONCURRENCY_INITIAL = env.int("PAYOUT_GATEWAY_CONCURRENCY_INITIAL", default=10)
+PAYOUT_GATEWAY_CONCURRENCY_MIN = env.int("PAYOUT_GATEWAY_CONCURRENCY_MIN", default=1)
+PAYOUT_GATEWAY_CONCURRENCY_MAX = env.int("PAYOUT_GATEWAY_CONCURRENCY_MAX", default=100)
+PAYOUT_GATEWAY_LATENCY_TARGET = env.float("PAYOUT_GATEWAY_LATENCY_TARGET", default=5.0)
+PAYOUT_GATEWAY_ACQUIRE_TIMEOUT = env.float("PAYOUT_GATEWAY_ACQUIRE_TIMEOUT", default=20.0)
+PAYOUT_GATEWAY_CIRCUIT_FAILURES = env.int("PAYOUT_GATEWAY_CIRCUIT_FAILURES", default=5)
+PAYOUT_GATEWAY_CIRCUIT_RESET_TIMEOUT = env.float("PAYOUT_GATEWAY_CIRCUIT_RESET_TIMEOUT", default=30.0)
 
 # Admin
 
@@ -219,5 +391,6 @@ if 'test' in sys.argv:
     LOGGING['loggers']['payments']['level'] = 'CRITICAL'
     CELERY_TASK_ALWAYS_EAGER = True
     CELERY_TASK_EAGER_PROPAGATES = True
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
     if '--keepdb' not in sys.argv:
         sys.argv.append('--keepdb')
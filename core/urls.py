@@ -3,9 +3,12 @@ from django.urls import path, include
 from django.views.generic import RedirectView
 from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView
 
+from payments.metrics import metrics_view
+
 urlpatterns = [
     path('', RedirectView.as_view(url='/api/v1/docs/', permanent=False)),
     path('admin/', admin.site.urls),
+    path('metrics', metrics_view, name='prometheus-metrics'),
     
     # API v1
     path('api/v1/', include('payments.urls')),
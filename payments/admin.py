@@ -1,3 +1,87 @@
 from django.contrib import admin
+from django.utils import timezone
 
-# Register your models here.
+from . import transitions
+from .models import PayoutRequest, PayoutStatusEvent, WebhookDelivery, WebhookEndpoint
+
+
+@admin.register(PayoutRequest)
+class PayoutRequestAdmin(admin.ModelAdmin):
+    """
+    Просмотр заявок и массовая смена статуса.
+
+    Статус меняется только действиями (payments.transitions): они проверяют
+    допустимые переходы и обновляют статистику, кэш, события и вебхуки.
+    Редактирование и удаление из админки отключены по той же причине.
+    """
+    list_display = ('external_id', 'amount', 'currency', 'status', 'priority', 'created_at', 'updated_at')
+    list_filter = ('status', 'currency', 'priority')
+    search_fields = ('external_id',)
+    date_hierarchy = 'created_at'
+    show_full_result_count = False
+    actions = ('cancel_payouts', 'fail_payouts')
+
+    def get_readonly_fields(self, request, obj=None):
+        return [field.name for field in self.model._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    @admin.action(description='Отменить выбранные заявки')
+    def cancel_payouts(self, request, queryset):
+        self.transition(request, queryset, PayoutRequest.Status.CANCELLED)
+
+    @admin.action(description='Перевести выбранные заявки в «Ошибка»')
+    def fail_payouts(self, request, queryset):
+        self.transition(request, queryset, PayoutRequest.Status.FAILED)
+
+    def transition(self, request, queryset, to_status: str) -> None:
+        result = transitions.bulk_transition(queryset, to_status)
+        self.message_user(
+            request,
+            f'Статус «{PayoutRequest.Status(to_status).label}»: изменено {sum(result["updated"].values())} '
+            f'{result["updated"]}, пропущено {sum(result["skipped"].values())} {result["skipped"]}'
+        )
+
+
+@admin.register(PayoutStatusEvent)
+class PayoutStatusEventAdmin(admin.ModelAdmin):
+    """Просмотр журнала переходов статуса (только чтение)."""
+    list_display = ('external_id', 'from_status', 'to_status', 'currency', 'duration', 'created_at')
+    list_filter = ('to_status', 'from_status', 'currency')
+    search_fields = ('external_id',)
+    date_hierarchy = 'created_at'
+    show_full_result_count = False
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(WebhookEndpoint)
+class WebhookEndpointAdmin(admin.ModelAdmin):
+    list_display = ('url', 'statuses', 'is_active', 'max_concurrency', 'max_batch_size', 'created_at')
+    list_filter = ('is_active',)
+    search_fields = ('url',)
+
+
+@admin.register(WebhookDelivery)
+class WebhookDeliveryAdmin(admin.ModelAdmin):
+    list_display = ('id', 'endpoint', 'state', 'attempts', 'next_attempt_at', 'last_error')
+    list_filter = ('state', 'endpoint')
+    list_select_related = ('endpoint',)
+    readonly_fields = ('endpoint', 'payload', 'attempts', 'last_error', 'created_at')
+    actions = ('retry_now',)
+
+    @admin.action(description='Повторить доставку сейчас')
+    def retry_now(self, request, queryset):
+        updated = queryset.update(state=WebhookDelivery.State.PENDING, attempts=0, next_attempt_at=timezone.now())
+        self.message_user(request, f'Поставлено в доставку: {updated}')
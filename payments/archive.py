@@ -0,0 +1,80 @@
+"""
+Перенос финальных заявок из рабочей таблицы в архив.
+
+Рабочая таблица PayoutRequest остаётся небольшой: в ней только активные
+заявки и недавно завершённые. Список, выгрузка и получение заявки читают
+обе таблицы (см. PayoutRequestViewSet).
+"""
+import logging
+
+from datetime import timedelta
+from typing import Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import PayoutRequest, PayoutRequestArchive
+
+logger = logging.getLogger(__name__)
+
+ARCHIVED_FIELDS = [
+    field.attname for field in PayoutRequest._meta.concrete_fields
+]
+
+
+def archive_finalized_payouts(
+    older_than: Optional[timedelta] = None,
+    batch_size: Optional[int] = None,
+    max_batches: Optional[int] = None,
+) -> int:
+    """
+    Перенос финальных заявок, не менявшихся дольше older_than, в архив.
+
+    Каждая пачка переносится в своей транзакции (INSERT в архив + DELETE из
+    рабочей таблицы) с SELECT ... FOR UPDATE SKIP LOCKED: строки, которые
+    сейчас кто-то держит, будут перенесены в следующий раз. Агрегат
+    payments.stats не меняется — заявки никуда не исчезают.
+
+    Args:
+        older_than: Возраст с последнего изменения (по умолчанию PAYOUT_ARCHIVE_AFTER_DAYS)
+        batch_size: Заявок в пачке (по умолчанию PAYOUT_ARCHIVE_BATCH_SIZE)
+        max_batches: Максимум пачек за запуск (по умолчанию PAYOUT_ARCHIVE_MAX_BATCHES)
+
+    Returns:
+        Количество перенесённых заявок
+    """
+    if older_than is None:
+        older_than = timedelta(days=settings.PAYOUT_ARCHIVE_AFTER_DAYS)
+    batch_size = batch_size or settings.PAYOUT_ARCHIVE_BATCH_SIZE
+    max_batches = max_batches or settings.PAYOUT_ARCHIVE_MAX_BATCHES
+    cutoff = timezone.now() - older_than
+
+    archived = 0
+    for _ in range(max_batches):
+        count = _archive_batch(cutoff, batch_size)
+        archived += count
+        if count < batch_size:
+            break
+
+    if archived:
+        logger.info(f'[Archive] В архив перенесено заявок: {archived}')
+    return archived
+
+
+@transaction.atomic
+def _archive_batch(cutoff, batch_size: int) -> int:
+    rows = list(
+        PayoutRequest.objects.select_for_update(skip_locked=True)
+        .filter(status__in=PayoutRequest.FINAL_STATUSES, updated_at__lt=cutoff)
+        .order_by('updated_at')
+        .values(*ARCHIVED_FIELDS)[:batch_size]
+    )
+    if not rows:
+        return 0
+
+    PayoutRequestArchive.objects.bulk_create(
+        [PayoutRequestArchive(**row) for row in rows]
+    )
+    PayoutRequest.objects.filter(pk__in=[row['id'] for row in rows]).delete()
+    return len(rows)
@@ -0,0 +1,278 @@
+"""
+Async-версии read-маршрутов PayoutRequestViewSet для ASGI.
+
+Под uvicorn (или gunicorn с UvicornWorker) GET списка, заявки, статуса и
+SSE-поток статуса выполняются корутинами на async ORM: ожидание БД, кэша и long polling
+статуса не занимает поток. Фильтры, scope, сортировку и курсор строит сам
+PayoutRequestViewSet (без запросов к БД), ответ рендерит JSONRenderer DRF.
+Аутентификация, права и ответы на ошибки — тоже viewset'а (authentication_classes,
+permission_classes, handle_exception), поэтому JSON и статусы совпадают с sync-версией.
+Остальные методы тех же URL передаются в sync viewset (см. async_read_routes).
+"""
+import asyncio
+import functools
+import time
+
+from typing import Optional
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist, ValidationError as DjangoValidationError
+from django.db import connections
+from django.http import Http404, StreamingHttpResponse
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.response import Response
+
+from . import payout_cache
+from .events import format_event, get_status_hub
+from .metrics import API_REQUEST_SECONDS, PAYOUT_EVENT_STREAMS
+from .models import PayoutRequestArchive
+from .serializers import PayoutRequestFastSerializer
+from .views import PayoutRequestViewSet
+
+READ_METHODS = ('GET', 'HEAD')
+
+
+def init_viewset(request, action: str, args, kwargs) -> PayoutRequestViewSet:
+    """Экземпляр viewset'а и Request DRF с его authentication_classes."""
+    viewset = PayoutRequestViewSet(args=args, kwargs=kwargs, format_kwarg=None, action=action)
+    drf_request = Request(request, authenticators=viewset.get_authenticators())
+    drf_request.accepted_renderer = JSONRenderer()
+    drf_request.accepted_media_type = JSONRenderer.media_type
+    viewset.request = drf_request
+    return viewset
+
+
+def render(data, status_code: int = 200, headers: Optional[dict] = None) -> Response:
+    """Отрендеренный Response DRF с JSONRenderer, как у viewset'а."""
+    response = Response(data, status=status_code, headers=headers)
+    response.accepted_renderer = JSONRenderer()
+    response.accepted_media_type = JSONRenderer.media_type
+    response.renderer_context = {}
+    return response.render()
+
+
+def handle_exception(exc: Exception, viewset: PayoutRequestViewSet) -> Response:
+    """Ответ на исключение через handle_exception viewset'а (exception_handler DRF)."""
+    response = viewset.handle_exception(exc)
+    headers = {name: value for name, value in response.items() if name != 'Content-Type'}
+    return render(response.data, response.status_code, headers)
+
+
+async def check_permissions(viewset: PayoutRequestViewSet) -> None:
+    """
+    Аутентификация, права и throttling, как в PayoutRequestViewSet.initial.
+
+    Схемы authentication_classes синхронны (сессия из БД, хэширование пароля
+    Basic), поэтому проверки выполняются в потоке.
+    """
+    request = viewset.request
+
+    def check():
+        viewset.perform_authentication(request)
+        viewset.check_permissions(request)
+        viewset.check_throttles(request)
+
+    await sync_to_async(check)()
+
+
+def async_action(action: str):
+    """
+    Декоратор async-обработчика: аутентификация, права, ошибки и метрика
+    API_REQUEST_SECONDS как у PayoutRequestViewSet. Обработчик получает
+    экземпляр viewset'а (для фильтров и пагинации) и возвращает данные ответа.
+    """
+    def decorator(handler):
+        @functools.wraps(handler)
+        async def view(request, *args, **kwargs):
+            started_at = time.perf_counter()
+            viewset = init_viewset(request, action, args, kwargs)
+            try:
+                await check_permissions(viewset)
+                response = render(await handler(viewset, viewset.request))
+            except Exception as exc:
+                response = handle_exception(exc, viewset)
+
+            API_REQUEST_SECONDS.labels(
+                action=action,
+                method=request.method,
+                status_code=response.status_code,
+            ).observe(time.perf_counter() - started_at)
+            return response
+        return view
+    return decorator
+
+
+async def aload_payout(viewset: PayoutRequestViewSet, lookup_value) -> Optional[dict]:
+    """Async-версия PayoutRequestViewSet.load_payout: рабочая таблица, затем архив."""
+    for queryset in (viewset.get_queryset(), PayoutRequestArchive.objects.all()):
+        queryset = viewset.filter_queryset(queryset).values(*PayoutRequestFastSerializer.value_fields)
+        try:
+            row = await queryset.aget(**{viewset.lookup_field: lookup_value})
+        except (ObjectDoesNotExist, DjangoValidationError, TypeError, ValueError):
+            continue
+        return PayoutRequestFastSerializer.to_representation(row)
+    return None
+
+
+def get_lookup_value(viewset: PayoutRequestViewSet):
+    return viewset.kwargs[viewset.lookup_url_kwarg or viewset.lookup_field]
+
+
+@async_action('list')
+async def payout_list(viewset: PayoutRequestViewSet, request: Request):
+    """Список заявок: курсорная пагинация по рабочей таблице и архиву."""
+    querysets = [
+        queryset.values(*PayoutRequestFastSerializer.value_fields)
+        for queryset in viewset.get_scoped_querysets()
+    ]
+    paginator = viewset.paginator
+    page = await paginator.apaginate_queryset(querysets, request, view=viewset)
+    return paginator.get_paginated_response(PayoutRequestFastSerializer.serialize(page)).data
+
+
+@async_action('retrieve')
+async def payout_detail(viewset: PayoutRequestViewSet, request: Request):
+    """Заявка по external_id (через кэш заявок, если нет фильтров в query string)."""
+    lookup_value = get_lookup_value(viewset)
+    if request.query_params:
+        data = await aload_payout(viewset, lookup_value)
+    else:
+        data = await payout_cache.aget_payout(lookup_value, lambda: aload_payout(viewset, lookup_value))
+    if data is None:
+        raise Http404
+    return data
+
+
+@async_action('payout_status')
+async def payout_status(viewset: PayoutRequestViewSet, request: Request):
+    """
+    Статус заявки с long polling: пока статус равен since, ожидание события
+    смены статуса (payments.events), но не дольше wait. Без событий статус
+    перечитывается из кэша заявок раз в PAYOUT_STATUS_POLL_INTERVAL секунд.
+    """
+    lookup_value = get_lookup_value(viewset)
+    since, wait = viewset.get_status_wait()
+    deadline = time.monotonic() + wait
+    hub = queue = None
+    if since is not None and wait > 0:
+        hub = get_status_hub()
+        queue = await hub.subscribe(lookup_value)
+
+    try:
+        data = await aread_status(viewset, lookup_value)
+        while True:
+            if data is None:
+                raise Http404
+            remaining = deadline - time.monotonic()
+            if data['status'] != since or remaining <= 0:
+                return data
+            try:
+                data = await asyncio.wait_for(queue.get(), min(settings.PAYOUT_STATUS_POLL_INTERVAL, remaining))
+            except asyncio.TimeoutError:
+                data = await aread_status(viewset, lookup_value)
+    finally:
+        if hub is not None:
+            hub.unsubscribe(lookup_value, queue)
+
+
+async def aread_status(viewset: PayoutRequestViewSet, lookup_value) -> Optional[dict]:
+    """Текущий статус заявки из кэша заявок (None, если заявки нет)."""
+    data = await payout_cache.aget_payout(lookup_value, lambda: aload_payout(viewset, lookup_value))
+    return None if data is None else PayoutRequestFastSerializer.status_representation(data)
+
+
+async def payout_events(request, *args, **kwargs):
+    """
+    SSE-поток статуса заявки: текущий статус, затем каждое изменение.
+
+    Поток закрывается на финальном статусе или через PAYOUT_EVENTS_MAX_DURATION
+    (EventSource переподключится сам). Раз в PAYOUT_EVENTS_KEEPALIVE без
+    событий отправляется комментарий-keepalive и статус перечитывается.
+    """
+    viewset = init_viewset(request, 'payout_events', args, kwargs)
+    hub = queue = None
+    try:
+        await check_permissions(viewset)
+        lookup_value = get_lookup_value(viewset)
+        # Подписка до чтения статуса: изменение между ними не потеряется
+        hub = get_status_hub()
+        queue = await hub.subscribe(lookup_value)
+        data = await aread_status(viewset, lookup_value)
+        if data is None:
+            raise Http404
+    except Exception as exc:
+        if hub is not None:
+            hub.unsubscribe(lookup_value, queue)
+        return handle_exception(exc, viewset)
+
+    response = StreamingHttpResponse(
+        stream_status(viewset, lookup_value, hub, queue, data),
+        content_type='text/event-stream',
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+async def stream_status(viewset, lookup_value, hub, queue, data: dict):
+    """Генератор событий SSE для payout_events."""
+    PAYOUT_EVENT_STREAMS.inc()
+    deadline = time.monotonic() + settings.PAYOUT_EVENTS_MAX_DURATION
+    last = None
+    try:
+        while True:
+            # События могут прийти не по порядку относительно прочитанного статуса
+            if data is not None and (last is None or data['updated_at'] > last['updated_at']):
+                yield format_event(data)
+                last = data
+                if data['is_final']:
+                    return
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            try:
+                data = await asyncio.wait_for(queue.get(), min(settings.PAYOUT_EVENTS_KEEPALIVE, remaining))
+            except asyncio.TimeoutError:
+                yield ': keepalive\n\n'
+                data = await aread_status(viewset, lookup_value)
+                if data is None:
+                    return
+    finally:
+        hub.unsubscribe(lookup_value, queue)
+        PAYOUT_EVENT_STREAMS.dec()
+
+
+def async_read_route(async_view, sync_view):
+    """
+    URL-callback: GET/HEAD — async_view, остальные методы — sync view DRF.
+
+    Атрибуты sync view (cls, actions, csrf_exempt) копируются, поэтому схема
+    drf-spectacular и CSRF-поведение маршрута не меняются.
+    """
+    async def view(request, *args, **kwargs):
+        if request.method in READ_METHODS:
+            return await async_view(request, *args, **kwargs)
+        return await sync_to_async(sync_view)(request, *args, **kwargs)
+
+    functools.update_wrapper(view, sync_view)
+    return view
+
+
+def async_read_routes(patterns, async_views: dict) -> None:
+    """
+    Замена callback'ов маршрутов роутера по имени на async_read_route.
+
+    С ATOMIC_REQUESTS Django не может обернуть async view в транзакцию,
+    поэтому маршруты остаются sync viewset'ом целиком.
+
+    Args:
+        patterns: URL-паттерны роутера DRF
+        async_views: {имя маршрута: async view}
+    """
+    if any(db.get('ATOMIC_REQUESTS') for db in connections.settings.values()):
+        return
+    for pattern in patterns:
+        if getattr(pattern, 'name', None) in async_views:
+            pattern.callback = async_read_route(async_views[pattern.name], pattern.callback)
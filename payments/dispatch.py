@@ -0,0 +1,32 @@
+import logging
+
+from typing import Iterable
+
+from .models import PayoutOutbox, PayoutRequest
+from .routing import payout_queue
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_payouts(payouts: Iterable[PayoutRequest]) -> int:
+    """
+    Постановка заявок в очередь через outbox.
+    
+    Для каждой заявки в текущей транзакции пишется строка PayoutOutbox с очередью
+    её полосы (см. routing.queue_for). В брокер строки публикует relay
+    (payments.outbox) пачками задач process_payouts_batch — после коммита и
+    даже если процесс упадёт сразу после него.
+    
+    Args:
+        payouts: Созданные или повторно отправляемые заявки
+        
+    Returns:
+        Количество записанных сообщений
+    """
+    messages = PayoutOutbox.objects.bulk_create([
+        PayoutOutbox(external_id=payout.external_id, queue=payout_queue(payout))
+        for payout in payouts
+    ])
+    if messages:
+        logger.debug(f'[Dispatch] {len(messages)} заявок записано в outbox')
+    return len(messages)
@@ -0,0 +1,290 @@
+"""
+События смены статуса заявок через Redis pub/sub.
+
+Публикация: каждый переход статуса (PayoutService.transition, sweeper, PATCH)
+после коммита ставит события в очередь EventPublisher, а PUBLISH в канал
+PAYOUT_EVENTS_CHANNEL выполняет фоновый поток процесса с коротким таймаутом.
+Запрос и задача не ждут Redis. Доставка best-effort: потребители (SSE и long
+polling в payments.async_views) при отсутствии событий периодически
+перечитывают статус сами, поэтому при недоступном Redis события
+отбрасываются (не чаще одной попытки подключения за
+PAYOUT_EVENTS_RETRY_INTERVAL).
+
+Подписка: на каждый event loop (процесс uvicorn) — одна подписка Redis
+(StatusHub), события раздаются по asyncio.Queue открытых соединений.
+Тысячи клиентов не требуют ни потока, ни соединения с Redis на клиента.
+"""
+import asyncio
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import weakref
+
+from collections import defaultdict
+from typing import Iterable, Optional
+
+import redis
+import redis.asyncio
+
+from django.conf import settings
+from django.db import transaction
+from rest_framework.renderers import BaseRenderer
+
+from .metrics import PAYOUT_EVENTS_DROPPED, PAYOUT_EVENTS_PUBLISHED
+from .serializers import PayoutRequestFastSerializer
+
+logger = logging.getLogger(__name__)
+
+_publisher: Optional[redis.Redis] = None
+
+
+def _get_publisher() -> redis.Redis:
+    global _publisher
+    if _publisher is None:
+        timeout = settings.PAYOUT_EVENTS_PUBLISH_TIMEOUT
+        _publisher = redis.Redis.from_url(
+            settings.PAYOUT_EVENTS_REDIS_URL,
+            socket_connect_timeout=timeout,
+            socket_timeout=timeout,
+        )
+    return _publisher
+
+
+class EventPublisher:
+    """
+    Фоновая публикация событий статуса.
+
+    submit только кладёт события в ограниченную очередь; поток-демон забирает
+    всё накопленное и отправляет одним pipeline. После ошибки Redis события
+    отбрасываются до истечения retry_interval, а предупреждение пишется один
+    раз на серию ошибок.
+
+    Args:
+        queue_size: Максимум пачек событий в очереди
+        retry_interval: Пауза после ошибки Redis, секунды
+    """
+
+    def __init__(self, queue_size: int, retry_interval: float):
+        self.queue_size = queue_size
+        self.retry_interval = retry_interval
+        self._lock = threading.Lock()
+        self._pid: Optional[int] = None
+        self._queue: Optional[queue.Queue] = None
+        self._retry_at = 0.0
+        self._failing = False
+
+    @classmethod
+    def from_settings(cls) -> 'EventPublisher':
+        return cls(
+            queue_size=settings.PAYOUT_EVENTS_PUBLISH_QUEUE_SIZE,
+            retry_interval=settings.PAYOUT_EVENTS_RETRY_INTERVAL,
+        )
+
+    def submit(self, events: list[str]) -> None:
+        """Постановка событий в очередь публикации (не блокирует)."""
+        try:
+            self._get_queue().put_nowait(events)
+        except queue.Full:
+            PAYOUT_EVENTS_DROPPED.inc(len(events))
+            logger.warning(f'[Events] Очередь публикации переполнена, отброшено событий: {len(events)}')
+
+    def flush(self) -> None:
+        """Ожидание публикации всех поставленных событий."""
+        self._get_queue().join()
+
+    def _get_queue(self) -> queue.Queue:
+        # После fork (prefork Celery) поток родителя в процессе не существует
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._queue = queue.Queue(maxsize=self.queue_size)
+                threading.Thread(target=self._run, args=(self._queue,), name='payout-events', daemon=True).start()
+            return self._queue
+
+    def _run(self, pending: queue.Queue) -> None:
+        while True:
+            batches = [pending.get()]
+            while True:
+                try:
+                    batches.append(pending.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self.send([event for events in batches for event in events])
+            except Exception as exc:
+                logger.error(f'[Events] Ошибка публикации событий: {exc}')
+            finally:
+                for _ in batches:
+                    pending.task_done()
+
+    def send(self, events: list[str]) -> None:
+        """PUBLISH событий одним pipeline."""
+        if time.monotonic() < self._retry_at:
+            PAYOUT_EVENTS_DROPPED.inc(len(events))
+            return
+        try:
+            with _get_publisher().pipeline(transaction=False) as pipe:
+                for event in events:
+                    pipe.publish(settings.PAYOUT_EVENTS_CHANNEL, event)
+                pipe.execute()
+        except redis.RedisError as exc:
+            self._retry_at = time.monotonic() + self.retry_interval
+            PAYOUT_EVENTS_DROPPED.inc(len(events))
+            if not self._failing:
+                self._failing = True
+                logger.warning(f'[Events] Redis недоступен, события не публикуются: {exc}')
+            return
+        if self._failing:
+            self._failing = False
+            logger.info('[Events] Публикация событий восстановлена')
+        PAYOUT_EVENTS_PUBLISHED.inc(len(events))
+
+
+_event_publisher: Optional[EventPublisher] = None
+
+
+def get_event_publisher() -> EventPublisher:
+    """Фоновый публикатор событий процесса (создаётся при первом обращении)."""
+    global _event_publisher
+    if _event_publisher is None:
+        _event_publisher = EventPublisher.from_settings()
+    return _event_publisher
+
+
+def publish_status(payouts: Iterable) -> None:
+    """
+    Публикация нового статуса заявок после коммита текущей транзакции.
+
+    Args:
+        payouts: Заявки (или строки) с external_id, status и updated_at
+    """
+    events = [
+        json.dumps(PayoutRequestFastSerializer.status_event(
+            payout.external_id, payout.status, payout.updated_at
+        ))
+        for payout in payouts
+    ]
+    if not events:
+        return
+
+    transaction.on_commit(lambda: get_event_publisher().submit(events))
+
+
+def format_event(data: dict) -> str:
+    """Событие SSE со статусом заявки."""
+    payload = json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+    return f'event: status\ndata: {payload}\n\n'
+
+
+class EventStreamRenderer(BaseRenderer):
+    """Renderer text/event-stream: строки передаются как есть, ошибки — JSON-событием."""
+    media_type = 'text/event-stream'
+    format = 'sse'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, str):
+            return data.encode(self.charset)
+        return json.dumps(data, ensure_ascii=False).encode(self.charset)
+
+
+class StatusHub:
+    """
+    Раздача событий статуса по подписчикам внутри одного event loop.
+
+    Подписка на Redis открывается с первым подписчиком и закрывается с
+    последним. Очередь клиента ограничена: медленный клиент теряет старые
+    события, но не тормозит остальных (ему важен только последний статус).
+    """
+
+    def __init__(self, url: str, channel: str, queue_size: int, reconnect_delay: float = 1.0):
+        self.url = url
+        self.channel = channel
+        self.queue_size = queue_size
+        self.reconnect_delay = reconnect_delay
+        self._subscribers = defaultdict(set)
+        self._listener: Optional[asyncio.Task] = None
+        self._ready = asyncio.Event()
+
+    @classmethod
+    def from_settings(cls) -> 'StatusHub':
+        return cls(
+            url=settings.PAYOUT_EVENTS_REDIS_URL,
+            channel=settings.PAYOUT_EVENTS_CHANNEL,
+            queue_size=settings.PAYOUT_EVENTS_QUEUE_SIZE,
+        )
+
+    @property
+    def subscriber_count(self) -> int:
+        return sum(len(queues) for queues in self._subscribers.values())
+
+    async def subscribe(self, external_id: str, ready_timeout: float = 1.0) -> asyncio.Queue:
+        """
+        Очередь событий заявки.
+
+        Ждёт подтверждения подписки Redis (не дольше ready_timeout), чтобы
+        статус, прочитанный после subscribe, не разошёлся с потоком событий.
+        """
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers[str(external_id)].add(queue)
+        if self._listener is None or self._listener.done():
+            self._ready.clear()
+            self._listener = asyncio.create_task(self._listen())
+        try:
+            await asyncio.wait_for(self._ready.wait(), ready_timeout)
+        except asyncio.TimeoutError:
+            logger.warning('[Events] Подписка Redis не готова, статус будет перечитываться')
+        return queue
+
+    def unsubscribe(self, external_id: str, queue: asyncio.Queue) -> None:
+        queues = self._subscribers.get(str(external_id))
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self._subscribers[str(external_id)]
+        if not self._subscribers and self._listener is not None:
+            self._listener.cancel()
+            self._listener = None
+
+    def dispatch(self, event: dict) -> None:
+        """Передача события в очереди подписчиков заявки."""
+        for queue in list(self._subscribers.get(event.get('external_id'), ())):
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(event)
+
+    async def _listen(self) -> None:
+        while True:
+            client = redis.asyncio.Redis.from_url(self.url)
+            try:
+                async with client.pubsub() as pubsub:
+                    await pubsub.subscribe(self.channel)
+                    self._ready.set()
+                    async for message in pubsub.listen():
+                        if message['type'] != 'message':
+                            continue
+                        try:
+                            self.dispatch(json.loads(message['data']))
+                        except (TypeError, ValueError) as exc:
+                            logger.warning(f'[Events] Некорректное событие: {exc}')
+            except redis.RedisError as exc:
+                self._ready.clear()
+                logger.warning(f'[Events] Подписка Redis прервана: {exc}')
+                await asyncio.sleep(self.reconnect_delay)
+            finally:
+                await client.aclose()
+
+
+_hubs: 'weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, StatusHub]' = weakref.WeakKeyDictionary()
+
+
+def get_status_hub() -> StatusHub:
+    """StatusHub текущего event loop (создаётся при первом обращении)."""
+    loop = asyncio.get_running_loop()
+    hub = _hubs.get(loop)
+    if hub is None:
+        hub = _hubs[loop] = StatusHub.from_settings()
+    return hub
@@ -0,0 +1,83 @@
+import csv
+import heapq
+import json
+
+from operator import itemgetter
+from typing import Iterable, Iterator
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework.utils.encoders import JSONEncoder
+
+from .serializers import PayoutRequestFastSerializer
+
+EXPORT_FIELDS = PayoutRequestFastSerializer.fields
+
+
+class _Echo:
+    """Псевдо-буфер для csv.writer: возвращает строку вместо записи."""
+
+    def write(self, value):
+        return value
+
+
+def iter_export_rows(*querysets) -> Iterator[dict]:
+    """
+    Построчная выгрузка заявок через server-side cursor.
+
+    Строки читаются через values().iterator(chunk_size), поэтому в памяти
+    держится только текущая пачка. Формат строки совпадает с PayoutRequestSerializer.
+    Несколько querysets (рабочая таблица и архив) сливаются потоково в порядке
+    сортировки первого из них.
+
+    Args:
+        querysets: Отфильтрованные и отсортированные querysets заявок
+
+    Yields:
+        dict с полями EXPORT_FIELDS
+    """
+    tz = timezone.get_current_timezone()
+    chunk_size = settings.PAYOUT_EXPORT_CHUNK_SIZE
+    fields = PayoutRequestFastSerializer.value_fields
+
+    if len(querysets) == 1:
+        rows = querysets[0].values(*fields).iterator(chunk_size=chunk_size)
+    else:
+        ordering = querysets[0].query.order_by or querysets[0].model._meta.ordering
+        field = ordering[0].lstrip('-')
+        descending = ordering[0].startswith('-')
+        prefix = '-' if descending else ''
+        rows = heapq.merge(
+            *(
+                queryset.order_by(f'{prefix}{field}', f'{prefix}id').values(*fields)
+                .iterator(chunk_size=chunk_size)
+                for queryset in querysets
+            ),
+            key=itemgetter(field, 'id'),
+            reverse=descending,
+        )
+    for row in rows:
+        yield PayoutRequestFastSerializer.to_representation(row, tz)
+
+
+def iter_ndjson(rows: Iterable[dict]) -> Iterator[str]:
+    """Одна JSON-строка на заявку."""
+    for row in rows:
+        yield json.dumps(row, cls=JSONEncoder, ensure_ascii=False) + '\n'
+
+
+def iter_csv(rows: Iterable[dict]) -> Iterator[str]:
+    """CSV с заголовком; реквизиты получателя сериализуются в JSON."""
+    writer = csv.writer(_Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for row in rows:
+        row['recipient_details'] = json.dumps(
+            row['recipient_details'], cls=JSONEncoder, ensure_ascii=False
+        )
+        yield writer.writerow([row[field] for field in EXPORT_FIELDS])
+
+
+EXPORT_FORMATS = {
+    'ndjson': (iter_ndjson, 'application/x-ndjson; charset=utf-8'),
+    'csv': (iter_csv, 'text/csv; charset=utf-8'),
+}
@@ -0,0 +1,28 @@
+import factory
+
+from faker import Faker
+
+from .models import PayoutRequest
+
+fake = Faker('ru_RU')
+
+
+def _recipient_details() -> dict:
+    recipient_type = fake.random_element(['card', 'account', 'wallet'])
+    if recipient_type == 'card':
+        return {'type': 'card', 'number': fake.credit_card_number(), 'holder': fake.name()}
+    if recipient_type == 'account':
+        return {'type': 'account', 'account': fake.checking_account(), 'bik': fake.bic()}
+    return {'type': 'wallet', 'wallet_id': fake.uuid4()}
+
+
+class PayoutRequestFactory(factory.django.DjangoModelFactory):
+    """Фабрика заявок на выплату для тестов и бенчмарков."""
+
+    class Meta:
+        model = PayoutRequest
+
+    amount = factory.Faker('pydecimal', left_digits=6, right_digits=2, min_value=1, max_value=500000)
+    currency = factory.Iterator(PayoutRequest.Currency.values)
+    recipient_details = factory.LazyFunction(_recipient_details)
+    description = factory.Faker('sentence', locale='ru_RU')
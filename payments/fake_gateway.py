@@ -0,0 +1,125 @@
+"""
+Локальный stand-in платёжного шлюза для тестов и бенчмарков.
+
+HTTP/1.1 сервер с keep-alive, настраиваемой задержкой и долями отказов.
+Считает принятые соединения и запросы, чтобы можно было проверить
+переиспользование соединений клиентом.
+"""
+import json
+import random
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+
+class _GatewayHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server: '_GatewayHTTPServer'
+
+    def setup(self):
+        super().setup()
+        self.server.stand_in.count('connections')
+
+    def do_POST(self):
+        stand_in = self.server.stand_in
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length)
+        stand_in.count('requests')
+
+        if self.path != '/payouts':
+            return self.respond(404, {'message': 'not found'})
+        try:
+            json.loads(body or b'{}')
+        except ValueError:
+            return self.respond(400, {'message': 'invalid json'})
+
+        delay = stand_in.latency + random.uniform(0, stand_in.latency_jitter)
+        if delay:
+            time.sleep(delay)
+
+        roll = random.random()
+        if roll < stand_in.error_rate:
+            return self.respond(503, {'message': 'gateway unavailable'})
+        if roll < stand_in.error_rate + stand_in.decline_rate:
+            return self.respond(200, {'status': 'declined', 'message': 'Недостаточно средств'})
+        return self.respond(200, {'status': 'completed', 'message': 'Платёж успешно проведён'})
+
+    def respond(self, status: int, data: dict):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _GatewayHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    stand_in: 'FakeGatewayServer'
+
+
+class FakeGatewayServer:
+    """
+    Stand-in шлюза, совместимый с HttpGateway.
+
+    Args:
+        host: Адрес
+        port: Порт (0 — выбрать свободный)
+        latency: Задержка ответа, секунды
+        latency_jitter: Случайная добавка к задержке, секунды
+        error_rate: Доля ответов 503
+        decline_rate: Доля отклонённых платежей
+    """
+
+    def __init__(
+        self,
+        host: str = '127.0.0.1',
+        port: int = 0,
+        latency: float = 0.0,
+        latency_jitter: float = 0.0,
+        error_rate: float = 0.0,
+        decline_rate: float = 0.0,
+    ):
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.error_rate = error_rate
+        self.decline_rate = decline_rate
+        self.stats = {'connections': 0, 'requests': 0}
+        self._lock = threading.Lock()
+        self._httpd = _GatewayHTTPServer((host, port), _GatewayHandler)
+        self._httpd.stand_in = self
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def count(self, name: str) -> None:
+        with self._lock:
+            self.stats[name] += 1
+
+    def start(self) -> 'FakeGatewayServer':
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self) -> None:
+        self._httpd.serve_forever()
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
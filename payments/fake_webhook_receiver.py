@@ -0,0 +1,177 @@
+"""
+Локальный stand-in получателя вебхуков для тестов и бенчмарков.
+
+HTTP/1.1 сервер с keep-alive, настраиваемой задержкой и долей отказов.
+Проверяет подпись, запоминает принятые события и считает одновременные
+запросы, чтобы можно было проверить лимит параллельности на endpoint.
+"""
+import hashlib
+import hmac
+import json
+import random
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+
+class _ReceiverHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server: '_ReceiverHTTPServer'
+
+    def setup(self):
+        super().setup()
+        self.server.stand_in.count('connections')
+
+    def do_POST(self):
+        stand_in = self.server.stand_in
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length)
+        stand_in.enter()
+        try:
+            self.handle_events(stand_in, body)
+        finally:
+            stand_in.leave()
+
+    def handle_events(self, stand_in: 'FakeWebhookReceiver', body: bytes):
+        if stand_in.secret is not None:
+            timestamp = self.headers.get('X-Payout-Timestamp', '')
+            expected = 'sha256=' + hmac.new(
+                stand_in.secret.encode(), f'{timestamp}.'.encode() + body, hashlib.sha256
+            ).hexdigest()
+            if not hmac.compare_digest(expected, self.headers.get('X-Payout-Signature', '')):
+                stand_in.count('bad_signatures')
+                return self.respond(401)
+        try:
+            events = json.loads(body)['events']
+        except (ValueError, KeyError, TypeError):
+            return self.respond(400)
+
+        delay = stand_in.latency + random.uniform(0, stand_in.latency_jitter)
+        if delay:
+            time.sleep(delay)
+
+        if stand_in.take_failure() or random.random() < stand_in.error_rate:
+            headers = {'Retry-After': str(stand_in.retry_after)} if stand_in.retry_after is not None else {}
+            return self.respond(503, headers)
+        stand_in.record(events)
+        self.respond(204)
+
+    def respond(self, status: int, headers: Optional[dict] = None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _ReceiverHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    stand_in: 'FakeWebhookReceiver'
+
+
+class FakeWebhookReceiver:
+    """
+    Stand-in получателя вебхуков, совместимый с payments.webhooks.
+
+    Args:
+        host: Адрес
+        port: Порт (0 — выбрать свободный)
+        secret: Секрет endpoint'а (None — подпись не проверяется)
+        latency: Задержка ответа, секунды
+        latency_jitter: Случайная добавка к задержке, секунды
+        error_rate: Доля ответов 503
+        fail_first: Сколько первых запросов отклонить ответом 503
+        retry_after: Значение Retry-After в ответах 503, секунды
+    """
+
+    def __init__(
+        self,
+        host: str = '127.0.0.1',
+        port: int = 0,
+        secret: Optional[str] = None,
+        latency: float = 0.0,
+        latency_jitter: float = 0.0,
+        error_rate: float = 0.0,
+        fail_first: int = 0,
+        retry_after: Optional[int] = None,
+    ):
+        self.secret = secret
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.events: list[dict] = []
+        self.stats = {
+            'connections': 0,
+            'requests': 0,
+            'inflight': 0,
+            'max_inflight': 0,
+            'bad_signatures': 0,
+        }
+        self._failures_left = fail_first
+        self._lock = threading.Lock()
+        self._received = threading.Condition(self._lock)
+        self._httpd = _ReceiverHTTPServer((host, port), _ReceiverHandler)
+        self._httpd.stand_in = self
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f'http://{host}:{port}/webhooks'
+
+    def count(self, name: str) -> None:
+        with self._lock:
+            self.stats[name] += 1
+
+    def enter(self) -> None:
+        with self._lock:
+            self.stats['requests'] += 1
+            self.stats['inflight'] += 1
+            self.stats['max_inflight'] = max(self.stats['max_inflight'], self.stats['inflight'])
+
+    def leave(self) -> None:
+        with self._lock:
+            self.stats['inflight'] -= 1
+
+    def take_failure(self) -> bool:
+        with self._lock:
+            if self._failures_left > 0:
+                self._failures_left -= 1
+                return True
+            return False
+
+    def record(self, events: list[dict]) -> None:
+        with self._received:
+            self.events.extend(events)
+            self._received.notify_all()
+
+    def wait_for(self, count: int, timeout: float = 5.0) -> bool:
+        """Ожидание count принятых событий."""
+        with self._received:
+            return self._received.wait_for(lambda: len(self.events) >= count, timeout)
+
+    def start(self) -> 'FakeWebhookReceiver':
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self) -> None:
+        self._httpd.serve_forever()
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
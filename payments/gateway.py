@@ -0,0 +1,156 @@
+"""
+Адаптеры платёжного шлюза.
+
+Бэкенд выбирается настройкой PAYOUT_GATEWAY (по аналогии с CACHES):
+SimulatedGateway имитирует шлюз задержкой, HttpGateway ходит в HTTP API
+через общий httpx.AsyncClient с пулом keep-alive соединений.
+"""
+import asyncio
+import importlib.util
+import logging
+import random
+
+from decimal import Decimal
+from typing import Optional
+
+import httpx
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from core import event_loop
+
+logger = logging.getLogger(__name__)
+
+
+class GatewayError(Exception):
+    """Шлюз недоступен или ответил ошибкой (результат платежа неизвестен)."""
+
+
+class BaseGateway:
+    """Интерфейс адаптера платёжного шлюза."""
+
+    async def pay(
+        self,
+        amount: Decimal,
+        currency: str,
+        recipient_details: dict,
+        external_id: Optional[str] = None,
+    ) -> tuple[bool, str]:
+        """
+        Проведение платежа.
+
+        Returns:
+            (success, message)
+
+        Raises:
+            GatewayError: если шлюз недоступен или ответил 5xx
+        """
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        """Освобождение соединений."""
+
+
+class SimulatedGateway(BaseGateway):
+    """Имитация шлюза: случайная задержка и доля отказов."""
+
+    def __init__(self, min_latency: float = 1.0, max_latency: float = 3.0, decline_rate: float = 0.1):
+        self.min_latency = min_latency
+        self.max_latency = max_latency
+        self.decline_rate = decline_rate
+
+    async def pay(self, amount, currency, recipient_details, external_id=None):
+        await asyncio.sleep(random.uniform(self.min_latency, self.max_latency))
+
+        if random.random() < self.decline_rate:
+            return False, 'Платёжный шлюз вернул ошибку: недостаточно средств'
+        return True, 'Платёж успешно проведён'
+
+
+class HttpGateway(BaseGateway):
+    """
+    HTTP-адаптер шлюза на httpx.AsyncClient.
+
+    Один клиент на event loop worker'а: соединения переиспользуются между
+    выплатами и задачами, TCP/TLS-рукопожатие не повторяется на каждый платёж.
+
+    Протокол: POST {base_url}/payouts с JSON заявки, ответ
+    {"status": "completed" | "declined", "message": "..."}.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        timeouts: Optional[dict] = None,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        keepalive_expiry: float = 30.0,
+        http2: bool = False,
+        headers: Optional[dict] = None,
+    ):
+        timeouts = {'connect': 2.0, 'read': 10.0, 'write': 5.0, 'pool': 5.0, **(timeouts or {})}
+        if http2 and importlib.util.find_spec('h2') is None:
+            logger.warning('[Gateway] Пакет h2 не установлен, HTTP/2 отключён')
+            http2 = False
+
+        self.client = httpx.AsyncClient(
+            base_url=base_url,
+            timeout=httpx.Timeout(**timeouts),
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive_connections,
+                keepalive_expiry=keepalive_expiry,
+            ),
+            http2=http2,
+            headers=headers,
+        )
+
+    async def pay(self, amount, currency, recipient_details, external_id=None):
+        payload = {
+            'external_id': str(external_id) if external_id else None,
+            'amount': str(amount),
+            'currency': currency,
+            'recipient': recipient_details,
+        }
+        headers = {'Idempotency-Key': str(external_id)} if external_id else None
+
+        try:
+            response = await self.client.post('/payouts', json=payload, headers=headers)
+        except httpx.TimeoutException as exc:
+            raise GatewayError(f'Таймаут платёжного шлюза: {exc.__class__.__name__}') from exc
+        except httpx.TransportError as exc:
+            raise GatewayError(f'Платёжный шлюз недоступен: {exc}') from exc
+
+        if response.status_code >= 500:
+            raise GatewayError(f'Платёжный шлюз ответил {response.status_code}')
+
+        try:
+            data = response.json()
+        except ValueError:
+            data = {}
+
+        if response.status_code >= 400:
+            return False, data.get('message') or f'Платёжный шлюз отклонил запрос ({response.status_code})'
+        if data.get('status') == 'completed':
+            return True, data.get('message') or 'Платёж успешно проведён'
+        return False, data.get('message') or 'Платёжный шлюз отклонил платёж'
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+
+def create_gateway(config: Optional[dict] = None) -> BaseGateway:
+    """Создание адаптера по конфигурации вида {'BACKEND': ..., 'OPTIONS': {...}}."""
+    config = config or settings.PAYOUT_GATEWAY
+    backend = import_string(config['BACKEND'])
+    return backend(**config.get('OPTIONS', {}))
+
+
+def get_gateway() -> BaseGateway:
+    """Адаптер шлюза, общий для всех выплат на event loop worker'а."""
+    return event_loop.get_resource(
+        'payment_gateway',
+        create_gateway,
+        close=lambda gateway: gateway.close(),
+    )
@@ -0,0 +1,39 @@
+"""
+Ответы шлюза, ещё не записанные в статус заявки.
+
+Ответ сохраняется в кэше сразу после запроса к шлюзу и до записи
+финального статуса (отдельной транзакцией или write-behind). Если запись не
+удалась или worker упал, повтор задачи (resume, повторная доставка
+сообщения с acks_late) завершает заявку из processing по сохранённому
+ответу, не обращаясь к шлюзу. Без сохранённого ответа (кэш недоступен или
+запись истекла) повторный запрос уходит с тем же Idempotency-Key.
+"""
+import logging
+
+from typing import Optional
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+
+def _cache_key(external_id) -> str:
+    return f'payouts:gateway_result:{external_id}'
+
+
+def record(external_id, success: bool, message: str) -> None:
+    """Сохранение ответа шлюза до записи финального статуса."""
+    try:
+        cache.set(_cache_key(external_id), (success, message), settings.PAYOUT_GATEWAY_RESULT_TTL)
+    except Exception as exc:
+        logger.warning(f'[GatewayResults] Кэш недоступен: {exc}')
+
+
+def get(external_id) -> Optional[tuple[bool, str]]:
+    """Сохранённый ответ шлюза (None, если его нет)."""
+    try:
+        return cache.get(_cache_key(external_id))
+    except Exception as exc:
+        logger.warning(f'[GatewayResults] Кэш недоступен: {exc}')
+        return None
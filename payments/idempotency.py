@@ -0,0 +1,55 @@
+import hashlib
+import json
+import logging
+
+from typing import Optional
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+
+
+def request_fingerprint(data) -> str:
+    """SHA-256 тела запроса в каноническом JSON (порядок ключей не важен)."""
+    payload = json.dumps(data, sort_keys=True, separators=(',', ':'), ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _cache_key(idempotency_key: str) -> str:
+    return f'payouts:idempotency:{idempotency_key}'
+
+
+def get_cached_response(idempotency_key: str) -> Optional[tuple[str, dict]]:
+    """Отпечаток исходного запроса и сохранённый ответ на него (None при промахе)."""
+    try:
+        cached = cache.get(_cache_key(idempotency_key))
+    except Exception as exc:
+        logger.warning(f'[Idempotency] Кэш недоступен: {exc}')
+        return None
+    if not isinstance(cached, dict) or 'response' not in cached:
+        return None
+    return cached['fingerprint'], cached['response']
+
+
+def cache_response(idempotency_key: str, fingerprint: str, data: dict) -> None:
+    """Сохранение ответа для повторов с тем же ключом."""
+    try:
+        cache.set(
+            _cache_key(idempotency_key),
+            {'fingerprint': fingerprint, 'response': dict(data)},
+            settings.PAYOUT_IDEMPOTENCY_CACHE_TTL
+        )
+    except Exception as exc:
+        logger.warning(f'[Idempotency] Кэш недоступен: {exc}')
+
+
+def forget_response(idempotency_key: str) -> None:
+    """Удаление сохранённого ответа (ключ снова свободен)."""
+    try:
+        cache.delete(_cache_key(idempotency_key))
+    except Exception as exc:
+        logger.warning(f'[Idempotency] Кэш недоступен: {exc}')
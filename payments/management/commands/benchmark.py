@@ -0,0 +1,331 @@
+import asyncio
+import json
+import logging
+import platform
+import random
+import time
+import uuid
+
+from collections import defaultdict
+from contextlib import contextmanager
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from core import event_loop
+from payments import stats
+from payments.factories import PayoutRequestFactory
+from payments.fake_webhook_receiver import FakeWebhookReceiver
+from payments.models import (
+    PayoutOutbox, PayoutRequest, PayoutStatusEvent, WebhookDelivery, WebhookEndpoint,
+)
+from payments.services import PayoutService
+from payments.webhooks import deliver_webhooks, enqueue_webhooks
+
+BENCHMARK_MARK = '[benchmark]'
+BENCHMARK_USER_PREFIX = 'benchmark-'
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    """Перцентиль методом ближайшего ранга."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered) + 0.5) - 1))
+    return ordered[rank]
+
+
+def summarize(samples: list[float], total_seconds: float, items: int) -> dict:
+    """Сводка по этапу: пропускная способность и перцентили (мс)."""
+    return {
+        'count': len(samples),
+        'items': items,
+        'total_seconds': round(total_seconds, 4),
+        'throughput_per_second': round(items / total_seconds, 2) if total_seconds else 0.0,
+        'p50_ms': round(percentile(samples, 50) * 1000, 3),
+        'p95_ms': round(percentile(samples, 95) * 1000, 3),
+        'p99_ms': round(percentile(samples, 99) * 1000, 3),
+    }
+
+
+class Command(BaseCommand):
+    """
+    Нагрузочный бенчмарк пайплайна выплат.
+
+    API create пишет заявки в outbox, как в продакшене; строки удаляет cleanup.
+    Запускать на БД без relay outbox и worker'ов: запущенный relay опубликовал
+    бы заявки бенчмарка в брокер.
+    """
+    help = (
+        'Нагрузочный бенчмарк пайплайна выплат: наполнение БД, API create/list/retrieve '
+        'и Celery-пайплайн в процессе со stub-шлюзом. Запускать на БД без relay outbox и worker\'ов'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--payouts', type=int, default=1000, help='Сколько заявок создать для наполнения')
+        parser.add_argument('--requests', type=int, default=200, help='Запросов на каждый путь API')
+        parser.add_argument('--pipeline', type=int, default=200, help='Заявок через пайплайн обработки')
+        parser.add_argument('--concurrency', type=int, default=20, help='Параллельность пайплайна')
+        parser.add_argument('--gateway-latency', type=float, default=50, help='Задержка stub-шлюза, мс')
+        parser.add_argument('--gateway-error-rate', type=float, default=0.0, help='Доля ошибок stub-шлюза')
+        parser.add_argument('--webhooks', type=int, default=1000, help='Событий через доставку вебхуков')
+        parser.add_argument('--webhook-latency', type=float, default=50, help='Задержка stand-in получателя, мс')
+        parser.add_argument('--webhook-concurrency', type=int, default=8, help='Параллельных запросов на endpoint')
+        parser.add_argument('--output', help='Файл для сохранения результатов (JSON)')
+        parser.add_argument('--baseline', help='Файл с результатами предыдущего прогона для сравнения')
+        parser.add_argument(
+            '--threshold', type=float, default=10.0,
+            help='Допустимое ухудшение p95/throughput относительно baseline, %%'
+        )
+        parser.add_argument('--fail-on-regression', action='store_true', help='Код ошибки при регрессии')
+        parser.add_argument('--keep', action='store_true', help='Не удалять созданные заявки')
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.webhook_endpoint_id = None
+        self.user = None
+        logger = logging.getLogger('payments')
+        log_level = logger.level
+        if options['verbosity'] < 2:
+            logger.setLevel(max(log_level, logging.WARNING))
+
+        stages = {}
+        try:
+            stages['seed'] = self.bench_seed(options['payouts'])
+            with override_settings(ALLOWED_HOSTS=['testserver']):
+                client = self.get_client()
+                stages['api_create'] = self.bench_api_create(client, options['requests'])
+                stages['api_list'] = self.bench_api_list(client, options['requests'])
+                stages['api_retrieve'] = self.bench_api_retrieve(client, options['requests'])
+            stages.update(self.bench_pipeline(options['pipeline'], options['concurrency']))
+            if options['webhooks']:
+                stages['webhook_delivery'] = self.bench_webhooks(options['webhooks'])
+        finally:
+            logger.setLevel(log_level)
+            if not options['keep']:
+                self.cleanup()
+            if self.user is not None:
+                self.user.delete()
+
+        results = {
+            'meta': {
+                'timestamp': timezone.now().isoformat(),
+                'database': connection.vendor,
+                'python': platform.python_version(),
+                'options': {
+                    key: options[key] for key in (
+                        'payouts', 'requests', 'pipeline', 'concurrency',
+                        'gateway_latency', 'gateway_error_rate',
+                        'webhooks', 'webhook_latency', 'webhook_concurrency',
+                    )
+                },
+            },
+            'stages': stages,
+        }
+
+        self.print_results(stages)
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(results, f, ensure_ascii=False, indent=2)
+            self.stdout.write(f'Результаты сохранены в {options["output"]}')
+
+        if options['baseline']:
+            regressions = self.compare(stages, options['baseline'], options['threshold'])
+            if regressions and options['fail_on_regression']:
+                raise CommandError(f'Регрессия производительности: {", ".join(regressions)}')
+
+    def bench_seed(self, count: int) -> dict:
+        """Наполнение БД через bulk_create."""
+        payouts = PayoutRequestFactory.build_batch(count, description=BENCHMARK_MARK)
+        started = time.perf_counter()
+        with transaction.atomic():
+            PayoutRequest.objects.bulk_create(payouts, batch_size=1000)
+            stats.record_created(payouts)
+        elapsed = time.perf_counter() - started
+        return summarize([elapsed], elapsed, count)
+
+    def get_client(self) -> APIClient:
+        """Клиент API от имени администратора, созданного на время прогона."""
+        self.user = get_user_model().objects.create_user(
+            username=f'{BENCHMARK_USER_PREFIX}{uuid.uuid4().hex[:12]}',
+            is_staff=True,
+            is_superuser=True,
+        )
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        return client
+
+    def timed_requests(self, count: int, request) -> dict:
+        samples = []
+        started = time.perf_counter()
+        for i in range(count):
+            request_started = time.perf_counter()
+            response = request(i)
+            samples.append(time.perf_counter() - request_started)
+            if response.status_code >= 400:
+                raise CommandError(f'Запрос завершился с кодом {response.status_code}: {response.content[:200]}')
+        return summarize(samples, time.perf_counter() - started, count)
+
+    def bench_api_create(self, client: APIClient, count: int) -> dict:
+        payloads = [
+            {
+                'amount': str(payout.amount),
+                'currency': payout.currency,
+                'recipient_details': payout.recipient_details,
+                'description': BENCHMARK_MARK,
+            }
+            for payout in PayoutRequestFactory.build_batch(count)
+        ]
+        return self.timed_requests(
+            count, lambda i: client.post('/api/v1/payouts/', payloads[i], format='json')
+        )
+
+    def bench_api_list(self, client: APIClient, count: int) -> dict:
+        state = {'url': '/api/v1/payouts/?page_size=50'}
+
+        def request(i):
+            response = client.get(state['url'])
+            state['url'] = response.json().get('next') or '/api/v1/payouts/?page_size=50'
+            return response
+
+        return self.timed_requests(count, request)
+
+    def bench_api_retrieve(self, client: APIClient, count: int) -> dict:
+        external_ids = list(
+            PayoutRequest.objects.filter(description=BENCHMARK_MARK)
+            .values_list('external_id', flat=True)[:count]
+        )
+        if not external_ids:
+            raise CommandError('Нет заявок для retrieve')
+        return self.timed_requests(
+            count, lambda i: client.get(f'/api/v1/payouts/{random.choice(external_ids)}/')
+        )
+
+    def bench_pipeline(self, count: int, concurrency: int) -> dict:
+        """Пайплайн обработки на event loop со stub-шлюзом и замером этапов."""
+        from payments import tasks
+
+        external_ids = [
+            str(external_id) for external_id in
+            PayoutRequest.objects.filter(
+                description=BENCHMARK_MARK,
+                status=PayoutRequest.Status.PENDING,
+            ).values_list('external_id', flat=True)[:count]
+        ]
+        latency = self.options['gateway_latency'] / 1000
+        error_rate = self.options['gateway_error_rate']
+        samples = defaultdict(list)
+
+        @contextmanager
+        def record_stage(stage):
+            started = time.perf_counter()
+            try:
+                yield
+            finally:
+                samples[stage].append(time.perf_counter() - started)
+
+        async def stub_check_recipient(recipient_details):
+            return True
+
+        async def stub_gateway(amount, currency, recipient_details, external_id=None):
+            await asyncio.sleep(latency)
+            if random.random() < error_rate:
+                return False, 'stub: ошибка шлюза'
+            return True, 'stub: ok'
+
+        with patch.object(tasks, 'observe_stage', record_stage), \
+                patch.object(PayoutService, 'check_recipient', stub_check_recipient), \
+                patch.object(PayoutService, 'process_payment_gateway', stub_gateway):
+            started = time.perf_counter()
+            event_loop.run(tasks._process_payout_batch(external_ids, concurrency))
+            elapsed = time.perf_counter() - started
+
+        results = {
+            'pipeline_total': summarize([elapsed], elapsed, len(external_ids)),
+        }
+        for stage, stage_samples in samples.items():
+            results[f'pipeline_{stage}'] = summarize(stage_samples, elapsed, len(stage_samples))
+        return results
+
+    def bench_webhooks(self, count: int) -> dict:
+        """Доставка вебхуков на stand-in получателя с задержкой --webhook-latency."""
+        payouts = list(
+            PayoutRequest.objects.filter(description=BENCHMARK_MARK)
+            .only('external_id', 'status', 'updated_at')[:count]
+        )
+        if not payouts:
+            raise CommandError('Нет заявок для вебхуков')
+        events = [random.choice(payouts) for _ in range(count)]
+        for payout in payouts:
+            payout.status = PayoutRequest.Status.COMPLETED
+
+        with FakeWebhookReceiver(latency=self.options['webhook_latency'] / 1000) as receiver:
+            endpoint = WebhookEndpoint.objects.create(
+                url=receiver.url,
+                max_concurrency=self.options['webhook_concurrency'],
+            )
+            self.webhook_endpoint_id = endpoint.pk
+            with transaction.atomic():
+                enqueue_webhooks(events)
+
+            started = time.perf_counter()
+            event_loop.run(deliver_webhooks())
+            elapsed = time.perf_counter() - started
+            event_loop.shutdown()
+
+        if len(receiver.events) != count:
+            raise CommandError(f'Доставлено {len(receiver.events)} событий вебхуков из {count}')
+        return summarize([elapsed], elapsed, count)
+
+    def cleanup(self):
+        payouts = PayoutRequest.objects.filter(description=BENCHMARK_MARK)
+        if self.webhook_endpoint_id is not None:
+            WebhookEndpoint.objects.filter(pk=self.webhook_endpoint_id).delete()
+        WebhookDelivery.objects.filter(
+            payload__external_id__in=[str(external_id) for external_id in payouts.values_list('external_id', flat=True)]
+        ).delete()
+        PayoutOutbox.objects.filter(external_id__in=payouts.values('external_id')).delete()
+        PayoutStatusEvent.objects.filter(external_id__in=payouts.values('external_id')).delete()
+        stats.delete_queryset(payouts)
+
+    def print_results(self, stages: dict):
+        self.stdout.write(f'{"Этап":<32}{"шт/с":>12}{"p50, мс":>12}{"p95, мс":>12}{"p99, мс":>12}')
+        for name, stage in stages.items():
+            self.stdout.write(
+                f'{name:<32}{stage["throughput_per_second"]:>12}'
+                f'{stage["p50_ms"]:>12}{stage["p95_ms"]:>12}{stage["p99_ms"]:>12}'
+            )
+
+    def compare(self, stages: dict, baseline_path: str, threshold: float) -> list[str]:
+        """Сравнение с baseline: изменение p95 и throughput в процентах."""
+        with open(baseline_path, encoding='utf-8') as f:
+            baseline = json.load(f)['stages']
+
+        regressions = []
+        self.stdout.write(f'\nСравнение с {baseline_path}:')
+        for name, stage in stages.items():
+            base = baseline.get(name)
+            if not base:
+                continue
+            p95_delta = self.delta(stage['p95_ms'], base['p95_ms'])
+            throughput_delta = self.delta(stage['throughput_per_second'], base['throughput_per_second'])
+            regressed = p95_delta > threshold or throughput_delta < -threshold
+            line = f'{name:<32}p95 {p95_delta:+.1f}%  throughput {throughput_delta:+.1f}%'
+            if regressed:
+                regressions.append(name)
+                self.stdout.write(self.style.ERROR(line))
+            else:
+                self.stdout.write(self.style.SUCCESS(line))
+        return regressions
+
+    @staticmethod
+    def delta(current: float, base: float) -> float:
+        if not base:
+            return 0.0
+        return (current - base) / base * 100
@@ -0,0 +1,93 @@
+import time
+import uuid
+
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from payments.models import PayoutRequest
+from payments.serializers import PayoutRequestFastSerializer, PayoutRequestSerializer
+
+
+class Command(BaseCommand):
+    help = 'Сравнение PayoutRequestSerializer и PayoutRequestFastSerializer на N строках'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000, help='Количество строк')
+        parser.add_argument('--repeat', type=int, default=5, help='Число повторов (берётся лучший)')
+        parser.add_argument(
+            '--db',
+            action='store_true',
+            help='Читать строки из БД (данные создаются в транзакции и откатываются)'
+        )
+
+    def handle(self, *args, **options):
+        rows, repeat = options['rows'], options['repeat']
+        renderer = JSONRenderer()
+
+        if options['db']:
+            with transaction.atomic():
+                PayoutRequest.objects.bulk_create(self.build_instances(rows), batch_size=1000)
+                queryset = PayoutRequest.objects.order_by('-created_at')[:rows]
+                slow = lambda: renderer.render(PayoutRequestSerializer(queryset.all(), many=True).data)
+                fast = lambda: renderer.render(PayoutRequestFastSerializer.serialize(
+                    queryset.values(*PayoutRequestFastSerializer.value_fields)
+                ))
+                slow_time, slow_output = self.measure(slow, repeat)
+                fast_time, fast_output = self.measure(fast, repeat)
+                transaction.set_rollback(True)
+        else:
+            instances = self.build_instances(rows)
+            values = [
+                {field: getattr(instance, field) for field in PayoutRequestFastSerializer.value_fields}
+                for instance in instances
+            ]
+            slow_time, slow_output = self.measure(
+                lambda: renderer.render(PayoutRequestSerializer(instances, many=True).data), repeat
+            )
+            fast_time, fast_output = self.measure(
+                lambda: renderer.render(PayoutRequestFastSerializer.serialize(values)), repeat
+            )
+
+        if slow_output != fast_output:
+            raise CommandError('Вывод сериализаторов отличается')
+
+        self.stdout.write(f'Строк: {rows}, источник: {"БД" if options["db"] else "память"}')
+        self.stdout.write(f'PayoutRequestSerializer:     {slow_time * 1000:.1f} мс')
+        self.stdout.write(f'PayoutRequestFastSerializer: {fast_time * 1000:.1f} мс')
+        self.stdout.write(self.style.SUCCESS(
+            f'Ускорение: x{slow_time / fast_time:.1f}, JSON идентичен ({len(fast_output)} байт)'
+        ))
+
+    @staticmethod
+    def measure(func, repeat: int):
+        """Лучшее время из repeat запусков и результат последнего."""
+        best, output = None, None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            output = func()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return best, output
+
+    @staticmethod
+    def build_instances(rows: int) -> list[PayoutRequest]:
+        now = timezone.now()
+        statuses = list(PayoutRequest.Status.values)
+        currencies = list(PayoutRequest.Currency.values)
+        return [
+            PayoutRequest(
+                external_id=uuid.uuid4(),
+                amount=Decimal(i % 100000 + 1) / 100,
+                currency=currencies[i % len(currencies)],
+                recipient_details={'type': 'card', 'number': f'4111{i:012d}', 'holder': 'Иван Иванов'},
+                status=statuses[i % len(statuses)],
+                description=f'Выплата #{i}',
+                created_at=now,
+                updated_at=now,
+            )
+            for i in range(rows)
+        ]
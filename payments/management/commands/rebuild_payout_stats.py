@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from payments import stats
+
+
+class Command(BaseCommand):
+    help = 'Пересчёт агрегата заявок по статусам и валютам по таблице заявок'
+
+    def handle(self, *args, **options):
+        rows = stats.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Агрегат пересчитан: {rows} строк'))
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from payments.fake_gateway import FakeGatewayServer
+
+
+class Command(BaseCommand):
+    help = 'Локальный stand-in платёжного шлюза (для HttpGateway)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8099)
+        parser.add_argument('--latency-ms', type=float, default=50, help='Задержка ответа, мс')
+        parser.add_argument('--jitter-ms', type=float, default=0, help='Случайная добавка к задержке, мс')
+        parser.add_argument('--error-rate', type=float, default=0.0, help='Доля ответов 503')
+        parser.add_argument('--decline-rate', type=float, default=0.1, help='Доля отклонённых платежей')
+
+    def handle(self, *args, **options):
+        server = FakeGatewayServer(
+            host=options['host'],
+            port=options['port'],
+            latency=options['latency_ms'] / 1000,
+            latency_jitter=options['jitter_ms'] / 1000,
+            error_rate=options['error_rate'],
+            decline_rate=options['decline_rate'],
+        )
+        self.stdout.write(f'Stand-in шлюза слушает {server.url} (Ctrl+C для остановки)')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stdout.write(
+                f'Соединений: {server.stats["connections"]}, запросов: {server.stats["requests"]}'
+            )
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from payments.fake_webhook_receiver import FakeWebhookReceiver
+
+
+class Command(BaseCommand):
+    help = 'Локальный stand-in получателя вебхуков'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8098)
+        parser.add_argument('--secret', help='Секрет endpoint\'а для проверки подписи')
+        parser.add_argument('--latency-ms', type=float, default=50, help='Задержка ответа, мс')
+        parser.add_argument('--jitter-ms', type=float, default=0, help='Случайная добавка к задержке, мс')
+        parser.add_argument('--error-rate', type=float, default=0.0, help='Доля ответов 503')
+
+    def handle(self, *args, **options):
+        receiver = FakeWebhookReceiver(
+            host=options['host'],
+            port=options['port'],
+            secret=options['secret'],
+            latency=options['latency_ms'] / 1000,
+            latency_jitter=options['jitter_ms'] / 1000,
+            error_rate=options['error_rate'],
+        )
+        self.stdout.write(f'Stand-in получателя вебхуков слушает {receiver.url} (Ctrl+C для остановки)')
+        try:
+            receiver.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stdout.write(
+                f'Запросов: {receiver.stats["requests"]}, событий: {len(receiver.events)}, '
+                f'максимум параллельных: {receiver.stats["max_inflight"]}'
+            )
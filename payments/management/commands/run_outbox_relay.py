@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from payments.outbox import run_relay
+
+
+class Command(BaseCommand):
+    help = 'Relay outbox заявок: публикация сообщений в брокер пачками'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=settings.PAYOUT_OUTBOX_BATCH_SIZE,
+            help='Сообщений outbox в одной транзакции'
+        )
+        parser.add_argument(
+            '--poll-interval', type=float, default=settings.PAYOUT_OUTBOX_POLL_INTERVAL,
+            help='Пауза при пустом outbox, секунды'
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write('Relay outbox запущен (Ctrl+C для остановки)')
+        try:
+            run_relay(poll_interval=options['poll_interval'], batch_size=options['batch_size'])
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from payments.webhooks import run_dispatcher
+
+
+class Command(BaseCommand):
+    help = 'Диспетчер вебхуков: доставка событий статуса заявок на endpoint\'ы'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=settings.PAYOUT_WEBHOOK_BATCH_SIZE,
+            help='Доставок за одну выборку'
+        )
+        parser.add_argument(
+            '--poll-interval', type=float, default=settings.PAYOUT_WEBHOOK_POLL_INTERVAL,
+            help='Пауза при пустой очереди, секунды'
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write('Диспетчер вебхуков запущен (Ctrl+C для остановки)')
+        try:
+            run_dispatcher(poll_interval=options['poll_interval'], batch_size=options['batch_size'])
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,263 @@
+"""
+Prometheus-метрики пайплайна выплат.
+
+В режиме нескольких процессов (gunicorn, Celery prefork) нужно задать
+переменную окружения PROMETHEUS_MULTIPROC_DIR до запуска процессов: тогда
+значения пишутся в файлы и собираются MultiProcessCollector'ом.
+"""
+import hmac
+import logging
+import os
+import threading
+import time
+
+from contextlib import contextmanager
+from typing import Optional
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+    start_http_server,
+)
+from prometheus_client.core import GaugeMetricFamily
+
+logger = logging.getLogger(__name__)
+
+PAYOUT_STAGE_SECONDS = Histogram(
+    'payout_stage_seconds',
+    'Длительность этапов обработки выплаты',
+    ['stage'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2, 3, 5, 10, 30),
+)
+
+PAYOUTS_FINALIZED = Counter(
+    'payouts_finalized_total',
+    'Выплаты, перешедшие в финальный статус',
+    ['status', 'currency'],
+)
+
+PAYOUTS_SWEPT = Counter(
+    'payouts_swept_total',
+    'Зависшие заявки, повторно отправленные sweeper\'ом',
+    ['status'],
+)
+
+OUTBOX_PUBLISHED = Counter(
+    'payout_outbox_published_total',
+    'Заявки, опубликованные relay из outbox в брокер',
+    ['queue'],
+)
+
+RECIPIENT_CACHE_LOOKUPS = Counter(
+    'payout_recipient_cache_lookups_total',
+    'Обращения к кэшу валидации реквизитов',
+    ['result'],
+)
+
+PAYOUT_CACHE_LOOKUPS = Counter(
+    'payout_cache_lookups_total',
+    'Обращения к кэшу заявок (hit, miss, wait — дождались чтения другим процессом)',
+    ['result'],
+)
+
+API_REQUEST_SECONDS = Histogram(
+    'payout_api_request_seconds',
+    'Время обработки запросов PayoutRequestViewSet',
+    ['action', 'method', 'status_code'],
+)
+
+GATEWAY_CONCURRENCY_LIMIT = Gauge(
+    'payout_gateway_concurrency_limit',
+    'Текущий адаптивный лимит параллельных запросов к шлюзу',
+    multiprocess_mode='liveall',
+)
+
+GATEWAY_INFLIGHT = Gauge(
+    'payout_gateway_inflight',
+    'Запросы к шлюзу в обработке',
+    multiprocess_mode='livesum',
+)
+
+GATEWAY_CIRCUIT_STATE = Gauge(
+    'payout_gateway_circuit_state',
+    'Состояние circuit breaker шлюза: 0 — closed, 1 — half-open, 2 — open',
+    multiprocess_mode='liveall',
+)
+
+PAYOUT_EVENTS_PUBLISHED = Counter(
+    'payout_status_events_published_total',
+    'События смены статуса, опубликованные в Redis pub/sub',
+)
+
+PAYOUT_EVENTS_DROPPED = Counter(
+    'payout_status_events_dropped_total',
+    'События смены статуса, не опубликованные (Redis недоступен или очередь переполнена)',
+)
+
+PAYOUT_EVENT_STREAMS = Gauge(
+    'payout_status_streams',
+    'Открытые SSE-потоки статуса заявок',
+    multiprocess_mode='livesum',
+)
+
+WEBHOOK_EVENTS = Counter(
+    'payout_webhook_events_total',
+    'События вебхуков по результату попытки доставки',
+    ['result'],
+)
+
+WEBHOOK_REQUEST_SECONDS = Histogram(
+    'payout_webhook_request_seconds',
+    'Длительность запросов к webhook endpoint\'ам',
+    ['outcome'],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30),
+)
+
+WRITE_BEHIND_FLUSH_SIZE = Histogram(
+    'payout_write_behind_flush_size',
+    'Финальные статусы, записанные одним flush write-behind',
+    buckets=(1, 5, 10, 25, 50, 100, 200, 500, 1000),
+)
+
+GATEWAY_REJECTED = Counter(
+    'payout_gateway_rejected_total',
+    'Запросы к шлюзу, отклонённые без обращения к нему',
+    ['reason'],
+)
+
+
+@contextmanager
+def observe_stage(stage: str):
+    """Замер длительности этапа обработки выплаты."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        PAYOUT_STAGE_SECONDS.labels(stage=stage).observe(time.perf_counter() - started)
+
+
+class PayoutStatusCollector:
+    """Gauge количества заявок по статусам из агрегата payments.stats."""
+
+    def collect(self):
+        from .stats import snapshot
+
+        gauge = GaugeMetricFamily(
+            'payouts_by_status',
+            'Количество заявок по статусам',
+            labels=['status'],
+        )
+        for payout_status, count in snapshot()['by_status'].items():
+            gauge.add_metric([payout_status], count)
+        yield gauge
+
+
+class PayoutQueueDepthCollector:
+    """Gauge глубины очередей выплат у брокера, читается при каждом scrape."""
+
+    def collect(self):
+        from .routing import queue_depths
+
+        gauge = GaugeMetricFamily(
+            'payout_queue_depth',
+            'Сообщения в очередях выплат у брокера',
+            labels=['queue'],
+        )
+        for queue, depth in queue_depths().items():
+            gauge.add_metric([queue], depth)
+        yield gauge
+
+
+class CachedCollector:
+    """
+    Результат collect() коллектора, переиспользуемый PROMETHEUS_DB_METRICS_TTL секунд.
+
+    Частые scrape'ы (и несколько Prometheus) не выполняют запрос к БД и
+    queue_declare к брокеру на каждое обращение.
+    """
+
+    def __init__(self, collector):
+        self.collector = collector
+        self._lock = threading.Lock()
+        self._metrics = []
+        self._collected_at: Optional[float] = None
+
+    def collect(self):
+        with self._lock:
+            now = time.monotonic()
+            if self._collected_at is None or now - self._collected_at >= settings.PROMETHEUS_DB_METRICS_TTL:
+                self._metrics = list(self.collector.collect())
+                self._collected_at = now
+            return list(self._metrics)
+
+
+_db_registry = CollectorRegistry(auto_describe=False)
+_db_registry.register(CachedCollector(PayoutStatusCollector()))
+_db_registry.register(CachedCollector(PayoutQueueDepthCollector()))
+
+
+def is_multiprocess_mode() -> bool:
+    return 'PROMETHEUS_MULTIPROC_DIR' in os.environ
+
+
+def get_registry() -> CollectorRegistry:
+    """Реестр процесса или агрегирующий реестр для multiprocess-режима."""
+    if is_multiprocess_mode():
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+
+def is_metrics_request_allowed(request) -> bool:
+    """
+    Доступ к /metrics: по токену (Authorization: Bearer) или IP из allowlist.
+
+    Если не задано ни PROMETHEUS_METRICS_TOKEN, ни PROMETHEUS_METRICS_ALLOWED_IPS,
+    эндпоинт открыт только при DEBUG.
+    """
+    token = settings.PROMETHEUS_METRICS_TOKEN
+    allowed_ips = settings.PROMETHEUS_METRICS_ALLOWED_IPS
+    if not token and not allowed_ips:
+        return settings.DEBUG
+    if token and hmac.compare_digest(
+        request.headers.get('Authorization', '').encode(), f'Bearer {token}'.encode()
+    ):
+        return True
+    return request.META.get('REMOTE_ADDR') in allowed_ips
+
+
+def metrics_view(request):
+    """Эндпоинт /metrics для веб-процессов."""
+    if not is_metrics_request_allowed(request):
+        return HttpResponseForbidden()
+    output = generate_latest(get_registry()) + generate_latest(_db_registry)
+    return HttpResponse(output, content_type=CONTENT_TYPE_LATEST)
+
+
+def start_worker_exporter() -> None:
+    """HTTP-экспортер метрик Celery worker'а (запускается в главном процессе)."""
+    port = settings.PROMETHEUS_WORKER_PORT
+    if not port:
+        return
+    if not is_multiprocess_mode():
+        logger.warning(
+            '[Metrics] PROMETHEUS_MULTIPROC_DIR не задан: метрики дочерних '
+            'процессов prefork не попадут в экспортер'
+        )
+    start_http_server(port, registry=get_registry())
+    logger.info(f'[Metrics] Экспортер метрик worker запущен на порту {port}')
+
+
+def mark_worker_process_dead(pid: int) -> None:
+    """Удаление файлов live-gauge метрик завершившегося процесса."""
+    if is_multiprocess_mode():
+        multiprocess.mark_process_dead(pid)
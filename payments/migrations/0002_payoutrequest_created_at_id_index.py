@@ -0,0 +1,21 @@
+# Generated by Django 5.2.8 on 2026-10-17 02:56
+
+from django.db import migrations, models
+
+from payments.migration_operations import AddIndexConcurrentlyOnPostgres
+
+
+class Migration(migrations.Migration):
+    # Индекс на горячей таблице строится без блокировки записи
+    atomic = False
+
+    dependencies = [
+        ('payments', '0001_initial'),
+    ]
+
+    operations = [
+        AddIndexConcurrentlyOnPostgres(
+            model_name='payoutrequest',
+            index=models.Index(fields=['created_at', 'id'], name='payments_pa_created_6d51e9_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-17 02:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0002_payoutrequest_created_at_id_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payoutrequest',
+            name='idempotency_key',
+            field=models.CharField(blank=True, editable=False, help_text='Значение заголовка Idempotency-Key запроса на создание', max_length=255, null=True, unique=True, verbose_name='Ключ идемпотентности'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-17 03:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0003_payoutrequest_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payoutrequest',
+            name='priority',
+            field=models.CharField(choices=[('low', 'Низкий'), ('normal', 'Обычный'), ('high', 'Высокий')], default='normal', help_text='Высокий приоритет и крупные суммы обрабатываются отдельной очередью', max_length=10, verbose_name='Приоритет'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.8 on 2026-10-17 03:12
+
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def backfill_stats(apps, schema_editor):
+    """Начальные значения агрегата по существующим заявкам (в шард 0)."""
+    PayoutRequest = apps.get_model('payments', 'PayoutRequest')
+    PayoutStatsShard = apps.get_model('payments', 'PayoutStatsShard')
+    rows = (
+        PayoutRequest.objects.order_by()
+        .values('status', 'currency')
+        .annotate(total_count=Count('id'), total_amount=Sum('amount'))
+    )
+    PayoutStatsShard.objects.bulk_create([
+        PayoutStatsShard(shard=0, **row) for row in rows
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0004_payoutrequest_priority'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PayoutStatsShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'Ожидает обработки'), ('processing', 'В обработке'), ('completed', 'Выполнена'), ('failed', 'Ошибка'), ('cancelled', 'Отменена')], max_length=20, verbose_name='Статус')),
+                ('currency', models.CharField(choices=[('RUB', 'Российский рубль'), ('USD', 'Доллар США'), ('EUR', 'Евро'), ('YEN', 'Японский иен'), ('GBP', 'Британский фунт стерлингов'), ('AUD', 'Австралийский доллар'), ('CNY', 'Китайский юань'), ('KZT', 'Казахстанский тенге'), ('BYN', 'Белорусский рубль'), ('AED', 'Дирхам ОАЭ')], max_length=3, verbose_name='Валюта')),
+                ('shard', models.PositiveSmallIntegerField(verbose_name='Шард')),
+                ('total_count', models.BigIntegerField(default=0, verbose_name='Количество заявок')),
+                ('total_amount', models.DecimalField(decimal_places=2, default=Decimal('0'), max_digits=20, verbose_name='Сумма заявок')),
+            ],
+            options={
+                'verbose_name': 'Шард статистики заявок',
+                'verbose_name_plural': 'Шарды статистики заявок',
+                'constraints': [models.UniqueConstraint(fields=('status', 'currency', 'shard'), name='payout_stats_shard_unique')],
+            },
+        ),
+        migrations.RunPython(backfill_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.8 on 2026-10-17 03:15
+
+from django.db import migrations, models
+
+from payments.migration_operations import AddIndexConcurrentlyOnPostgres
+
+
+class Migration(migrations.Migration):
+    # Индекс на горячей таблице строится без блокировки записи
+    atomic = False
+
+    dependencies = [
+        ('payments', '0005_payoutstatsshard'),
+    ]
+
+    operations = [
+        AddIndexConcurrentlyOnPostgres(
+            model_name='payoutrequest',
+            index=models.Index(condition=models.Q(('status__in', ['pending', 'processing'])), fields=['status', 'updated_at'], name='payout_unfinished_idx'),
+        ),
+    ]
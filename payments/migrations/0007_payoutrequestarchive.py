@@ -0,0 +1,50 @@
+# Generated by Django 5.2.8 on 2026-10-17 03:17
+
+import django.core.validators
+import uuid
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0006_payoutrequest_unfinished_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PayoutRequestArchive',
+            fields=[
+                ('external_id', models.UUIDField(default=uuid.uuid4, editable=False, help_text='UUID для идентификатора заявки во внешних системах', unique=True, verbose_name='Внешний идентификатор')),
+                ('amount', models.DecimalField(decimal_places=2, help_text='Сумма в указанной валюте (минимум 0.01)', max_digits=12, validators=[django.core.validators.MinValueValidator(Decimal('0.01'))], verbose_name='Сумма выплаты')),
+                ('currency', models.CharField(choices=[('RUB', 'Российский рубль'), ('USD', 'Доллар США'), ('EUR', 'Евро'), ('YEN', 'Японский иен'), ('GBP', 'Британский фунт стерлингов'), ('AUD', 'Австралийский доллар'), ('CNY', 'Китайский юань'), ('KZT', 'Казахстанский тенге'), ('BYN', 'Белорусский рубль'), ('AED', 'Дирхам ОАЭ')], default='RUB', max_length=3, verbose_name='Валюта')),
+                ('recipient_details', models.JSONField(help_text='JSON с реквизитами: тип (card/account/wallet), номер, ФИО и др.', verbose_name='Реквизиты получателя')),
+                ('status', models.CharField(choices=[('pending', 'Ожидает обработки'), ('processing', 'В обработке'), ('completed', 'Выполнена'), ('failed', 'Ошибка'), ('cancelled', 'Отменена')], db_index=True, default='pending', max_length=20, verbose_name='Статус')),
+                ('priority', models.CharField(choices=[('low', 'Низкий'), ('normal', 'Обычный'), ('high', 'Высокий')], default='normal', help_text='Высокий приоритет и крупные суммы обрабатываются отдельной очередью', max_length=10, verbose_name='Приоритет')),
+                ('description', models.TextField(blank=True, default='', help_text='Опциональный комментарий к заявке', verbose_name='Описание')),
+                ('idempotency_key', models.CharField(blank=True, editable=False, help_text='Значение заголовка Idempotency-Key запроса на создание', max_length=255, null=True, unique=True, verbose_name='Ключ идемпотентности')),
+                ('id', models.BigIntegerField(primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(verbose_name='Дата создания')),
+                ('updated_at', models.DateTimeField(verbose_name='Дата обновления')),
+                ('archived_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата архивации')),
+            ],
+            options={
+                'verbose_name': 'Архивная заявка на выплату',
+                'verbose_name_plural': 'Архив заявок на выплату',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='payoutrequestarchive',
+            index=models.Index(fields=['status', 'created_at'], name='payout_archive_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payoutrequestarchive',
+            index=models.Index(fields=['created_at', 'id'], name='payout_archive_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payoutrequestarchive',
+            index=models.Index(fields=['currency'], name='payout_archive_currency_idx'),
+        ),
+    ]
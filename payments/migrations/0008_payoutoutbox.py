@@ -0,0 +1,26 @@
+# Generated by Django 5.2.8 on 2026-10-17 03:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0007_payoutrequestarchive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PayoutOutbox',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('external_id', models.UUIDField(verbose_name='Внешний идентификатор заявки')),
+                ('queue', models.CharField(max_length=100, verbose_name='Очередь')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+            ],
+            options={
+                'verbose_name': 'Сообщение outbox',
+                'verbose_name_plural': 'Outbox заявок',
+            },
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.8 on 2026-10-17 03:40
+
+import django.core.validators
+import django.db.models.deletion
+import django.utils.timezone
+import payments.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0008_payoutoutbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WebhookEndpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url', models.URLField(help_text='Адрес, на который отправляются POST-запросы с событиями', max_length=500, verbose_name='URL')),
+                ('secret', models.CharField(default=payments.models.generate_webhook_secret, help_text='Ключ HMAC-SHA256 для заголовка X-Payout-Signature', max_length=128, verbose_name='Секрет подписи')),
+                ('statuses', models.JSONField(default=payments.models.default_webhook_statuses, help_text='Список статусов, о переходе в которые отправляется событие', verbose_name='Статусы')),
+                ('is_active', models.BooleanField(default=True, verbose_name='Активен')),
+                ('max_concurrency', models.PositiveSmallIntegerField(default=4, help_text='Максимум одновременных запросов на endpoint', validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(100)], verbose_name='Параллельных запросов')),
+                ('max_batch_size', models.PositiveSmallIntegerField(default=50, help_text='Максимум событий в одном запросе при накопившейся очереди', validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(1000)], verbose_name='Событий в запросе')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+            ],
+            options={
+                'verbose_name': 'Webhook endpoint',
+                'verbose_name_plural': 'Webhook endpoints',
+            },
+        ),
+        migrations.CreateModel(
+            name='WebhookDelivery',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('payload', models.JSONField(verbose_name='Событие')),
+                ('state', models.CharField(choices=[('pending', 'Ожидает доставки'), ('failed', 'Не доставлено')], default='pending', max_length=20, verbose_name='Состояние')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='Попыток')),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Следующая попытка')),
+                ('last_error', models.TextField(blank=True, verbose_name='Последняя ошибка')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('endpoint', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='deliveries', to='payments.webhookendpoint', verbose_name='Endpoint')),
+            ],
+            options={
+                'verbose_name': 'Доставка вебхука',
+                'verbose_name_plural': 'Доставки вебхуков',
+                'indexes': [models.Index(condition=models.Q(('state', 'pending')), fields=['next_attempt_at'], name='webhook_due_idx')],
+            },
+        ),
+    ]
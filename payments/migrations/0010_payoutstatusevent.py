@@ -0,0 +1,46 @@
+# Generated by Django 5.2.8 on 2026-10-17 03:53
+
+from django.db import migrations, models
+
+
+def create_created_at_index(apps, schema_editor):
+    """Индекс по времени перехода: BRIN на PostgreSQL (журнал растёт по времени), иначе B-tree."""
+    PayoutStatusEvent = apps.get_model('payments', 'PayoutStatusEvent')
+    qn = schema_editor.quote_name
+    using = 'USING brin ' if schema_editor.connection.vendor == 'postgresql' else ''
+    schema_editor.execute(
+        f'CREATE INDEX {qn("status_event_created_idx")} '
+        f'ON {qn(PayoutStatusEvent._meta.db_table)} {using}({qn("created_at")})'
+    )
+
+
+def drop_created_at_index(apps, schema_editor):
+    schema_editor.execute(f'DROP INDEX {schema_editor.quote_name("status_event_created_idx")}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0009_webhooks'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PayoutStatusEvent',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('external_id', models.UUIDField(verbose_name='Внешний ID заявки')),
+                ('currency', models.CharField(choices=[('RUB', 'Российский рубль'), ('USD', 'Доллар США'), ('EUR', 'Евро'), ('YEN', 'Японский иен'), ('GBP', 'Британский фунт стерлингов'), ('AUD', 'Австралийский доллар'), ('CNY', 'Китайский юань'), ('KZT', 'Казахстанский тенге'), ('BYN', 'Белорусский рубль'), ('AED', 'Дирхам ОАЭ')], max_length=3, verbose_name='Валюта')),
+                ('from_status', models.CharField(blank=True, choices=[('pending', 'Ожидает обработки'), ('processing', 'В обработке'), ('completed', 'Выполнена'), ('failed', 'Ошибка'), ('cancelled', 'Отменена')], max_length=20, verbose_name='Предыдущий статус')),
+                ('to_status', models.CharField(choices=[('pending', 'Ожидает обработки'), ('processing', 'В обработке'), ('completed', 'Выполнена'), ('failed', 'Ошибка'), ('cancelled', 'Отменена')], max_length=20, verbose_name='Новый статус')),
+                ('entered_at', models.DateTimeField(blank=True, null=True, verbose_name='Вход в предыдущий статус')),
+                ('created_at', models.DateTimeField(verbose_name='Дата перехода')),
+            ],
+            options={
+                'verbose_name': 'Событие статуса заявки',
+                'verbose_name_plural': 'События статуса заявок',
+                'indexes': [models.Index(fields=['external_id', 'created_at'], name='status_event_payout_idx')],
+            },
+        ),
+        migrations.RunPython(create_created_at_index, drop_created_at_index),
+    ]
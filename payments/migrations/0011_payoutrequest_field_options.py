@@ -0,0 +1,29 @@
+# Generated by Django 5.2.8 on 2026-10-17 04:02
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Только состояние моделей: choices и help_text не меняют схему БД
+
+    dependencies = [
+        ('payments', '0010_payoutstatusevent'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name='payoutrequest',
+                    name='currency',
+                    field=models.CharField(choices=[('RUB', 'Российский рубль'), ('USD', 'Доллар США'), ('EUR', 'Евро'), ('YEN', 'Японский иен'), ('GBP', 'Британский фунт стерлингов'), ('AUD', 'Австралийский доллар'), ('CNY', 'Китайский юань'), ('KZT', 'Казахстанский тенге'), ('BYN', 'Белорусский рубль'), ('AED', 'Дирхам ОАЭ')], default='RUB', max_length=3, verbose_name='Валюта'),
+                ),
+                migrations.AlterField(
+                    model_name='payoutrequest',
+                    name='external_id',
+                    field=models.UUIDField(default=uuid.uuid4, editable=False, help_text='UUID для идентификатора заявки во внешних системах', unique=True, verbose_name='Внешний идентификатор'),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.8 on 2026-10-17 04:06
+
+from django.db import migrations, models
+
+
+def copy_existing_keys(apps, schema_editor):
+    """Ключи уже созданных заявок (рабочая таблица и архив) без отпечатка запроса."""
+    PayoutIdempotencyKey = apps.get_model('payments', 'PayoutIdempotencyKey')
+    for model_name in ('PayoutRequest', 'PayoutRequestArchive'):
+        rows = (
+            apps.get_model('payments', model_name).objects
+            .filter(idempotency_key__isnull=False)
+            .values_list('idempotency_key', 'external_id')
+        )
+        PayoutIdempotencyKey.objects.bulk_create(
+            [PayoutIdempotencyKey(key=key, external_id=external_id) for key, external_id in rows.iterator()],
+            batch_size=1000,
+            ignore_conflicts=True,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0011_payoutrequest_field_options'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PayoutIdempotencyKey',
+            fields=[
+                ('key', models.CharField(max_length=255, primary_key=True, serialize=False, verbose_name='Ключ идемпотентности')),
+                ('fingerprint', models.CharField(blank=True, default='', help_text='SHA-256 тела исходного запроса (пусто для ключей, заведённых до появления проверки)', max_length=64, verbose_name='Отпечаток запроса')),
+                ('external_id', models.UUIDField(verbose_name='Внешний идентификатор заявки')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+            ],
+            options={
+                'verbose_name': 'Ключ идемпотентности',
+                'verbose_name_plural': 'Ключи идемпотентности',
+            },
+        ),
+        migrations.RunPython(copy_existing_keys, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.8 on 2026-10-17 08:05
+
+from django.db import migrations, models
+
+from payments.migration_operations import AddIndexConcurrentlyOnPostgres
+
+
+class Migration(migrations.Migration):
+    # Индекс на горячей таблице строится без блокировки записи
+    atomic = False
+
+    dependencies = [
+        ('payments', '0012_payoutidempotencykey'),
+    ]
+
+    operations = [
+        AddIndexConcurrentlyOnPostgres(
+            model_name='payoutrequest',
+            index=models.Index(condition=models.Q(('status__in', ['completed', 'failed', 'cancelled'])), fields=['updated_at'], name='payout_finished_idx'),
+        ),
+    ]
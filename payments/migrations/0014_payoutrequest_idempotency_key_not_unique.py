@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-17 04:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0013_payoutrequest_finished_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='payoutrequest',
+            name='idempotency_key',
+            field=models.CharField(blank=True, editable=False, help_text='Значение заголовка Idempotency-Key запроса на создание', max_length=255, null=True, verbose_name='Ключ идемпотентности'),
+        ),
+        migrations.AlterField(
+            model_name='payoutrequestarchive',
+            name='idempotency_key',
+            field=models.CharField(blank=True, editable=False, help_text='Значение заголовка Idempotency-Key запроса на создание', max_length=255, null=True, verbose_name='Ключ идемпотентности'),
+        ),
+    ]
@@ -1,13 +1,16 @@
+import secrets
 import uuid
 from decimal import Decimal
 
 from django.db import models
-from django.core.validators import MinValueValidator
+from django.db.models import Q
+from django.core.validators import MaxValueValidator, MinValueValidator
+from django.utils import timezone
 
 
-class PayoutRequest(models.Model):
+class PayoutRequestBase(models.Model):
     """
-    Модель заявки на выплату средств.
+    Общие поля заявки на выплату (рабочая таблица и архив).
     """
 
     class Status(models.TextChoices):
@@ -31,6 +34,20 @@ class PayoutRequest(models.Model):
         BYN = 'BYN', 'Белорусский рубль'
         AED = 'AED', 'Дирхам ОАЭ'
 
+    class Priority(models.TextChoices):
+        """Приоритет обработки (влияет на очередь Celery)."""
+        LOW = 'low', 'Низкий'
+        NORMAL = 'normal', 'Обычный'
+        HIGH = 'high', 'Высокий'
+
+    FINAL_STATUSES = (Status.COMPLETED, Status.FAILED, Status.CANCELLED)
+
+    # Переходы, допустимые при ручной смене статуса (PATCH, массовый переход, админка)
+    ALLOWED_TRANSITIONS = {
+        Status.PENDING: (Status.PROCESSING, Status.CANCELLED),
+        Status.PROCESSING: (Status.COMPLETED, Status.FAILED, Status.CANCELLED),
+    }
+
     external_id = models.UUIDField(
         default=uuid.uuid4,
         editable=False,
@@ -67,6 +84,50 @@ class PayoutRequest(models.Model):
         verbose_name='Статус'
     )
 
+    priority = models.CharField(
+        max_length=10,
+        choices=Priority.choices,
+        default=Priority.NORMAL,
+        verbose_name='Приоритет',
+        help_text='Высокий приоритет и крупные суммы обрабатываются отдельной очередью'
+    )
+
+    description = models.TextField(
+        blank=True,
+        default='',
+        verbose_name='Описание',
+        help_text='Опциональный комментарий к заявке'
+    )
+
+    idempotency_key = models.CharField(
+        max_length=255,
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name='Ключ идемпотентности',
+        help_text='Значение заголовка Idempotency-Key запроса на создание'
+    )
+
+    class Meta:
+        abstract = True
+
+    def __str__(self):
+        return f'Заявка #{self.pk} - {self.amount} {self.currency} ({self.get_status_display()})'
+
+    @property
+    def is_final_status(self) -> bool:
+        """Проверяет, находится ли заявка в финальном статусе."""
+        return self.status in self.FINAL_STATUSES
+
+
+class PayoutRequest(PayoutRequestBase):
+    """
+    Модель заявки на выплату средств.
+
+    Рабочая («горячая») таблица: финальные заявки старше
+    PAYOUT_ARCHIVE_AFTER_DAYS переносятся в PayoutRequestArchive.
+    """
+
     created_at = models.DateTimeField(
         auto_now_add=True,
         verbose_name='Дата создания'
@@ -77,26 +138,385 @@ class PayoutRequest(models.Model):
         verbose_name='Дата обновления'
     )
 
-    description = models.TextField(
-        blank=True,
-        default='',
-        verbose_name='Описание',
-        help_text='Опциональный комментарий к заявке'
-    )
-
     class Meta:
         verbose_name = 'Заявка на выплату'
         verbose_name_plural = 'Заявки на выплату'
         ordering = ['-created_at']
         indexes = [
             models.Index(fields=['status', 'created_at']),
+            models.Index(fields=['created_at', 'id']),
             models.Index(fields=['currency']),
+            # Частичный индекс для sweeper'а: только незавершённые заявки
+            models.Index(
+                fields=['status', 'updated_at'],
+                name='payout_unfinished_idx',
+                condition=Q(status__in=['pending', 'processing']),
+            ),
+            # Поиск кандидатов в архив: только финальные заявки
+            models.Index(
+                fields=['updated_at'],
+                name='payout_finished_idx',
+                condition=Q(status__in=['completed', 'failed', 'cancelled']),
+            ),
+        ]
+
+
+class PayoutRequestArchive(PayoutRequestBase):
+    """
+    Архив финальных заявок.
+
+    id и даты переносятся из PayoutRequest без изменений, поэтому keyset-пагинация
+    по (created_at, id) работает поверх обеих таблиц.
+    """
+
+    id = models.BigIntegerField(
+        primary_key=True,
+        verbose_name='ID'
+    )
+
+    created_at = models.DateTimeField(
+        verbose_name='Дата создания'
+    )
+
+    updated_at = models.DateTimeField(
+        verbose_name='Дата обновления'
+    )
+
+    archived_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Дата архивации'
+    )
+
+    class Meta:
+        verbose_name = 'Архивная заявка на выплату'
+        verbose_name_plural = 'Архив заявок на выплату'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='payout_archive_status_idx'),
+            models.Index(fields=['created_at', 'id'], name='payout_archive_created_idx'),
+            models.Index(fields=['currency'], name='payout_archive_currency_idx'),
+        ]
+
+
+class PayoutStatsShard(models.Model):
+    """
+    Шард агрегата заявок по статусу и валюте.
+
+    Счётчики обновляются в той же транзакции, что и заявки (payments.stats).
+    Запись на пару (статус, валюта) разнесена по нескольким строкам-шардам,
+    чтобы параллельные переходы не упирались в блокировку одной строки.
+    """
+
+    status = models.CharField(
+        max_length=20,
+        choices=PayoutRequest.Status.choices,
+        verbose_name='Статус'
+    )
+
+    currency = models.CharField(
+        max_length=3,
+        choices=PayoutRequest.Currency.choices,
+        verbose_name='Валюта'
+    )
+
+    shard = models.PositiveSmallIntegerField(
+        verbose_name='Шард'
+    )
+
+    total_count = models.BigIntegerField(
+        default=0,
+        verbose_name='Количество заявок'
+    )
+
+    total_amount = models.DecimalField(
+        max_digits=20,
+        decimal_places=2,
+        default=Decimal('0'),
+        verbose_name='Сумма заявок'
+    )
+
+    class Meta:
+        verbose_name = 'Шард статистики заявок'
+        verbose_name_plural = 'Шарды статистики заявок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['status', 'currency', 'shard'],
+                name='payout_stats_shard_unique'
+            ),
         ]
 
     def __str__(self):
-        return f'Заявка #{self.pk} - {self.amount} {self.currency} ({self.get_status_display()})'
+        return f'{self.status}/{self.currency}#{self.shard}: {self.total_count}, {self.total_amount}'
+
+
+class PayoutOutbox(models.Model):
+    """
+    Исходящее сообщение для брокера (transactional outbox).
+
+    Строка пишется в той же транзакции, что и заявка, поэтому заявка не
+    теряется при падении между коммитом и публикацией. Публикует и удаляет
+    строки relay (payments.outbox).
+    """
+
+    id = models.BigAutoField(primary_key=True)
+
+    external_id = models.UUIDField(
+        verbose_name='Внешний идентификатор заявки'
+    )
+
+    queue = models.CharField(
+        max_length=100,
+        verbose_name='Очередь'
+    )
+
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Дата создания'
+    )
+
+    class Meta:
+        verbose_name = 'Сообщение outbox'
+        verbose_name_plural = 'Outbox заявок'
+
+    def __str__(self):
+        return f'{self.external_id} → {self.queue}'
+
+
+class PayoutIdempotencyKey(models.Model):
+    """
+    Ключ Idempotency-Key запроса на создание заявки.
+
+    Отдельная таблица с уникальным ключом: строка пишется в транзакции
+    создания заявки и не переносится в архив, поэтому уникальность ключа
+    не зависит от того, в какой таблице сейчас лежит заявка.
+    """
+
+    key = models.CharField(
+        max_length=255,
+        primary_key=True,
+        verbose_name='Ключ идемпотентности'
+    )
+
+    fingerprint = models.CharField(
+        max_length=64,
+        blank=True,
+        default='',
+        verbose_name='Отпечаток запроса',
+        help_text='SHA-256 тела исходного запроса (пусто для ключей, заведённых до появления проверки)'
+    )
+
+    external_id = models.UUIDField(
+        verbose_name='Внешний идентификатор заявки'
+    )
+
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Дата создания'
+    )
+
+    class Meta:
+        verbose_name = 'Ключ идемпотентности'
+        verbose_name_plural = 'Ключи идемпотентности'
+
+    def __str__(self):
+        return f'{self.key} → {self.external_id}'
+
+
+def generate_webhook_secret() -> str:
+    return secrets.token_hex(32)
+
+
+def default_webhook_statuses() -> list[str]:
+    return [PayoutRequest.Status.COMPLETED, PayoutRequest.Status.FAILED]
+
+
+class WebhookEndpoint(models.Model):
+    """
+    Подписка интегратора на смену статуса заявок.
+
+    Доставку выполняет payments.webhooks: тело запроса подписывается
+    HMAC-SHA256 секретом endpoint'а.
+    """
+
+    url = models.URLField(
+        max_length=500,
+        verbose_name='URL',
+        help_text='Адрес, на который отправляются POST-запросы с событиями'
+    )
+
+    secret = models.CharField(
+        max_length=128,
+        default=generate_webhook_secret,
+        verbose_name='Секрет подписи',
+        help_text='Ключ HMAC-SHA256 для заголовка X-Payout-Signature'
+    )
+
+    statuses = models.JSONField(
+        default=default_webhook_statuses,
+        verbose_name='Статусы',
+        help_text='Список статусов, о переходе в которые отправляется событие'
+    )
+
+    is_active = models.BooleanField(
+        default=True,
+        verbose_name='Активен'
+    )
+
+    max_concurrency = models.PositiveSmallIntegerField(
+        default=4,
+        validators=[MinValueValidator(1), MaxValueValidator(100)],
+        verbose_name='Параллельных запросов',
+        help_text='Максимум одновременных запросов на endpoint'
+    )
+
+    max_batch_size = models.PositiveSmallIntegerField(
+        default=50,
+        validators=[MinValueValidator(1), MaxValueValidator(1000)],
+        verbose_name='Событий в запросе',
+        help_text='Максимум событий в одном запросе при накопившейся очереди'
+    )
+
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Дата создания'
+    )
+
+    class Meta:
+        verbose_name = 'Webhook endpoint'
+        verbose_name_plural = 'Webhook endpoints'
+
+    def __str__(self):
+        return self.url
+
+
+class WebhookDelivery(models.Model):
+    """
+    Событие статуса, ожидающее доставки на endpoint.
+
+    Строка пишется в той же транзакции, что и переход статуса, и удаляется
+    после успешной доставки. Не доставленные за PAYOUT_WEBHOOK_MAX_ATTEMPTS
+    попыток остаются в состоянии failed.
+    """
+
+    class State(models.TextChoices):
+        """Состояния доставки."""
+        PENDING = 'pending', 'Ожидает доставки'
+        FAILED = 'failed', 'Не доставлено'
+
+    id = models.BigAutoField(primary_key=True)
+
+    endpoint = models.ForeignKey(
+        WebhookEndpoint,
+        on_delete=models.CASCADE,
+        related_name='deliveries',
+        verbose_name='Endpoint'
+    )
+
+    payload = models.JSONField(
+        verbose_name='Событие'
+    )
+
+    state = models.CharField(
+        max_length=20,
+        choices=State.choices,
+        default=State.PENDING,
+        verbose_name='Состояние'
+    )
+
+    attempts = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Попыток'
+    )
+
+    next_attempt_at = models.DateTimeField(
+        default=timezone.now,
+        verbose_name='Следующая попытка'
+    )
+
+    last_error = models.TextField(
+        blank=True,
+        verbose_name='Последняя ошибка'
+    )
+
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Дата создания'
+    )
+
+    class Meta:
+        verbose_name = 'Доставка вебхука'
+        verbose_name_plural = 'Доставки вебхуков'
+        indexes = [
+            # Выбор созревших доставок: только ожидающие
+            models.Index(
+                fields=['next_attempt_at'],
+                name='webhook_due_idx',
+                condition=Q(state='pending'),
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.payload.get("external_id")} → {self.endpoint_id}'
+
+
+class PayoutStatusEvent(models.Model):
+    """
+    Журнал переходов статуса заявок (только вставка).
+
+    Строка пишется в той же транзакции, что и переход (payments.status_log).
+    entered_at — момент входа заявки в from_status (предыдущее событие),
+    поэтому время в статусе считается без оконных функций по всему журналу.
+    Заявки архивируются и удаляются независимо от журнала, поэтому связи
+    по внешнему ключу нет.
+    """
+    id = models.BigAutoField(primary_key=True)
+
+    external_id = models.UUIDField(
+        verbose_name='Внешний ID заявки'
+    )
+
+    currency = models.CharField(
+        max_length=3,
+        choices=PayoutRequest.Currency.choices,
+        verbose_name='Валюта'
+    )
+
+    from_status = models.CharField(
+        max_length=20,
+        choices=PayoutRequest.Status.choices,
+        blank=True,
+        verbose_name='Предыдущий статус'
+    )
+
+    to_status = models.CharField(
+        max_length=20,
+        choices=PayoutRequest.Status.choices,
+        verbose_name='Новый статус'
+    )
+
+    entered_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='Вход в предыдущий статус'
+    )
+
+    created_at = models.DateTimeField(
+        verbose_name='Дата перехода'
+    )
+
+    class Meta:
+        verbose_name = 'Событие статуса заявки'
+        verbose_name_plural = 'События статуса заявок'
+        # Индекс по created_at для выборок по времени создаёт миграция
+        # (BRIN на PostgreSQL: журнал пишется по возрастанию времени)
+        indexes = [
+            models.Index(fields=['external_id', 'created_at'], name='status_event_payout_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.external_id}: {self.from_status or "—"} → {self.to_status}'
 
     @property
-    def is_final_status(self) -> bool:
-        """Проверяет, находится ли заявка в финальном статусе."""
-        return self.status in (self.Status.COMPLETED, self.Status.FAILED, self.Status.CANCELLED)
+    def duration(self):
+        """Время в from_status (None для первого события заявки)."""
+        return None if self.entered_at is None else self.created_at - self.entered_at
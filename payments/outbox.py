@@ -0,0 +1,113 @@
+"""
+Relay outbox → брокер.
+
+Строки PayoutOutbox забираются пачками с SELECT ... FOR UPDATE SKIP LOCKED,
+поэтому несколько relay работают параллельно без двойной публикации одной
+пачки. Пачка публикуется по очередям задачами process_payouts_batch (одно
+сообщение на PAYOUT_BULK_CHUNK_SIZE заявок, одно соединение с брокером на
+пачку) и удаляется в той же транзакции. Если процесс упал после публикации,
+но до коммита, строки будут опубликованы повторно — доставка at-least-once,
+повтор безопасен (start_processing — CAS).
+"""
+import logging
+import time
+
+from collections import defaultdict
+from typing import Optional
+
+from django.conf import settings
+from django.db import transaction
+
+from .metrics import OUTBOX_PUBLISHED
+from .models import PayoutOutbox
+
+logger = logging.getLogger(__name__)
+
+
+@transaction.atomic
+def relay_outbox(batch_size: Optional[int] = None) -> int:
+    """
+    Публикация одной пачки сообщений outbox.
+    
+    Args:
+        batch_size: Сообщений в пачке (по умолчанию PAYOUT_OUTBOX_BATCH_SIZE)
+        
+    Returns:
+        Количество обработанных строк outbox
+    """
+    from core.celery import app
+    from .tasks import process_payouts_batch
+
+    batch_size = batch_size or settings.PAYOUT_OUTBOX_BATCH_SIZE
+    messages = list(
+        PayoutOutbox.objects.select_for_update(skip_locked=True)
+        .order_by('id')
+        .values_list('id', 'external_id', 'queue')[:batch_size]
+    )
+    if not messages:
+        return 0
+
+    lanes = defaultdict(dict)
+    for _, external_id, queue in messages:
+        # dict — порядок сохраняется, повторы одной заявки в пачке схлопываются
+        lanes[queue][str(external_id)] = None
+
+    chunk_size = settings.PAYOUT_BULK_CHUNK_SIZE
+    with app.producer_or_acquire() as producer:
+        for queue, external_ids in lanes.items():
+            external_ids = list(external_ids)
+            for i in range(0, len(external_ids), chunk_size):
+                process_payouts_batch.apply_async(
+                    (external_ids[i:i + chunk_size],), queue=queue, producer=producer
+                )
+            OUTBOX_PUBLISHED.labels(queue=queue).inc(len(external_ids))
+
+    PayoutOutbox.objects.filter(id__in=[message[0] for message in messages]).delete()
+    logger.info(
+        f'[Outbox] Опубликовано {len(messages)} сообщений по очередям: {", ".join(lanes)}'
+    )
+    return len(messages)
+
+
+def drain_outbox(batch_size: Optional[int] = None, max_batches: Optional[int] = None) -> int:
+    """
+    Публикация пачек, пока outbox не опустеет (не больше max_batches).
+    
+    Args:
+        batch_size: Сообщений в пачке (по умолчанию PAYOUT_OUTBOX_BATCH_SIZE)
+        max_batches: Максимум пачек (по умолчанию PAYOUT_OUTBOX_MAX_BATCHES)
+        
+    Returns:
+        Количество опубликованных сообщений
+    """
+    batch_size = batch_size or settings.PAYOUT_OUTBOX_BATCH_SIZE
+    max_batches = max_batches or settings.PAYOUT_OUTBOX_MAX_BATCHES
+    relayed = 0
+    for _ in range(max_batches):
+        count = relay_outbox(batch_size)
+        relayed += count
+        if count < batch_size:
+            break
+    return relayed
+
+
+def run_relay(poll_interval: Optional[float] = None, batch_size: Optional[int] = None) -> None:
+    """
+    Бесконечный цикл relay: публикация, пока есть сообщения, иначе пауза poll_interval.
+    
+    Args:
+        poll_interval: Пауза при пустом outbox, секунды (по умолчанию PAYOUT_OUTBOX_POLL_INTERVAL)
+        batch_size: Сообщений в пачке (по умолчанию PAYOUT_OUTBOX_BATCH_SIZE)
+    """
+    poll_interval = poll_interval if poll_interval is not None else settings.PAYOUT_OUTBOX_POLL_INTERVAL
+    batch_size = batch_size or settings.PAYOUT_OUTBOX_BATCH_SIZE
+    logger.info(f'[Outbox] Relay запущен: пачка {batch_size}, опрос каждые {poll_interval}с')
+    while True:
+        try:
+            count = relay_outbox(batch_size)
+        except Exception as exc:
+            # Брокер или БД недоступны: строки остались в outbox, повтор после паузы
+            logger.error(f'[Outbox] Ошибка публикации: {exc}')
+            count = 0
+        if count < batch_size:
+            time.sleep(poll_interval)
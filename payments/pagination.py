@@ -0,0 +1,227 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from typing import Optional
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class PayoutCursorPagination(BasePagination):
+    """
+    Keyset-пагинация по паре (поле сортировки, id).
+
+    Курсор хранит значения последней (или первой) строки страницы, поэтому
+    следующая страница выбирается условием WHERE по индексу, без OFFSET и
+    без COUNT(*). Стоимость запроса не зависит от глубины страницы.
+
+    Поле сортировки берётся из параметра ordering (первое поле), id
+    добавляется как уникальный tie-breaker.
+    """
+    page_size = 50
+    max_page_size = 500
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    default_ordering = '-created_at'
+    tiebreaker = 'id'
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """
+        Страница по курсору.
+
+        Вместо одного queryset можно передать список querysets с одинаковыми
+        полями (рабочая таблица и архив): условие курсора применяется к каждому,
+        из каждого берётся не больше page_size + 1 строк, результаты сливаются
+        в общем порядке (id уникален в обеих таблицах).
+        """
+        querysets = self.get_page_querysets(queryset, request)
+        rows = [row for queryset in querysets for row in queryset]
+        return self.build_page(rows, merge=len(querysets) > 1)
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """То же, что paginate_queryset, через async ORM (для async views)."""
+        querysets = self.get_page_querysets(queryset, request)
+        rows = [row for queryset in querysets async for row in queryset]
+        return self.build_page(rows, merge=len(querysets) > 1)
+
+    def get_page_querysets(self, queryset, request) -> list:
+        """Querysets страницы с условием курсора и лимитом page_size + 1 (без запросов к БД)."""
+        querysets = list(queryset) if isinstance(queryset, (list, tuple)) else [queryset]
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(querysets[0])
+        self.field = self.ordering.lstrip('-')
+        self.descending = self.ordering.startswith('-')
+
+        self.cursor = self.decode_cursor(request)
+        self.reverse = self.cursor is not None and self.cursor['direction'] == 'previous'
+
+        page_querysets = []
+        for queryset in querysets:
+            queryset = queryset.order_by(*self.get_order_by(self.reverse))
+            if self.cursor is not None:
+                queryset = queryset.filter(self.get_keyset_filter(queryset, self.cursor, self.reverse))
+            page_querysets.append(queryset[:self.page_size + 1])
+        return page_querysets
+
+    def build_page(self, rows: list, merge: bool) -> list:
+        """Страница из выбранных строк: слияние querysets, обрезка, флаги next/previous."""
+        if merge:
+            rows.sort(
+                key=lambda item: (
+                    self.get_item_value(item, self.field),
+                    self.get_item_value(item, self.tiebreaker),
+                ),
+                reverse=self.descending != self.reverse,
+            )
+
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+
+        if self.reverse:
+            rows.reverse()
+            self.has_next = True
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = self.cursor is not None
+
+        self.page = rows
+        return rows
+
+    def get_page_size(self, request) -> int:
+        """Размер страницы из query-параметра с ограничением сверху."""
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if size <= 0:
+            return self.page_size
+        return min(size, self.max_page_size)
+
+    def get_ordering(self, queryset) -> str:
+        """Первое поле сортировки queryset (после OrderingFilter)."""
+        ordering = queryset.query.order_by or queryset.model._meta.ordering
+        if not ordering:
+            return self.default_ordering
+        field = ordering[0]
+        if field.lstrip('-') == self.tiebreaker:
+            return self.default_ordering
+        return field
+
+    def get_order_by(self, reverse: bool) -> tuple[str, str]:
+        """Сортировка по (поле, id) в нужном направлении."""
+        descending = self.descending != reverse
+        prefix = '-' if descending else ''
+        return f'{prefix}{self.field}', f'{prefix}{self.tiebreaker}'
+
+    def get_keyset_filter(self, queryset, cursor: dict, reverse: bool) -> Q:
+        """
+        Условие «строго после курсора» в порядке выборки.
+
+        Записано как field <= value AND (field < value OR id < pk), чтобы
+        первая часть использовалась как диапазон по индексу.
+        """
+        model_field = queryset.model._meta.get_field(self.field)
+        try:
+            value = model_field.to_python(cursor['value'])
+            pk = int(cursor['id'])
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+        descending = self.descending != reverse
+        op = 'lt' if descending else 'gt'
+        return Q(**{f'{self.field}__{op}e': value}) & (
+            Q(**{f'{self.field}__{op}': value}) | Q(**{f'{self.tiebreaker}__{op}': pk})
+        )
+
+    def decode_cursor(self, request) -> Optional[dict]:
+        """Разбор курсора из query-параметра."""
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            padded = encoded + '=' * (-len(encoded) % 4)
+            cursor = json.loads(urlsafe_b64decode(padded.encode('ascii')))
+            direction = cursor['d']
+            ordering = cursor['o']
+            value, pk = cursor['v'], cursor['id']
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+        if ordering != self.ordering or direction not in ('next', 'previous'):
+            raise NotFound(self.invalid_cursor_message)
+        return {'direction': direction, 'value': value, 'id': pk}
+
+    def encode_cursor(self, item, direction: str) -> str:
+        """Ссылка на страницу после (next) или до (previous) строки item."""
+        value = self.get_item_value(item, self.field)
+        payload = {
+            'd': direction,
+            'o': self.ordering,
+            'v': value.isoformat() if hasattr(value, 'isoformat') else str(value),
+            'id': self.get_item_value(item, self.tiebreaker),
+        }
+        encoded = urlsafe_b64encode(
+            json.dumps(payload, separators=(',', ':')).encode('ascii')
+        ).decode('ascii').rstrip('=')
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, encoded)
+
+    @staticmethod
+    def get_item_value(item, name: str):
+        """Значение поля строки: модели или словаря из .values()."""
+        if isinstance(item, dict):
+            return item[name]
+        return getattr(item, name)
+
+    def get_next_link(self) -> Optional[str]:
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], 'next')
+
+    def get_previous_link(self) -> Optional[str]:
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.request.build_absolute_uri(), self.cursor_query_param)
+        return self.encode_cursor(self.page[0], 'previous')
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Курсор страницы (из ссылок next/previous).',
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': self.page_size_query_param,
+                'required': False,
+                'in': 'query',
+                'description': f'Размер страницы (максимум {self.max_page_size}).',
+                'schema': {'type': 'integer'},
+            },
+        ]
@@ -0,0 +1,192 @@
+"""
+Read-through кэш представления заявки для GET /api/v1/payouts/{external_id}/.
+
+Клиенты опрашивают заявку, пока она не станет финальной, поэтому ответ
+хранится в общем кэше Django (Redis) по external_id:
+
+- финальные заявки не меняются — TTL PAYOUT_CACHE_FINAL_TTL;
+- остальные — короткий TTL PAYOUT_CACHE_TTL;
+- каждая запись (PayoutService.transition, sweeper, partial_update) удаляет
+  ключ после коммита, удаление заявки оставляет «надгробие» на PAYOUT_CACHE_TTL;
+- при промахе из БД читает один процесс (cache.add на ключ блокировки),
+  остальные ждут его результат до PAYOUT_CACHE_LOCK_WAIT.
+
+Заполнение — через cache.add, поэтому читатель, загрузивший строку до
+коммита записи, не перезапишет надгробие. Устаревшее значение при такой
+гонке — всегда нефинальный статус, и живёт не дольше PAYOUT_CACHE_TTL.
+"""
+import asyncio
+import logging
+import time
+
+from typing import Awaitable, Callable, Iterable, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .metrics import PAYOUT_CACHE_LOOKUPS
+from .models import PayoutRequest
+
+logger = logging.getLogger(__name__)
+
+TOMBSTONE = 'deleted'
+
+
+def _cache_key(external_id) -> str:
+    return f'payouts:payout:{external_id}'
+
+
+def _lock_key(external_id) -> str:
+    return f'payouts:payout:{external_id}:lock'
+
+
+def _ttl(data: dict) -> int:
+    if data['status'] in PayoutRequest.FINAL_STATUSES:
+        return settings.PAYOUT_CACHE_FINAL_TTL
+    return settings.PAYOUT_CACHE_TTL
+
+
+def _unwrap(data):
+    return None if data == TOMBSTONE else data
+
+
+def get_payout(external_id: str, loader: Callable[[], Optional[dict]]) -> Optional[dict]:
+    """
+    Представление заявки из кэша или через loader.
+
+    Args:
+        external_id: UUID заявки из URL
+        loader: Чтение из БД; None, если заявки нет
+
+    Returns:
+        dict в формате PayoutRequestSerializer или None, если заявки нет
+    """
+    key = _cache_key(external_id)
+    try:
+        data = cache.get(key)
+    except Exception as exc:
+        logger.warning(f'[PayoutCache] Кэш недоступен: {exc}')
+        return loader()
+
+    if data is not None:
+        PAYOUT_CACHE_LOOKUPS.labels(result='hit').inc()
+        return _unwrap(data)
+
+    lock_key = _lock_key(external_id)
+    try:
+        locked = cache.add(lock_key, 1, settings.PAYOUT_CACHE_LOCK_TIMEOUT)
+        if not locked:
+            # Заявку уже читает другой процесс — ждём его результат
+            deadline = time.monotonic() + settings.PAYOUT_CACHE_LOCK_WAIT
+            while time.monotonic() < deadline:
+                time.sleep(settings.PAYOUT_CACHE_LOCK_POLL)
+                data = cache.get(key)
+                if data is not None:
+                    PAYOUT_CACHE_LOOKUPS.labels(result='wait').inc()
+                    return _unwrap(data)
+    except Exception as exc:
+        logger.warning(f'[PayoutCache] Кэш недоступен: {exc}')
+        return loader()
+
+    PAYOUT_CACHE_LOOKUPS.labels(result='miss').inc()
+    try:
+        data = loader()
+        if data is not None:
+            _fill(lambda: cache.add(key, data, _ttl(data)))
+    finally:
+        if locked:
+            _fill(lambda: cache.delete(lock_key))
+    return data
+
+
+def _fill(operation: Callable[[], object]) -> None:
+    """Запись в кэш после чтения из БД: недоступность кэша не ломает ответ."""
+    try:
+        operation()
+    except Exception as exc:
+        logger.warning(f'[PayoutCache] Кэш недоступен: {exc}')
+
+
+async def aget_payout(external_id: str, loader: Callable[[], Awaitable[Optional[dict]]]) -> Optional[dict]:
+    """
+    Async-версия get_payout (для async views): ожидание блокировки не занимает поток.
+
+    Args:
+        external_id: UUID заявки из URL
+        loader: Корутина чтения из БД; None, если заявки нет
+
+    Returns:
+        dict в формате PayoutRequestSerializer или None, если заявки нет
+    """
+    key = _cache_key(external_id)
+    try:
+        data = await cache.aget(key)
+    except Exception as exc:
+        logger.warning(f'[PayoutCache] Кэш недоступен: {exc}')
+        return await loader()
+
+    if data is not None:
+        PAYOUT_CACHE_LOOKUPS.labels(result='hit').inc()
+        return _unwrap(data)
+
+    lock_key = _lock_key(external_id)
+    try:
+        locked = await cache.aadd(lock_key, 1, settings.PAYOUT_CACHE_LOCK_TIMEOUT)
+        if not locked:
+            deadline = time.monotonic() + settings.PAYOUT_CACHE_LOCK_WAIT
+            while time.monotonic() < deadline:
+                await asyncio.sleep(settings.PAYOUT_CACHE_LOCK_POLL)
+                data = await cache.aget(key)
+                if data is not None:
+                    PAYOUT_CACHE_LOOKUPS.labels(result='wait').inc()
+                    return _unwrap(data)
+    except Exception as exc:
+        logger.warning(f'[PayoutCache] Кэш недоступен: {exc}')
+        return await loader()
+
+    PAYOUT_CACHE_LOOKUPS.labels(result='miss').inc()
+    try:
+        data = await loader()
+        if data is not None:
+            await _afill(cache.aadd(key, data, _ttl(data)))
+    finally:
+        if locked:
+            await _afill(cache.adelete(lock_key))
+    return data
+
+
+async def _afill(operation: Awaitable) -> None:
+    """Async-версия _fill."""
+    try:
+        await operation
+    except Exception as exc:
+        logger.warning(f'[PayoutCache] Кэш недоступен: {exc}')
+
+
+def invalidate(external_ids: Iterable) -> None:
+    """Удаление закэшированных заявок после коммита текущей транзакции."""
+    keys = [_cache_key(external_id) for external_id in external_ids]
+    if not keys:
+        return
+
+    def delete_keys():
+        try:
+            cache.delete_many(keys)
+        except Exception as exc:
+            logger.warning(f'[PayoutCache] Кэш недоступен, ключи не удалены: {exc}')
+
+    transaction.on_commit(delete_keys)
+
+
+def mark_deleted(external_id) -> None:
+    """Надгробие для удалённой заявки после коммита текущей транзакции."""
+    key = _cache_key(external_id)
+
+    def set_tombstone():
+        try:
+            cache.set(key, TOMBSTONE, settings.PAYOUT_CACHE_TTL)
+        except Exception as exc:
+            logger.warning(f'[PayoutCache] Кэш недоступен, надгробие не записано: {exc}')
+
+    transaction.on_commit(set_tombstone)
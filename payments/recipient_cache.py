@@ -0,0 +1,172 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+
+from collections import OrderedDict
+from typing import Optional
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from .metrics import RECIPIENT_CACHE_LOOKUPS
+
+logger = logging.getLogger(__name__)
+
+
+class RecipientValidationCache:
+    """
+    Двухуровневый кэш результатов валидации реквизитов.
+
+    Первый уровень — LRU в памяти процесса, второй — общий кэш Django (Redis).
+    Ключ — sha256 от канонического JSON реквизитов, поэтому порядок ключей
+    в recipient_details не влияет на попадание. Отрицательные результаты
+    хранятся с более коротким TTL. В общем кэше вместе с результатом хранится
+    момент истечения: при попадании локальный уровень получает только
+    оставшийся TTL, а не полный.
+    """
+
+    def __init__(
+        self,
+        max_size: int,
+        ttl: int,
+        negative_ttl: int,
+        cache_alias: str = 'default',
+        key_prefix: str = 'payouts:recipient:',
+    ):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.cache_alias = cache_alias
+        self.key_prefix = key_prefix
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits_local = 0
+        self.hits_shared = 0
+        self.misses = 0
+
+    @classmethod
+    def from_settings(cls) -> 'RecipientValidationCache':
+        return cls(
+            max_size=settings.PAYOUT_RECIPIENT_CACHE_SIZE,
+            ttl=settings.PAYOUT_RECIPIENT_CACHE_TTL,
+            negative_ttl=settings.PAYOUT_RECIPIENT_CACHE_NEGATIVE_TTL,
+        )
+
+    @staticmethod
+    def make_key(recipient_details: dict) -> str:
+        """Канонический хэш реквизитов."""
+        canonical = json.dumps(
+            recipient_details,
+            sort_keys=True,
+            separators=(',', ':'),
+            ensure_ascii=False,
+            default=str,
+        )
+        return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+    async def get(self, key: str) -> Optional[bool]:
+        """
+        Результат валидации из кэша.
+
+        Returns:
+            True/False или None при промахе
+        """
+        value = self._get_local(key)
+        if value is not None:
+            self.hits_local += 1
+            RECIPIENT_CACHE_LOOKUPS.labels(result='hit_local').inc()
+            return value
+
+        try:
+            entry = await caches[self.cache_alias].aget(self.key_prefix + key)
+        except Exception as exc:
+            logger.warning(f'[RecipientCache] Общий кэш недоступен: {exc}')
+            entry = None
+
+        remaining = None
+        if isinstance(entry, (list, tuple)) and len(entry) == 2:
+            value, expires_at = entry
+            remaining = expires_at - time.time()
+        if remaining is None or remaining <= 0:
+            self.misses += 1
+            RECIPIENT_CACHE_LOOKUPS.labels(result='miss').inc()
+            return None
+
+        self.hits_shared += 1
+        RECIPIENT_CACHE_LOOKUPS.labels(result='hit_shared').inc()
+        value = bool(value)
+        self._set_local(key, value, remaining)
+        return value
+
+    async def set(self, key: str, is_valid: bool) -> None:
+        """Сохранение результата в оба уровня кэша."""
+        ttl = self._ttl_for(is_valid)
+        self._set_local(key, is_valid, ttl)
+        try:
+            await caches[self.cache_alias].aset(
+                self.key_prefix + key, [int(is_valid), time.time() + ttl], ttl
+            )
+        except Exception as exc:
+            logger.warning(f'[RecipientCache] Общий кэш недоступен: {exc}')
+
+    def stats(self) -> dict:
+        """Счётчики попаданий и промахов."""
+        return {
+            'hits_local': self.hits_local,
+            'hits_shared': self.hits_shared,
+            'misses': self.misses,
+            'size': len(self._local),
+        }
+
+    def clear(self) -> None:
+        """Очистка локального уровня и счётчиков."""
+        with self._lock:
+            self._local.clear()
+        self.hits_local = self.hits_shared = self.misses = 0
+
+    def _ttl_for(self, is_valid: bool) -> int:
+        return self.ttl if is_valid else self.negative_ttl
+
+    def _get_local(self, key: str) -> Optional[bool]:
+        with self._lock:
+            entry = self._local.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._local[key]
+                return None
+            self._local.move_to_end(key)
+            return value
+
+    def _set_local(self, key: str, value: bool, ttl: Optional[float] = None) -> None:
+        if ttl is None:
+            ttl = self._ttl_for(value)
+        with self._lock:
+            self._local[key] = (value, time.monotonic() + ttl)
+            self._local.move_to_end(key)
+            while len(self._local) > self.max_size:
+                self._local.popitem(last=False)
+
+
+_recipient_cache: Optional[RecipientValidationCache] = None
+
+
+def get_recipient_cache() -> RecipientValidationCache:
+    """Кэш процесса (создаётся при первом обращении по текущим настройкам)."""
+    global _recipient_cache
+    if _recipient_cache is None:
+        _recipient_cache = RecipientValidationCache.from_settings()
+    return _recipient_cache
+
+
+@receiver(setting_changed)
+def reset_recipient_cache(setting: str, **kwargs) -> None:
+    """Пересоздание кэша при смене его настроек (override_settings в тестах)."""
+    global _recipient_cache
+    if setting.startswith('PAYOUT_RECIPIENT_CACHE_'):
+        _recipient_cache = None
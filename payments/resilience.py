@@ -0,0 +1,324 @@
+"""
+Защита платёжного шлюза от перегрузки.
+
+AdaptiveLimiter — AIMD-лимит параллельных запросов: растёт на 1 за «окно»
+успешных быстрых ответов и умножается на backoff_ratio при ошибке или
+ответе медленнее latency_target. CircuitBreaker после серии ошибок подряд
+перестаёт пускать запросы на reset_timeout, затем пропускает один пробный.
+
+Оба живут на event loop worker'а и общие для всех его корутин.
+"""
+import asyncio
+import logging
+import time
+
+from collections import deque
+from typing import Awaitable, Callable, Optional
+
+from django.conf import settings
+
+from core import event_loop
+
+from .gateway import GatewayError
+from .metrics import (
+    GATEWAY_CIRCUIT_STATE,
+    GATEWAY_CONCURRENCY_LIMIT,
+    GATEWAY_INFLIGHT,
+    GATEWAY_REJECTED,
+    is_multiprocess_mode,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(GatewayError):
+    """Circuit breaker открыт, запрос к шлюзу не отправлялся."""
+
+    def __init__(self, retry_after: float):
+        self.retry_after = retry_after
+        super().__init__(f'Платёжный шлюз временно недоступен, повтор через {retry_after:.0f}с')
+
+
+class GatewayOverloadedError(GatewayError):
+    """Не дождались свободного слота лимитера."""
+
+
+class AdaptiveLimiter:
+    """
+    AIMD-лимитер параллельных запросов.
+
+    Args:
+        initial_limit: Стартовый лимит
+        min_limit: Нижняя граница лимита
+        max_limit: Верхняя граница лимита
+        latency_target: Ответ медленнее этого (секунды) считается сигналом перегрузки
+        backoff_ratio: Множитель лимита при перегрузке
+        acquire_timeout: Максимальное ожидание слота, секунды
+    """
+
+    def __init__(
+        self,
+        initial_limit: int = 10,
+        min_limit: int = 1,
+        max_limit: int = 100,
+        latency_target: float = 5.0,
+        backoff_ratio: float = 0.7,
+        acquire_timeout: Optional[float] = None,
+    ):
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_target = latency_target
+        self.backoff_ratio = backoff_ratio
+        self.acquire_timeout = acquire_timeout
+        self.inflight = 0
+        self._waiters: deque[asyncio.Future] = deque()
+        self._last_decrease = float('-inf')
+        GATEWAY_CONCURRENCY_LIMIT.set(self.limit)
+
+    @property
+    def effective_limit(self) -> int:
+        return max(1, int(self.limit))
+
+    async def acquire(self) -> float:
+        """
+        Ожидание свободного слота.
+
+        Returns:
+            Момент захвата слота (передаётся в release)
+
+        Raises:
+            GatewayOverloadedError: если слот не освободился за acquire_timeout
+        """
+        if not self._waiters and self.inflight < self.effective_limit:
+            self._take()
+            return time.monotonic()
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, self.acquire_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as exc:
+            if waiter.done() and not waiter.cancelled():
+                # Слот успели выдать одновременно с таймаутом — возвращаем
+                self._put()
+            elif waiter in self._waiters:
+                self._waiters.remove(waiter)
+            if isinstance(exc, asyncio.TimeoutError):
+                GATEWAY_REJECTED.labels(reason='overloaded').inc()
+                raise GatewayOverloadedError(
+                    f'Нет свободного слота шлюза за {self.acquire_timeout}с '
+                    f'(лимит {self.effective_limit})'
+                ) from exc
+            raise
+        return time.monotonic()
+
+    def release(self, started_at: float, latency: float, ok: bool) -> None:
+        """
+        Освобождение слота и корректировка лимита.
+
+        Args:
+            started_at: Значение, полученное из acquire
+            latency: Длительность запроса, секунды
+            ok: False при ошибке шлюза
+        """
+        if not ok or latency > self.latency_target:
+            # Не больше одного уменьшения на «поколение» запросов: ответы,
+            # отправленные до прошлого уменьшения, его уже учли
+            if started_at >= self._last_decrease:
+                self.limit = max(self.min_limit, self.limit * self.backoff_ratio)
+                self._last_decrease = time.monotonic()
+                logger.warning(
+                    f'[Limiter] Перегрузка шлюза (ok={ok}, {latency:.2f}с), '
+                    f'лимит снижен до {self.effective_limit}'
+                )
+        elif self.inflight * 2 >= self.limit:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+        GATEWAY_CONCURRENCY_LIMIT.set(self.limit)
+        self._put()
+
+    def discard(self) -> None:
+        """Освобождение слота без корректировки лимита."""
+        self._put()
+
+    def _take(self) -> None:
+        self.inflight += 1
+        GATEWAY_INFLIGHT.inc()
+
+    def _put(self) -> None:
+        self.inflight -= 1
+        GATEWAY_INFLIGHT.dec()
+        while self._waiters and self.inflight < self.effective_limit:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self._take()
+                waiter.set_result(None)
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker: closed → open после failure_threshold ошибок подряд,
+    open → half-open через reset_timeout, half-open → closed после успешного
+    пробного запроса (или снова open после ошибки).
+    """
+
+    CLOSED = 'closed'
+    HALF_OPEN = 'half_open'
+    OPEN = 'open'
+
+    STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self._opened_at: Optional[float] = None
+        self._probe_in_flight = False
+        self._gauge_state: Optional[str] = None
+        if not is_multiprocess_mode():
+            # В одном процессе значение вычисляется при scrape
+            GATEWAY_CIRCUIT_STATE.set_function(lambda: self.STATE_VALUES[self._current_state()])
+        self._set_gauge()
+
+    @property
+    def state(self) -> str:
+        state = self._current_state()
+        if state != self._gauge_state:
+            # open → half-open наступает по времени, без вызовов record_*
+            self._set_gauge(state)
+        return state
+
+    def _current_state(self) -> str:
+        if self._opened_at is None:
+            return self.CLOSED
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def retry_after(self) -> float:
+        """Сколько секунд осталось до пробного запроса (0, если запросы пропускаются)."""
+        if self._opened_at is None:
+            return 0.0
+        return max(0.0, self._opened_at + self.reset_timeout - time.monotonic())
+
+    def before_call(self) -> None:
+        """
+        Проверка перед запросом.
+
+        Raises:
+            CircuitOpenError: если circuit открыт или пробный запрос уже идёт
+        """
+        state = self.state
+        if state == self.CLOSED:
+            return
+        if state == self.HALF_OPEN and not self._probe_in_flight:
+            self._probe_in_flight = True
+            self._set_gauge()
+            return
+        GATEWAY_REJECTED.labels(reason='circuit_open').inc()
+        raise CircuitOpenError(self.retry_after() or 1.0)
+
+    def record_success(self) -> None:
+        if self._opened_at is not None:
+            logger.info('[Circuit] Шлюз восстановился, circuit закрыт')
+        self.failures = 0
+        self._opened_at = None
+        self._probe_in_flight = False
+        self._set_gauge()
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self._probe_in_flight or (self._opened_at is None and self.failures >= self.failure_threshold):
+            logger.warning(
+                f'[Circuit] {self.failures} ошибок шлюза подряд, '
+                f'circuit открыт на {self.reset_timeout}с'
+            )
+            self._opened_at = time.monotonic()
+        self._probe_in_flight = False
+        self._set_gauge()
+
+    def release_probe(self) -> None:
+        """Пробный запрос не состоялся — право на него получит следующий."""
+        self._probe_in_flight = False
+
+    def _set_gauge(self, state: Optional[str] = None) -> None:
+        self._gauge_state = state or self._current_state()
+        GATEWAY_CIRCUIT_STATE.set(self.STATE_VALUES[self._gauge_state])
+
+
+class GatewayGuard:
+    """Лимитер и circuit breaker вокруг вызовов шлюза."""
+
+    def __init__(self, limiter: AdaptiveLimiter, breaker: CircuitBreaker):
+        self.limiter = limiter
+        self.breaker = breaker
+
+    @classmethod
+    def from_settings(cls) -> 'GatewayGuard':
+        return cls(
+            limiter=AdaptiveLimiter(
+                initial_limit=settings.PAYOUT_GATEWAY_CONCURRENCY_INITIAL,
+                min_limit=settings.PAYOUT_GATEWAY_CONCURRENCY_MIN,
+                max_limit=settings.PAYOUT_GATEWAY_CONCURRENCY_MAX,
+                latency_target=settings.PAYOUT_GATEWAY_LATENCY_TARGET,
+                acquire_timeout=settings.PAYOUT_GATEWAY_ACQUIRE_TIMEOUT,
+            ),
+            breaker=CircuitBreaker(
+                failure_threshold=settings.PAYOUT_GATEWAY_CIRCUIT_FAILURES,
+                reset_timeout=settings.PAYOUT_GATEWAY_CIRCUIT_RESET_TIMEOUT,
+            ),
+        )
+
+    async def call(self, func: Callable[..., Awaitable], *args, **kwargs):
+        """
+        Вызов шлюза через circuit breaker и лимитер.
+
+        Ошибкой для обоих считается GatewayError или таймаут; отклонённый
+        шлюзом платёж — нормальный ответ.
+
+        Raises:
+            CircuitOpenError: circuit открыт
+            GatewayOverloadedError: не дождались слота лимитера
+        """
+        self.breaker.before_call()
+        try:
+            started_at = await self.limiter.acquire()
+        except BaseException:
+            self.breaker.release_probe()
+            raise
+
+        try:
+            result = await func(*args, **kwargs)
+        except (GatewayError, asyncio.TimeoutError):
+            self.limiter.release(started_at, time.monotonic() - started_at, ok=False)
+            self.breaker.record_failure()
+            raise
+        except BaseException:
+            # Отмена или ошибка не шлюза — слот возвращается без оценки
+            self.limiter.discard()
+            self.breaker.release_probe()
+            raise
+
+        self.limiter.release(started_at, time.monotonic() - started_at, ok=True)
+        self.breaker.record_success()
+        return result
+
+    def defer_for(self) -> float:
+        """
+        На сколько секунд отложить новую заявку, не переводя её в processing.
+
+        Returns:
+            0, если запрос к шлюзу сейчас будет пропущен
+        """
+        state = self.breaker.state
+        if state == CircuitBreaker.OPEN:
+            return self.breaker.retry_after()
+        if state == CircuitBreaker.HALF_OPEN and self.breaker._probe_in_flight:
+            return 1.0
+        return 0.0
+
+
+def get_gateway_guard() -> GatewayGuard:
+    """GatewayGuard, общий для всех корутин event loop worker'а."""
+    return event_loop.get_resource('gateway_guard', GatewayGuard.from_settings)
@@ -0,0 +1,140 @@
+"""
+Маршрутизация задач выплат по очередям Celery.
+
+Каждая «полоса» — отдельная очередь со своим пулом worker'ов, поэтому
+поток мелких выплат в одной валюте не задерживает срочные и крупные.
+"""
+import logging
+
+from decimal import Decimal
+from typing import Iterable, Optional
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from kombu.exceptions import OperationalError
+
+from .models import PayoutRequest
+
+logger = logging.getLogger(__name__)
+
+ROUTED_TASKS = (
+    'payments.tasks.process_payout_async',
+    'payments.tasks.process_payouts_batch',
+)
+
+
+def queue_for(currency: str, amount: Decimal, priority: str) -> str:
+    """
+    Очередь для заявки.
+
+    Правила по порядку: явный высокий приоритет или сумма не меньше порога
+    PAYOUT_HIGH_VALUE_AMOUNTS для валюты → PAYOUT_QUEUE_HIGH; низкий
+    приоритет → PAYOUT_QUEUE_LOW; валюта из PAYOUT_CURRENCY_QUEUES → её
+    очередь; иначе PAYOUT_QUEUE_DEFAULT.
+
+    Args:
+        currency: Код валюты
+        amount: Сумма
+        priority: Приоритет заявки
+
+    Returns:
+        Имя очереди
+    """
+    if priority == PayoutRequest.Priority.HIGH:
+        return settings.PAYOUT_QUEUE_HIGH
+
+    threshold = settings.PAYOUT_HIGH_VALUE_AMOUNTS.get(currency)
+    if threshold is not None and Decimal(amount) >= Decimal(threshold):
+        return settings.PAYOUT_QUEUE_HIGH
+
+    if priority == PayoutRequest.Priority.LOW:
+        return settings.PAYOUT_QUEUE_LOW
+
+    return settings.PAYOUT_CURRENCY_QUEUES.get(currency, settings.PAYOUT_QUEUE_DEFAULT)
+
+
+def payout_queue(payout: PayoutRequest) -> str:
+    """Очередь для экземпляра заявки."""
+    return queue_for(payout.currency, payout.amount, payout.priority)
+
+
+def lane_queues() -> list[str]:
+    """Все очереди выплат от самой срочной к самой низкоприоритетной."""
+    queues = [
+        settings.PAYOUT_QUEUE_HIGH,
+        settings.PAYOUT_QUEUE_DEFAULT,
+        *settings.PAYOUT_CURRENCY_QUEUES.values(),
+        settings.PAYOUT_QUEUE_LOW,
+    ]
+    return list(dict.fromkeys(queues))
+
+
+def most_urgent_queue(queues: Iterable[str]) -> Optional[str]:
+    """Самая срочная очередь из набора (для пачки с заявками разных полос)."""
+    order = {queue: rank for rank, queue in enumerate(lane_queues())}
+    return min(queues, key=lambda queue: order.get(queue, len(order)), default=None)
+
+
+def route_task(name, args, kwargs, options, task=None, **kw) -> Optional[dict]:
+    """
+    Роутер Celery (CELERY_TASK_ROUTES) для задач выплат.
+
+    Очередь, явно переданная в apply_async(queue=...), не переопределяется:
+    relay outbox, повторы и переотправки задач выплат передают её сами, поэтому
+    запрос к БД выполняется только для публикаций без очереди. Полоса
+    определяется по заявкам из аргументов задачи одним запросом; для пачки —
+    самая срочная полоса среди её заявок.
+    """
+    if name not in ROUTED_TASKS or options.get('queue'):
+        return None
+
+    external_ids = (kwargs or {}).get('external_ids') or (kwargs or {}).get('external_id')
+    if external_ids is None and args:
+        external_ids = args[0]
+    if external_ids is None:
+        return None
+    if isinstance(external_ids, str):
+        external_ids = [external_ids]
+
+    try:
+        rows = PayoutRequest.objects.filter(external_id__in=external_ids).values_list(
+            'currency', 'amount', 'priority'
+        )
+        queue = most_urgent_queue({queue_for(*row) for row in rows})
+    except (ValueError, ValidationError) as exc:
+        logger.warning(f'[Routing] Не удалось определить очередь для {name}: {exc}')
+        queue = None
+
+    return {'queue': queue or settings.PAYOUT_QUEUE_DEFAULT}
+
+
+def queue_depths() -> dict[str, int]:
+    """
+    Количество сообщений в каждой очереди выплат у брокера.
+
+    Returns:
+        {очередь: глубина}; пустой dict, если брокер недоступен
+    """
+    from core.celery import app
+
+    if app.conf.task_always_eager:
+        return {}
+
+    depths = {}
+    conn = app.connection_for_read()
+    try:
+        conn.ensure_connection(max_retries=1, interval_start=0)
+        channel = conn.default_channel
+        for queue in lane_queues():
+            try:
+                depths[queue] = channel.queue_declare(queue=queue, passive=True).message_count
+            except conn.channel_errors:
+                # Очереди ещё нет у брокера; AMQP при этом закрывает канал
+                depths[queue] = 0
+                channel = conn.channel()
+    except (OperationalError, *conn.connection_errors) as exc:
+        logger.warning(f'[Routing] Брокер недоступен, глубина очередей неизвестна: {exc}')
+        return {}
+    finally:
+        conn.release()
+    return depths
@@ -1,5 +1,13 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
 from rest_framework import serializers
 
+from . import stats, status_log
+from .dispatch import enqueue_payouts
 from .models import PayoutRequest
 
 
@@ -15,6 +23,10 @@ class PayoutRequestSerializer(serializers.ModelSerializer):
         source='get_currency_display',
         read_only=True
     )
+    priority_display = serializers.CharField(
+        source='get_priority_display',
+        read_only=True
+    )
 
     class Meta:
         model = PayoutRequest
@@ -26,6 +38,8 @@ class PayoutRequestSerializer(serializers.ModelSerializer):
             'recipient_details',
             'status',
             'status_display',
+            'priority',
+            'priority_display',
             'description',
             'created_at',
             'updated_at',
@@ -65,6 +79,94 @@ class PayoutRequestSerializer(serializers.ModelSerializer):
         return value
 
 
+class PayoutRequestFastSerializer:
+    """
+    Быстрый read-only сериализатор для list/retrieve/export.
+    
+    Работает со строками из .values(value_fields) и собирает словари напрямую,
+    без field-машинерии DRF. Подписи статуса и валюты берутся из заранее
+    построенных словарей. Результат совпадает с PayoutRequestSerializer байт в байт.
+    """
+    fields = PayoutRequestSerializer.Meta.fields
+    value_fields = (
+        'id',
+        'external_id',
+        'amount',
+        'currency',
+        'recipient_details',
+        'status',
+        'priority',
+        'description',
+        'created_at',
+        'updated_at',
+    )
+    status_labels = dict(PayoutRequest.Status.choices)
+    currency_labels = dict(PayoutRequest.Currency.choices)
+    priority_labels = dict(PayoutRequest.Priority.choices)
+    amount_quantum = Decimal(1).scaleb(-PayoutRequest._meta.get_field('amount').decimal_places)
+
+    @classmethod
+    def serialize(cls, rows) -> list[dict]:
+        """Сериализация списка строк из .values(value_fields)."""
+        tz = timezone.get_current_timezone()
+        to_representation = cls.to_representation
+        return [to_representation(row, tz) for row in rows]
+
+    @classmethod
+    def to_representation(cls, row: dict, tz=None) -> dict:
+        """Представление одной строки в формате PayoutRequestSerializer."""
+        tz = tz or timezone.get_current_timezone()
+        currency = row['currency']
+        payout_status = row['status']
+        priority = row['priority']
+        return {
+            'external_id': str(row['external_id']),
+            'amount': '{:f}'.format(row['amount'].quantize(cls.amount_quantum)),
+            'currency': currency,
+            'currency_display': cls.currency_labels.get(currency, currency),
+            'recipient_details': row['recipient_details'],
+            'status': payout_status,
+            'status_display': cls.status_labels.get(payout_status, payout_status),
+            'priority': priority,
+            'priority_display': cls.priority_labels.get(priority, priority),
+            'description': row['description'],
+            'created_at': cls._format_datetime(row['created_at'], tz),
+            'updated_at': cls._format_datetime(row['updated_at'], tz),
+        }
+
+    @classmethod
+    def status_event(cls, external_id, payout_status: str, updated_at, tz=None) -> dict:
+        """Событие смены статуса в формате status_representation."""
+        return {
+            'external_id': str(external_id),
+            'status': payout_status,
+            'status_display': cls.status_labels.get(payout_status, payout_status),
+            'is_final': payout_status in PayoutRequest.FINAL_STATUSES,
+            'updated_at': cls._format_datetime(updated_at, tz or timezone.get_current_timezone()),
+        }
+
+    @staticmethod
+    def status_representation(data: dict) -> dict:
+        """Краткое представление для опроса статуса (из полного представления заявки)."""
+        return {
+            'external_id': data['external_id'],
+            'status': data['status'],
+            'status_display': data['status_display'],
+            'is_final': data['status'] in PayoutRequest.FINAL_STATUSES,
+            'updated_at': data['updated_at'],
+        }
+
+    @staticmethod
+    def _format_datetime(value, tz) -> str:
+        """ISO 8601 в текущей таймзоне, как у DateTimeField в DRF."""
+        if timezone.is_naive(value):
+            value = timezone.make_aware(value, tz)
+        value = value.astimezone(tz).isoformat()
+        if value.endswith('+00:00'):
+            value = value[:-6] + 'Z'
+        return value
+
+
 class PayoutRequestCreateSerializer(PayoutRequestSerializer):
     """
     Сериализатор для создания заявки (статус устанавливается автоматически).
@@ -73,6 +175,57 @@ class PayoutRequestCreateSerializer(PayoutRequestSerializer):
         read_only_fields = ['id', 'external_id', 'status', 'created_at', 'updated_at']
 
 
+class PayoutRequestBulkListSerializer(serializers.ListSerializer):
+    """
+    Список заявок для пакетного создания.
+    
+    Каждая строка валидируется отдельно: невалидные строки попадают в
+    row_errors и не мешают созданию остальных.
+    """
+
+    def to_internal_value(self, data):
+        """Построчная валидация с накоплением ошибок по индексам."""
+        if not isinstance(data, list):
+            self.fail('not_a_list', input_type=type(data).__name__)
+        if not data:
+            self.fail('empty')
+        if len(data) > settings.PAYOUT_BULK_MAX_ITEMS:
+            self.fail('max_length', max_length=settings.PAYOUT_BULK_MAX_ITEMS)
+        
+        self.row_indexes = []
+        self.row_errors = {}
+        validated = []
+        for index, item in enumerate(data):
+            try:
+                validated.append(self.run_child_validation(item))
+            except serializers.ValidationError as exc:
+                self.row_errors[index] = exc.detail
+            else:
+                self.row_indexes.append(index)
+        
+        return validated
+
+    def create(self, validated_data):
+        """Создание заявок одним bulk_create и запись в outbox в той же транзакции."""
+        with transaction.atomic():
+            payouts = PayoutRequest.objects.bulk_create(
+                [PayoutRequest(**attrs) for attrs in validated_data],
+                batch_size=1000
+            )
+            stats.record_created(payouts)
+            status_log.record_created(payouts)
+            enqueue_payouts(payouts)
+        return payouts
+
+
+class PayoutRequestBulkCreateSerializer(PayoutRequestCreateSerializer):
+    """
+    Сериализатор строки пакетного создания (используется с many=True).
+    """
+    class Meta(PayoutRequestCreateSerializer.Meta):
+        list_serializer_class = PayoutRequestBulkListSerializer
+
+
 class PayoutRequestUpdateSerializer(serializers.ModelSerializer):
     """
     Сериализатор для обновления заявки (только статус и описание).
@@ -91,17 +244,7 @@ class PayoutRequestUpdateSerializer(serializers.ModelSerializer):
         # Валидация допустимых переходов статусов
         if self.instance:
             current = self.instance.status
-            allowed_transitions = {
-                PayoutRequest.Status.PENDING: [
-                    PayoutRequest.Status.PROCESSING,
-                    PayoutRequest.Status.CANCELLED
-                ],
-                PayoutRequest.Status.PROCESSING: [
-                    PayoutRequest.Status.COMPLETED,
-                    PayoutRequest.Status.FAILED,
-                    PayoutRequest.Status.CANCELLED
-                ],
-            }
+            allowed_transitions = PayoutRequest.ALLOWED_TRANSITIONS
             
             if current in allowed_transitions and value not in allowed_transitions[current]:
                 allowed = [s.value for s in allowed_transitions.get(current, [])]
@@ -111,3 +254,81 @@ class PayoutRequestUpdateSerializer(serializers.ModelSerializer):
         
         return value
 
+
+class PayoutBulkTransitionFilterSerializer(serializers.Serializer):
+    """
+    Фильтр заявок для массового перехода (хотя бы одно условие).
+    """
+    status = serializers.ListField(
+        child=serializers.ChoiceField(choices=PayoutRequest.Status.choices),
+        required=False,
+        allow_empty=False,
+    )
+    currency = serializers.ChoiceField(choices=PayoutRequest.Currency.choices, required=False)
+    priority = serializers.ChoiceField(choices=PayoutRequest.Priority.choices, required=False)
+    created_after = serializers.DateTimeField(required=False)
+    created_before = serializers.DateTimeField(required=False)
+
+    def validate(self, attrs):
+        if not attrs:
+            raise serializers.ValidationError('Укажите хотя бы одно условие фильтра.')
+        return attrs
+
+
+BULK_TRANSITION_STATUSES = (PayoutRequest.Status.CANCELLED, PayoutRequest.Status.FAILED)
+
+
+class PayoutBulkTransitionSerializer(serializers.Serializer):
+    """
+    Массовый переход статуса: список external_id или фильтр.
+
+    Целевой статус — только cancelled или failed: массовый processing не
+    отправляет заявки в обработку, а completed не проводит выплату.
+    """
+    status = serializers.ChoiceField(choices=[
+        (value, label) for value, label in PayoutRequest.Status.choices if value in BULK_TRANSITION_STATUSES
+    ])
+    ids = serializers.ListField(
+        child=serializers.UUIDField(),
+        required=False,
+        allow_empty=False,
+        max_length=settings.PAYOUT_BULK_TRANSITION_MAX_IDS,
+    )
+    filter = PayoutBulkTransitionFilterSerializer(required=False)
+
+    def validate(self, attrs):
+        if ('ids' in attrs) == ('filter' in attrs):
+            raise serializers.ValidationError('Укажите либо ids, либо filter.')
+        return attrs
+
+    def filter_queryset(self, queryset):
+        """Заявки по условиям filter."""
+        conditions = self.validated_data['filter']
+        lookups = {
+            'status': 'status__in',
+            'currency': 'currency',
+            'priority': 'priority',
+            'created_after': 'created_at__gte',
+            'created_before': 'created_at__lt',
+        }
+        return queryset.filter(**{lookups[name]: value for name, value in conditions.items()})
+
+
+class PayoutTimeInStateQuerySerializer(serializers.Serializer):
+    """
+    Параметры запроса времени в статусах: период и группировка.
+    """
+    since = serializers.DateTimeField(required=False)
+    until = serializers.DateTimeField(required=False)
+    group = serializers.ChoiceField(choices=['hour', 'total'], default='hour')
+
+    def validate(self, attrs):
+        attrs.setdefault('until', timezone.now())
+        attrs.setdefault('since', attrs['until'] - timedelta(days=1))
+        if attrs['since'] >= attrs['until']:
+            raise serializers.ValidationError('since должен быть раньше until.')
+        if attrs['until'] - attrs['since'] > timedelta(days=settings.PAYOUT_TIME_IN_STATE_MAX_DAYS):
+            raise serializers.ValidationError(
+                f'Период не может быть длиннее {settings.PAYOUT_TIME_IN_STATE_MAX_DAYS} дней.'
+            )
+        return attrs
@@ -1,12 +1,21 @@
 import logging
+import uuid
 
 from decimal import Decimal
 from typing import Optional
 from dataclasses import dataclass
 
-from django.db import transaction
+from django.db import connection, transaction
+from django.utils import timezone
 
+from . import payout_cache, stats, status_log
+from .events import publish_status
+from .gateway import get_gateway
+from .metrics import PAYOUTS_FINALIZED
 from .models import PayoutRequest
+from .recipient_cache import get_recipient_cache
+from .resilience import get_gateway_guard
+from .webhooks import enqueue_webhooks
 
 logger = logging.getLogger(__name__)
 
@@ -22,9 +31,73 @@ class PayoutResult:
 class PayoutService:
     """Сервис для обработки заявок на выплату (используется в Celery tasks)."""
     
-    @staticmethod
-    @transaction.atomic
-    def start_processing(external_id: str) -> Optional[PayoutRequest]:
+    # Целевой статус → статус, из которого в него можно перейти
+    TRANSITIONS = {
+        PayoutRequest.Status.PROCESSING: PayoutRequest.Status.PENDING,
+        PayoutRequest.Status.COMPLETED: PayoutRequest.Status.PROCESSING,
+        PayoutRequest.Status.FAILED: PayoutRequest.Status.PROCESSING,
+    }
+    
+    @classmethod
+    def transition(cls, external_id: str, to_status: str) -> tuple[Optional[PayoutRequest], Optional[str]]:
+        """
+        Атомарный переход статуса одним условным UPDATE (compare-and-set).
+        
+        UPDATE ... WHERE external_id = %s AND status = %s RETURNING ...
+        не держит блокировку строки между запросами: если заявку уже перевёл
+        другой процесс, UPDATE просто не найдёт строку. Агрегат payments.stats
+        и очередь вебхуков обновляются в той же транзакции, кэш заявки
+        сбрасывается и событие статуса публикуется после коммита.
+        
+        Args:
+            external_id: UUID заявки
+            to_status: Целевой статус (ключ TRANSITIONS)
+            
+        Returns:
+            (payout, None) при успехе или (None, текущий статус);
+            текущий статус None, если заявка не найдена
+        """
+        from_status = cls.TRANSITIONS[to_status]
+        
+        try:
+            external_id = uuid.UUID(str(external_id))
+        except ValueError:
+            return None, None
+        
+        opts = PayoutRequest._meta
+        qn = connection.ops.quote_name
+        columns = ', '.join(qn(field.column) for field in opts.concrete_fields)
+        sql = (
+            f'UPDATE {qn(opts.db_table)} '
+            f'SET {qn("status")} = %s, {qn("updated_at")} = %s '
+            f'WHERE {qn("external_id")} = %s AND {qn("status")} = %s '
+            f'RETURNING {columns}'
+        )
+        params = [
+            to_status,
+            opts.get_field('updated_at').get_db_prep_value(timezone.now(), connection),
+            opts.get_field('external_id').get_db_prep_value(external_id, connection),
+            from_status,
+        ]
+        
+        with transaction.atomic():
+            payouts = list(PayoutRequest.objects.raw(sql, params))
+            if payouts:
+                payout = payouts[0]
+                stats.record_transition(payout.currency, payout.amount, from_status, to_status)
+                status_log.record([(payout, from_status)])
+                payout_cache.invalidate([payout.external_id])
+                publish_status([payout])
+                enqueue_webhooks([payout])
+                return payout, None
+        
+        current = PayoutRequest.objects.filter(
+            external_id=external_id
+        ).values_list('status', flat=True).first()
+        return None, current
+    
+    @classmethod
+    def start_processing(cls, external_id: str) -> Optional[PayoutRequest]:
         """
         Начало обработки заявки (pending → processing).
         
@@ -34,28 +107,48 @@ class PayoutService:
         Returns:
             PayoutRequest или None если заявка уже обработана
         """
-        try:
-            payout = PayoutRequest.objects.select_for_update().get(
-                external_id=external_id
-            )
-        except PayoutRequest.DoesNotExist:
-            logger.error(f'Заявка {external_id} не найдена')
-            return None
+        payout, current = cls.transition(external_id, PayoutRequest.Status.PROCESSING)
         
-        if payout.status != PayoutRequest.Status.PENDING:
-            logger.warning(
-                f'Заявка {external_id} уже обработана, статус: {payout.status}'
-            )
+        if payout is None:
+            if current is None:
+                logger.error(f'Заявка {external_id} не найдена')
+            else:
+                logger.warning(
+                    f'Заявка {external_id} уже обработана, статус: {current}'
+                )
             return None
         
-        payout.status = PayoutRequest.Status.PROCESSING
-        payout.save(update_fields=['status', 'updated_at'])
         logger.info(f'Заявка {external_id}: статус → processing')
         return payout
     
     @staticmethod
-    @transaction.atomic
-    def complete_payout(external_id: str) -> PayoutResult:
+    def resume_processing(external_id: str) -> Optional[PayoutRequest]:
+        """
+        Продолжение обработки заявки, оставшейся в processing.
+        
+        Используется повтором задачи, когда исход запроса к шлюзу неизвестен:
+        повторный запрос идёт с тем же Idempotency-Key (external_id).
+        
+        Args:
+            external_id: UUID заявки
+            
+        Returns:
+            PayoutRequest или None если заявка не в processing
+        """
+        try:
+            external_id = uuid.UUID(str(external_id))
+        except ValueError:
+            return None
+        
+        payout = PayoutRequest.objects.filter(
+            external_id=external_id, status=PayoutRequest.Status.PROCESSING
+        ).first()
+        if payout is not None:
+            logger.info(f'Заявка {external_id}: продолжение обработки')
+        return payout
+    
+    @classmethod
+    def complete_payout(cls, external_id: str) -> PayoutResult:
         """
         Успешное завершение обработки (processing → completed).
         
@@ -65,20 +158,12 @@ class PayoutService:
         Returns:
             PayoutResult с результатом операции
         """
-        try:
-            payout = PayoutRequest.objects.select_for_update().get(
-                external_id=external_id
-            )
-        except PayoutRequest.DoesNotExist:
-            return PayoutResult(
-                success=False,
-                external_id=str(external_id),
-                status='error',
-                message='Заявка не найдена'
-            )
+        payout, current = cls.transition(external_id, PayoutRequest.Status.COMPLETED)
         
-        payout.status = PayoutRequest.Status.COMPLETED
-        payout.save(update_fields=['status', 'updated_at'])
+        if payout is None:
+            return cls._rejected_result(external_id, current)
+        
+        PAYOUTS_FINALIZED.labels(status=payout.status, currency=payout.currency).inc()
         logger.info(f'Заявка {external_id}: успешно завершена ✓')
         
         return PayoutResult(
@@ -88,9 +173,8 @@ class PayoutService:
             message='Выплата выполнена успешно'
         )
     
-    @staticmethod
-    @transaction.atomic
-    def fail_payout(external_id: str, reason: str = '') -> PayoutResult:
+    @classmethod
+    def fail_payout(cls, external_id: str, reason: str = '') -> PayoutResult:
         """
         Неуспешное завершение обработки (processing → failed).
         
@@ -101,11 +185,25 @@ class PayoutService:
         Returns:
             PayoutResult с результатом операции
         """
-        try:
-            payout = PayoutRequest.objects.select_for_update().get(
-                external_id=external_id
-            )
-        except PayoutRequest.DoesNotExist:
+        payout, current = cls.transition(external_id, PayoutRequest.Status.FAILED)
+        
+        if payout is None:
+            return cls._rejected_result(external_id, current)
+        
+        PAYOUTS_FINALIZED.labels(status=payout.status, currency=payout.currency).inc()
+        logger.warning(f'Заявка {external_id}: ошибка — {reason}')
+        
+        return PayoutResult(
+            success=False,
+            external_id=str(external_id),
+            status=payout.status,
+            message=reason or 'Ошибка обработки выплаты'
+        )
+    
+    @staticmethod
+    def _rejected_result(external_id: str, current: Optional[str]) -> PayoutResult:
+        """Результат для не найденной заявки или проигранной гонки."""
+        if current is None:
             return PayoutResult(
                 success=False,
                 external_id=str(external_id),
@@ -113,21 +211,45 @@ class PayoutService:
                 message='Заявка не найдена'
             )
         
-        payout.status = PayoutRequest.Status.FAILED
-        payout.save(update_fields=['status', 'updated_at'])
-        logger.warning(f'Заявка {external_id}: ошибка — {reason}')
-        
+        logger.warning(
+            f'Заявка {external_id}: переход отклонён, текущий статус: {current}'
+        )
         return PayoutResult(
             success=False,
             external_id=str(external_id),
-            status=payout.status,
-            message=reason or 'Ошибка обработки выплаты'
+            status=current,
+            message=f'Недопустимый переход статуса из "{current}"'
         )
     
     @staticmethod
     async def validate_recipient(recipient_details: dict) -> bool:
         """
-        Асинхронная валидация реквизитов получателя.
+        Асинхронная валидация реквизитов получателя с кэшированием.
+        
+        Результат кэшируется по хэшу реквизитов (LRU в процессе + Redis),
+        повторные получатели не ходят во внешний сервис.
+        
+        Args:
+            recipient_details: Реквизиты для проверки
+            
+        Returns:
+            True если реквизиты валидны
+        """
+        recipient_cache = get_recipient_cache()
+        key = recipient_cache.make_key(recipient_details)
+        
+        cached = await recipient_cache.get(key)
+        if cached is not None:
+            return cached
+        
+        is_valid = await PayoutService.check_recipient(recipient_details)
+        await recipient_cache.set(key, is_valid)
+        return is_valid
+    
+    @staticmethod
+    async def check_recipient(recipient_details: dict) -> bool:
+        """
+        Проверка реквизитов получателя без кэша.
         
         В реальности здесь был бы запрос к внешнему API.
         
@@ -161,31 +283,36 @@ class PayoutService:
     async def process_payment_gateway(
         amount: Decimal,
         currency: str,
-        recipient_details: dict
+        recipient_details: dict,
+        external_id: Optional[str] = None
     ) -> tuple[bool, str]:
         """
         Асинхронный запрос к платёжному шлюзу.
         
-        В реальности здесь был бы HTTP запрос к API банка/платёжной системы.
+        Адаптер шлюза выбирается настройкой PAYOUT_GATEWAY и живёт всё время
+        работы event loop worker'а (пул соединений переиспользуется).
+        Вызов идёт через общий GatewayGuard: адаптивный лимит параллельных
+        запросов и circuit breaker.
         
         Args:
             amount: Сумма
             currency: Валюта
             recipient_details: Реквизиты
+            external_id: UUID заявки (ключ идемпотентности для шлюза)
             
         Returns:
             (success, message)
+            
+        Raises:
+            GatewayError: шлюз недоступен, перегружен или circuit открыт
         """
-        import asyncio
-        import random
-        
-        await asyncio.sleep(random.uniform(1, 3))
-        
-        if random.random() < 0.1:
-            return False, 'Платёжный шлюз вернул ошибку: недостаточно средств'
-        
-        logger.info(
-            f'Платёжный шлюз: перевод {amount} {currency} на '
-            f'{recipient_details.get("type")} выполнен'
+        success, message = await get_gateway_guard().call(
+            get_gateway().pay, amount, currency, recipient_details, external_id=external_id
         )
-        return True, 'Платёж успешно проведён'
+        
+        if success:
+            logger.info(
+                f'Платёжный шлюз: перевод {amount} {currency} на '
+                f'{recipient_details.get("type")} выполнен'
+            )
+        return success, message
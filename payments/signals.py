@@ -1,30 +1,34 @@
 import logging
 
-from django.db import transaction
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 
-from .models import PayoutRequest
+from . import stats, status_log
+from .dispatch import enqueue_payouts
+from .models import PayoutRequest, WebhookEndpoint
+from .webhooks import reset_endpoints_cache
 
 logger = logging.getLogger(__name__)
 
 
 @receiver(post_save, sender=PayoutRequest)
 def on_payout_created(sender, instance: PayoutRequest, created: bool, **kwargs):
-    """Запуск Celery задачи при создании заявки."""
+    """Учёт в агрегате и запись в outbox при создании заявки (в той же транзакции)."""
     if not created:
         return
     
-    external_id = str(instance.external_id)
+    stats.record_created([instance])
+    status_log.record_created([instance])
+    enqueue_payouts([instance])
     
     logger.info(
-        f'[Signal] Заявка {external_id} создана, '
-        f'запуск асинхронной обработки...'
+        f'[Signal] Заявка {instance.external_id} создана, '
+        f'записана в outbox для асинхронной обработки'
     )
-    
-    def send_task():
-        from .tasks import process_payout_async
-        process_payout_async.delay(external_id)
-    
-    transaction.on_commit(send_task)
 
+
+@receiver(post_save, sender=WebhookEndpoint)
+@receiver(post_delete, sender=WebhookEndpoint)
+def on_webhook_endpoint_changed(sender, **kwargs):
+    """Сброс кэша подписок процесса (остальные процессы — по TTL)."""
+    reset_endpoints_cache()
@@ -0,0 +1,206 @@
+"""
+Инкрементальный агрегат заявок по статусу и валюте.
+
+Каждое изменение заявки (создание, переход статуса, удаление) прибавляет
+дельты к PayoutStatsShard в той же транзакции одним INSERT ... ON CONFLICT
+DO UPDATE. Шард выбирается случайно, поэтому параллельные транзакции
+обычно обновляют разные строки. Чтение суммирует шарды: размер таблицы
+ограничен статусы × валюты × PAYOUT_STATS_SHARDS и не зависит от числа заявок.
+"""
+import logging
+import random
+
+from collections import defaultdict
+from decimal import Decimal
+from typing import Iterable
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, DecimalField, Sum
+
+from .models import PayoutRequest, PayoutRequestArchive, PayoutStatsShard
+
+logger = logging.getLogger(__name__)
+
+AMOUNT_QUANTUM = Decimal('0.01')
+
+
+def record(deltas: Iterable[tuple[str, str, int, Decimal]]) -> None:
+    """
+    Применение дельт к агрегату.
+
+    Должна вызываться внутри транзакции, изменяющей сами заявки.
+
+    Args:
+        deltas: (статус, валюта, дельта количества, дельта суммы)
+    """
+    merged = defaultdict(lambda: [0, Decimal('0')])
+    for payout_status, currency, count, amount in deltas:
+        merged[(payout_status, currency)][0] += count
+        merged[(payout_status, currency)][1] += Decimal(amount)
+    merged = {key: value for key, value in merged.items() if value[0] or value[1]}
+    if not merged:
+        return
+
+    shard = random.randrange(settings.PAYOUT_STATS_SHARDS)
+    opts = PayoutStatsShard._meta
+    qn = connection.ops.quote_name
+    table = qn(opts.db_table)
+    amount_field = opts.get_field('total_amount')
+
+    # Строки в одном порядке во всех транзакциях — без взаимных блокировок
+    params = []
+    for (payout_status, currency), (count, amount) in sorted(merged.items()):
+        params += [
+            payout_status,
+            currency,
+            shard,
+            count,
+            amount_field.get_db_prep_value(amount, connection),
+        ]
+
+    values = ', '.join(['(%s, %s, %s, %s, %s)'] * len(merged))
+    sql = (
+        f'INSERT INTO {table} '
+        f'({qn("status")}, {qn("currency")}, {qn("shard")}, {qn("total_count")}, {qn("total_amount")}) '
+        f'VALUES {values} '
+        f'ON CONFLICT ({qn("status")}, {qn("currency")}, {qn("shard")}) DO UPDATE SET '
+        f'{qn("total_count")} = {table}.{qn("total_count")} + EXCLUDED.{qn("total_count")}, '
+        f'{qn("total_amount")} = {table}.{qn("total_amount")} + EXCLUDED.{qn("total_amount")}'
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+def record_created(payouts: Iterable[PayoutRequest]) -> None:
+    """Учёт созданных заявок."""
+    record((payout.status, payout.currency, 1, payout.amount) for payout in payouts)
+
+
+def record_deleted(payouts: Iterable[PayoutRequest]) -> None:
+    """Учёт удалённых заявок."""
+    record((payout.status, payout.currency, -1, -payout.amount) for payout in payouts)
+
+
+def record_transition(currency: str, amount: Decimal, from_status: str, to_status: str) -> None:
+    """Учёт перехода одной заявки между статусами."""
+    if from_status == to_status:
+        return
+    record([
+        (from_status, currency, -1, -amount),
+        (to_status, currency, 1, amount),
+    ])
+
+
+def delete_queryset(queryset, batch_size: int = 1000) -> int:
+    """
+    Удаление заявок queryset'а с вычитанием их из агрегата.
+
+    Заявки удаляются пачками: каждая пачка блокируется, агрегируется и
+    удаляется в своей транзакции вместе с дельтами агрегата.
+
+    Returns:
+        Количество удалённых заявок
+    """
+    deleted = 0
+    while True:
+        with transaction.atomic():
+            pks = list(
+                queryset.order_by('pk').select_for_update()
+                .values_list('pk', flat=True)[:batch_size]
+            )
+            if not pks:
+                return deleted
+            batch = PayoutRequest.objects.filter(pk__in=pks)
+            groups = list(
+                batch.order_by().values('status', 'currency')
+                .annotate(total_count=Count('id'), total_amount=Sum('amount'))
+            )
+            count, _ = batch.delete()
+            record(
+                (row['status'], row['currency'], -row['total_count'], -row['total_amount'])
+                for row in groups
+            )
+            deleted += count
+
+
+def snapshot() -> dict:
+    """
+    Текущие значения агрегата.
+
+    Returns:
+        {'total': количество заявок,
+         'by_status': {статус: количество},
+         'results': [{status, currency, count, amount}, ...]},
+        amount — строка с двумя знаками, как в API заявок
+    """
+    rows = (
+        PayoutStatsShard.objects.order_by('status', 'currency')
+        .values('status', 'currency')
+        .annotate(
+            count=Sum('total_count'),
+            amount=Sum('total_amount', output_field=DecimalField(max_digits=20, decimal_places=2)),
+        )
+        .filter(count__gt=0)
+    )
+    by_status = dict.fromkeys(PayoutRequest.Status.values, 0)
+    results = []
+    for row in rows:
+        by_status[row['status']] = by_status.get(row['status'], 0) + row['count']
+        results.append({
+            'status': row['status'],
+            'currency': row['currency'],
+            'count': row['count'],
+            'amount': '{:f}'.format(Decimal(row['amount']).quantize(AMOUNT_QUANTUM)),
+        })
+    return {
+        'total': sum(by_status.values()),
+        'by_status': by_status,
+        'results': results,
+    }
+
+
+@transaction.atomic
+def rebuild() -> int:
+    """
+    Пересчёт агрегата по рабочей таблице и архиву (GROUP BY) — для восстановления после
+    изменений в обход сервиса (raw SQL, queryset.update/delete).
+
+    Таблицы заявок блокируются на запись до конца пересчёта там, где это
+    поддерживается (PostgreSQL).
+
+    Returns:
+        Количество записанных строк агрегата
+    """
+    if connection.vendor == 'postgresql':
+        tables = ', '.join(
+            connection.ops.quote_name(model._meta.db_table)
+            for model in (PayoutRequest, PayoutRequestArchive)
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(f'LOCK TABLE {tables} IN SHARE MODE')
+
+    totals = defaultdict(lambda: [0, Decimal('0')])
+    for model in (PayoutRequest, PayoutRequestArchive):
+        rows = (
+            model.objects.order_by()
+            .values('status', 'currency')
+            .annotate(total_count=Count('id'), total_amount=Sum('amount'))
+        )
+        for row in rows:
+            totals[(row['status'], row['currency'])][0] += row['total_count']
+            totals[(row['status'], row['currency'])][1] += row['total_amount']
+
+    PayoutStatsShard.objects.all().delete()
+    shards = PayoutStatsShard.objects.bulk_create([
+        PayoutStatsShard(
+            status=payout_status,
+            currency=currency,
+            shard=0,
+            total_count=count,
+            total_amount=amount,
+        )
+        for (payout_status, currency), (count, amount) in totals.items()
+    ])
+    logger.info(f'[Stats] Агрегат пересчитан: {len(shards)} строк')
+    return len(shards)
@@ -0,0 +1,165 @@
+"""
+Журнал переходов статуса заявок и время в статусах.
+
+Создание заявки и каждый переход (PayoutService, write-behind, массовый
+переход, sweeper, PATCH) пишут строки PayoutStatusEvent в той же транзакции.
+Переходы пачки вставляются одним запросом
+
+    WITH v (...) AS (VALUES ...) INSERT ... SELECT ..., (SELECT MAX(created_at) ...) FROM v
+
+где entered_at — время последнего события заявки (индекс external_id,
+created_at). Время в статусе — created_at - entered_at одной строки, поэтому
+time_in_state читает только события за период (BRIN по created_at на
+PostgreSQL) и считает p50/p95/p99 через percentile_cont в БД. На других
+СУБД перцентили считаются в Python по той же формуле.
+"""
+import math
+
+from collections import defaultdict
+from datetime import datetime
+from typing import Iterable, Optional
+
+from django.db import connection
+
+from .models import PayoutRequest, PayoutStatusEvent
+
+PERCENTILES = (0.5, 0.95, 0.99)
+
+
+def record_created(payouts: Iterable[PayoutRequest]) -> None:
+    """Первые события созданных заявок (без предыдущего статуса)."""
+    PayoutStatusEvent.objects.bulk_create([
+        PayoutStatusEvent(
+            external_id=payout.external_id,
+            currency=payout.currency,
+            to_status=payout.status,
+            created_at=payout.created_at,
+        )
+        for payout in payouts
+    ], batch_size=1000)
+
+
+def record(transitions: Iterable[tuple[PayoutRequest, str]]) -> None:
+    """
+    События переходов одним INSERT.
+
+    Args:
+        transitions: (заявка после перехода, предыдущий статус); время
+            перехода — updated_at заявки
+    """
+    rows = [
+        (payout.external_id, payout.currency, from_status, payout.status, payout.updated_at)
+        for payout, from_status in transitions
+    ]
+    if not rows:
+        return
+
+    opts = PayoutStatusEvent._meta
+    qn = connection.ops.quote_name
+    table = qn(opts.db_table)
+    fields = [opts.get_field(name) for name in ('external_id', 'currency', 'from_status', 'to_status', 'created_at')]
+    values = ', '.join([f'({", ".join(["%s"] * len(fields))})'] * len(rows))
+    sql = (
+        f'WITH v (external_id, currency, from_status, to_status, created_at) AS (VALUES {values}) '
+        f'INSERT INTO {table} '
+        f'({qn("external_id")}, {qn("currency")}, {qn("from_status")}, {qn("to_status")}, '
+        f'{qn("entered_at")}, {qn("created_at")}) '
+        f'SELECT v.external_id, v.currency, v.from_status, v.to_status, '
+        f'(SELECT MAX(e.{qn("created_at")}) FROM {table} e WHERE e.{qn("external_id")} = v.external_id), '
+        f'v.created_at '
+        f'FROM v'
+    )
+    params = [
+        field.get_db_prep_value(value, connection)
+        for row in rows
+        for field, value in zip(fields, row)
+    ]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+def time_in_state(since: datetime, until: datetime, by_hour: bool = True) -> list[dict]:
+    """
+    Перцентили времени в статусе по событиям за [since, until).
+
+    Args:
+        since: Начало периода (время выхода из статуса)
+        until: Конец периода
+        by_hour: Группировать ещё и по часу выхода из статуса (UTC)
+
+    Returns:
+        [{'hour'?, 'status', 'currency', 'count', 'p50', 'p95', 'p99'}],
+        время — в секундах; события без entered_at (первые) не учитываются
+    """
+    if connection.vendor == 'postgresql':
+        rows = _time_in_state_sql(since, until, by_hour)
+    else:
+        rows = _time_in_state_python(since, until, by_hour)
+
+    results = []
+    for hour, from_status, currency, count, percentiles in rows:
+        row = {'hour': hour} if by_hour else {}
+        row.update(status=from_status, currency=currency, count=count)
+        for fraction, value in zip(PERCENTILES, percentiles):
+            row[f'p{round(fraction * 100)}'] = round(value, 3)
+        results.append(row)
+    return results
+
+
+def _time_in_state_sql(since: datetime, until: datetime, by_hour: bool) -> list[tuple]:
+    """percentile_cont по событиям периода на стороне PostgreSQL."""
+    qn = connection.ops.quote_name
+    columns = [f'{qn("from_status")}', f'{qn("currency")}']
+    if by_hour:
+        columns.insert(0, f"date_trunc('hour', {qn('created_at')})")
+    group_by = ', '.join(str(i) for i in range(1, len(columns) + 1))
+    fractions = ', '.join(str(fraction) for fraction in PERCENTILES)
+    sql = (
+        f'SELECT {", ".join(columns)}, COUNT(*), '
+        f'percentile_cont(ARRAY[{fractions}]) WITHIN GROUP '
+        f'(ORDER BY EXTRACT(EPOCH FROM {qn("created_at")} - {qn("entered_at")})) '
+        f'FROM {qn(PayoutStatusEvent._meta.db_table)} '
+        f'WHERE {qn("created_at")} >= %s AND {qn("created_at")} < %s AND {qn("entered_at")} IS NOT NULL '
+        f'GROUP BY {group_by} ORDER BY {group_by}'
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [since, until])
+        rows = cursor.fetchall()
+    if not by_hour:
+        rows = [(None, *row) for row in rows]
+    return [
+        (hour, from_status, currency, count, [float(value) for value in percentiles])
+        for hour, from_status, currency, count, percentiles in rows
+    ]
+
+
+def _time_in_state_python(since: datetime, until: datetime, by_hour: bool) -> list[tuple]:
+    """Те же перцентили в Python (СУБД без percentile_cont)."""
+    durations = defaultdict(list)
+    events = (
+        PayoutStatusEvent.objects
+        .filter(created_at__gte=since, created_at__lt=until, entered_at__isnull=False)
+        .values_list('created_at', 'entered_at', 'from_status', 'currency')
+    )
+    for created_at, entered_at, from_status, currency in events.iterator(chunk_size=2000):
+        hour = created_at.replace(minute=0, second=0, microsecond=0) if by_hour else None
+        durations[(hour, from_status, currency)].append((created_at - entered_at).total_seconds())
+
+    rows = []
+    for (hour, from_status, currency), values in sorted(durations.items(), key=lambda item: item[0]):
+        values.sort()
+        rows.append((
+            hour, from_status, currency, len(values),
+            [percentile_cont(values, fraction) for fraction in PERCENTILES],
+        ))
+    return rows
+
+
+def percentile_cont(values: list[float], fraction: float) -> Optional[float]:
+    """Перцентиль с линейной интерполяцией, как percentile_cont в PostgreSQL (values отсортированы)."""
+    if not values:
+        return None
+    position = fraction * (len(values) - 1)
+    lower = math.floor(position)
+    upper = math.ceil(position)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
@@ -0,0 +1,104 @@
+"""
+Восстановление зависших заявок.
+
+- processing дольше PAYOUT_STUCK_PROCESSING_AFTER — worker умер после
+  start_processing: заявка возвращается в pending и отправляется заново
+  (шлюз получает тот же Idempotency-Key, повторного списания нет);
+- pending дольше PAYOUT_STUCK_PENDING_AFTER — сообщение Celery потеряно:
+  заявка отправляется заново (повторная доставка безопасна, start_processing — CAS).
+
+Заявки выбираются по частичному индексу payout_unfinished_idx пачками
+с SELECT ... FOR UPDATE SKIP LOCKED, поэтому несколько sweeper'ов не
+мешают друг другу и не ждут строк, которые сейчас обрабатываются.
+"""
+import logging
+
+from datetime import timedelta
+from typing import Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import payout_cache, stats, status_log
+from .dispatch import enqueue_payouts
+from .events import publish_status
+from .metrics import PAYOUTS_SWEPT
+from .models import PayoutRequest
+from .webhooks import enqueue_webhooks
+
+logger = logging.getLogger(__name__)
+
+
+def sweep_stuck_payouts(batch_size: Optional[int] = None, max_batches: Optional[int] = None) -> dict:
+    """
+    Поиск и повторная отправка зависших заявок.
+
+    Args:
+        batch_size: Заявок в одной транзакции (по умолчанию PAYOUT_SWEEP_BATCH_SIZE)
+        max_batches: Максимум пачек на статус за один запуск (по умолчанию PAYOUT_SWEEP_MAX_BATCHES)
+
+    Returns:
+        {статус: количество отправленных заново заявок}
+    """
+    batch_size = batch_size or settings.PAYOUT_SWEEP_BATCH_SIZE
+    max_batches = max_batches or settings.PAYOUT_SWEEP_MAX_BATCHES
+    thresholds = {
+        PayoutRequest.Status.PROCESSING: settings.PAYOUT_STUCK_PROCESSING_AFTER,
+        PayoutRequest.Status.PENDING: settings.PAYOUT_STUCK_PENDING_AFTER,
+    }
+
+    swept = {}
+    for payout_status, stale_after in thresholds.items():
+        cutoff = timezone.now() - timedelta(seconds=stale_after)
+        swept[payout_status] = 0
+        for _ in range(max_batches):
+            count = _sweep_batch(payout_status, cutoff, batch_size)
+            swept[payout_status] += count
+            if count < batch_size:
+                break
+
+    if any(swept.values()):
+        logger.warning(f'[Sweeper] Повторно отправлены зависшие заявки: {swept}')
+    return swept
+
+
+@transaction.atomic
+def _sweep_batch(payout_status: str, cutoff, batch_size: int) -> int:
+    """Одна пачка: блокировка, перевод в pending с новым updated_at, отправка после коммита."""
+    payouts = list(
+        PayoutRequest.objects.select_for_update(skip_locked=True)
+        .filter(status=payout_status, updated_at__lt=cutoff)
+        .order_by('updated_at')
+        .only('pk', 'external_id', 'amount', 'currency', 'priority', 'status')[:batch_size]
+    )
+    if not payouts:
+        return 0
+
+    # updated_at сдвигается и для pending: следующий запуск не возьмёт их снова
+    now = timezone.now()
+    PayoutRequest.objects.filter(
+        pk__in=[payout.pk for payout in payouts],
+        status=payout_status,
+    ).update(status=PayoutRequest.Status.PENDING, updated_at=now)
+    for payout in payouts:
+        payout.status, payout.updated_at = PayoutRequest.Status.PENDING, now
+
+    if payout_status != PayoutRequest.Status.PENDING:
+        stats.record(
+            delta
+            for payout in payouts
+            for delta in (
+                (payout_status, payout.currency, -1, -payout.amount),
+                (PayoutRequest.Status.PENDING, payout.currency, 1, payout.amount),
+            )
+        )
+        status_log.record((payout, payout_status) for payout in payouts)
+
+    payout_cache.invalidate(payout.external_id for payout in payouts)
+    if payout_status != PayoutRequest.Status.PENDING:
+        publish_status(payouts)
+        enqueue_webhooks(payouts)
+    enqueue_payouts(payouts)
+    PAYOUTS_SWEPT.labels(status=payout_status).inc(len(payouts))
+    return len(payouts)
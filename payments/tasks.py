@@ -1,86 +1,290 @@
 import asyncio
 import logging
+import math
+
+from typing import Optional
 
 from asgiref.sync import sync_to_async
 from celery import shared_task
+from django.conf import settings
+
+from core import event_loop
 
+from . import gateway_results
+from .archive import archive_finalized_payouts as archive
+from .metrics import observe_stage
 from .models import PayoutRequest
-from .services import PayoutService
+from .outbox import drain_outbox
+from .resilience import CircuitOpenError, GatewayOverloadedError, get_gateway_guard
+from .services import PayoutResult, PayoutService
+from .sweeper import sweep_stuck_payouts as sweep
+from .webhooks import deliver_webhooks
+from .write_behind import get_write_behind
 
 logger = logging.getLogger(__name__)
 
 
-@shared_task(bind=True, max_retries=3, default_retry_delay=5)
-def process_payout_async(self, external_id: str) -> dict:
-    """Асинхронная обработка заявки на выплату."""
+# С write-behind сообщение подтверждается только после записи финального статуса:
+# повторно доставленное сообщение продолжает заявку из processing (resume)
+WRITE_BEHIND_TASK_OPTIONS = (
+    {'acks_late': True, 'reject_on_worker_lost': True} if settings.PAYOUT_WRITE_BEHIND else {}
+)
+
+
+def _is_resumed(request, resume: bool) -> bool:
+    """Продолжение обработки: явный resume или повторная доставка сообщения брокером."""
+    return resume or bool((request.delivery_info or {}).get('redelivered'))
+
+
+def _current_queue(request) -> Optional[str]:
+    """
+    Очередь полученного сообщения (routing_key прямого обмена очереди).
+
+    Повторы и переотправки публикуются в ту же полосу явно, без запроса
+    роутера (payments.routing.route_task) к БД; None — в eager-режиме.
+    """
+    return (request.delivery_info or {}).get('routing_key') or None
+
+
+@shared_task(bind=True, max_retries=3, default_retry_delay=5, **WRITE_BEHIND_TASK_OPTIONS)
+def process_payout_async(self, external_id: str, resume: bool = False) -> dict:
+    """
+    Асинхронная обработка заявки на выплату.
+    
+    Ошибка шлюза (таймаут, обрыв соединения) или любая другая ошибка, в том
+    числе записи финального статуса, не означает отказ в платеже: заявка
+    остаётся в processing, а задача повторяется с resume=True. Повтор
+    завершает заявку по сохранённому ответу шлюза (payments.gateway_results)
+    или запрашивает шлюз с тем же Idempotency-Key. После max_retries заявку
+    вернёт в обработку sweeper.
+    
+    Args:
+        external_id: UUID заявки
+        resume: Продолжить обработку заявки, уже находящейся в processing
+    """
     logger.info(f'[Celery] Запуск async обработки заявки {external_id}')
+    resume = _is_resumed(self.request, resume)
     
     try:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        try:
-            result = loop.run_until_complete(
-                _process_payout_coroutine(external_id)
-            )
-        finally:
-            loop.close()
-        
-        return result
+        result = event_loop.run(_process_payout_coroutine(external_id, resume=resume))
         
     except Exception as exc:
         logger.error(f'[Celery] Критическая ошибка: {exc}')
         
-        PayoutService.fail_payout(external_id, str(exc))
-        
         if self.request.retries < self.max_retries:
             countdown = self.default_retry_delay * (2 ** self.request.retries)
             logger.info(f'[Celery] Повторная попытка через {countdown}с...')
-            raise self.retry(exc=exc, countdown=countdown)
+            raise self.retry(
+                exc=exc, countdown=countdown, kwargs={'resume': True}, queue=_current_queue(self.request)
+            )
+        
+        logger.error(f'[Celery] Заявка {external_id} оставлена в processing для sweeper')
+        return {'status': 'error', 'external_id': external_id, 'error': str(exc)}
+    
+    if result['status'] == 'deferred':
+        process_payout_async.apply_async(
+            (external_id,),
+            {'resume': resume or result.get('resume', False)},
+            countdown=math.ceil(result['retry_after']),
+            queue=_current_queue(self.request)
+        )
+    return result
+
+
+@shared_task(bind=True, max_retries=3, default_retry_delay=5, **WRITE_BEHIND_TASK_OPTIONS)
+def process_payouts_batch(
+    self,
+    external_ids: list[str],
+    concurrency: Optional[int] = None,
+    resume: bool = False,
+) -> list[dict]:
+    """
+    Пакетная обработка заявок на одном event loop.
+    
+    Все заявки проходят через _process_payout_coroutine параллельно, но не более
+    concurrency одновременно. Ошибка одной заявки не влияет на остальные.
+    Заявки, отложенные из-за открытого circuit или перегрузки шлюза,
+    переотправляются одной задачей с задержкой (уже взятые в processing —
+    с resume=True). Заявки с ошибкой (исход платежа неизвестен)
+    остаются в processing и повторяются одной задачей с resume=True.
+    
+    Args:
+        external_ids: Список UUID заявок
+        concurrency: Лимит одновременных корутин (по умолчанию PAYOUT_BATCH_CONCURRENCY)
+        resume: Продолжить обработку заявок, уже находящихся в processing
+        
+    Returns:
+        Список результатов в порядке external_ids
+    """
+    concurrency = concurrency or settings.PAYOUT_BATCH_CONCURRENCY
+    resume = _is_resumed(self.request, resume)
+    logger.info(
+        f'[Celery] Пакетная обработка {len(external_ids)} заявок, '
+        f'параллельно: {concurrency}'
+    )
+    results = event_loop.run(_process_payout_batch(external_ids, concurrency, resume))
+    
+    deferred = [result for result in results if result['status'] == 'deferred']
+    if deferred:
+        countdown = math.ceil(max(result['retry_after'] for result in deferred))
+        logger.warning(
+            f'[Celery] Circuit шлюза открыт: {len(deferred)} заявок отложено на {countdown}с'
+        )
+        process_payouts_batch.apply_async(
+            ([result['external_id'] for result in deferred], concurrency),
+            {'resume': resume or any(result.get('resume') for result in deferred)},
+            countdown=countdown,
+            queue=_current_queue(self.request)
+        )
+    
+    errors = [result['external_id'] for result in results if result['status'] == 'error']
+    if errors:
+        if self.request.retries < self.max_retries:
+            countdown = self.default_retry_delay * (2 ** self.request.retries)
+            logger.warning(f'[Celery] {len(errors)} заявок с ошибкой повторяются через {countdown}с')
+            self.retry(
+                args=(errors, concurrency),
+                kwargs={'resume': True},
+                countdown=countdown,
+                queue=_current_queue(self.request),
+                throw=False,
+            )
+        else:
+            logger.error(f'[Celery] {len(errors)} заявок с ошибкой оставлены в processing для sweeper')
+    return results
+
+
+@shared_task
+def sweep_stuck_payouts() -> dict:
+    """Периодическая повторная отправка зависших заявок (расписание — django-celery-beat)."""
+    return sweep()
+
+
+@shared_task
+def relay_payout_outbox() -> int:
+    """Периодическая публикация outbox (основной путь — процесс run_outbox_relay)."""
+    return drain_outbox()
+
+
+@shared_task
+def archive_finalized_payouts() -> int:
+    """Периодический перенос старых финальных заявок в архив (расписание — django-celery-beat)."""
+    return archive()
+
+
+@shared_task
+def deliver_payout_webhooks() -> int:
+    """Периодическая доставка вебхуков (основной путь — процесс run_webhook_dispatcher)."""
+    return event_loop.run(deliver_webhooks())
+
+
+async def _process_payout_batch(external_ids: list[str], concurrency: int, resume: bool = False) -> list[dict]:
+    """
+    Параллельная обработка заявок с ограничением числа одновременных корутин.
+    
+    Args:
+        external_ids: Список UUID заявок
+        concurrency: Максимум заявок в обработке одновременно
+        resume: Продолжить обработку заявок, уже находящихся в processing
+        
+    Returns:
+        Список результатов в порядке external_ids
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    
+    async def process_one(external_id: str) -> dict:
+        async with semaphore:
+            try:
+                result = await _process_payout_coroutine(external_id, resume=resume)
+            except Exception as exc:
+                # Исход неизвестен — заявка не переводится в failed
+                logger.error(f'[Async] Ошибка обработки {external_id}: {exc}')
+                return {'status': 'error', 'external_id': external_id, 'error': str(exc)}
         
-        return {'status': 'failed', 'error': str(exc)}
+        result.setdefault('external_id', external_id)
+        return result
+    
+    return await asyncio.gather(
+        *(process_one(str(external_id)) for external_id in external_ids)
+    )
 
 
-async def _process_payout_coroutine(external_id: str) -> dict:
+async def _process_payout_coroutine(external_id: str, resume: bool = False) -> dict:
     """
     Асинхронная корутина обработки выплаты.
     
     Args:
         external_id: UUID заявки
+        resume: Заявка может быть уже в processing (повтор после ошибки)
         
     Returns:
         dict с результатом
+        
+    Raises:
+        GatewayError: исход запроса к шлюзу неизвестен, заявка остаётся в processing
     """
     logger.info(f'[Async] Начало обработки {external_id}')
     
-    payout = await sync_to_async(PayoutService.start_processing)(external_id)
+    resumed = None
+    if resume:
+        with observe_stage('db_transition'):
+            resumed = await sync_to_async(PayoutService.resume_processing)(external_id)
+        if resumed is not None:
+            recorded = await sync_to_async(gateway_results.get)(external_id)
+            if recorded is not None:
+                # Ответ шлюза получен до сбоя записи статуса — повторный запрос не нужен
+                logger.info(f'[Async] Заявка {external_id} завершается по сохранённому ответу шлюза')
+                return await _finish(external_id, *recorded)
+    
+    # Circuit шлюза открыт — заявка остаётся в текущем статусе и будет отправлена позже
+    retry_after = get_gateway_guard().defer_for()
+    if retry_after:
+        logger.warning(f'[Async] Шлюз недоступен, заявка {external_id} отложена на {retry_after:.0f}с')
+        return {'status': 'deferred', 'retry_after': retry_after, 'resume': resumed is not None}
+    
+    payout = resumed
+    if payout is None:
+        with observe_stage('db_transition'):
+            payout = await sync_to_async(PayoutService.start_processing)(external_id)
     
     if payout is None:
         return {'status': 'skipped', 'reason': 'already_processed'}
     
     logger.info(f'[Async] Валидация реквизитов...')
-    is_valid = await PayoutService.validate_recipient(payout.recipient_details)
+    with observe_stage('recipient_validation'):
+        is_valid = await PayoutService.validate_recipient(payout.recipient_details)
     
     if not is_valid:
-        result = await sync_to_async(PayoutService.fail_payout)(
-            external_id, 
-            'Невалидные реквизиты получателя'
-        )
+        with observe_stage('db_transition'):
+            result = await _finalize(external_id, False, 'Невалидные реквизиты получателя')
         return {
             'status': result.status,
             'message': result.message
         }
     
     logger.info(f'[Async] Запрос к платёжному шлюзу...')
-    success, message = await PayoutService.process_payment_gateway(
-        payout.amount,
-        payout.currency,
-        payout.recipient_details
-    )
+    try:
+        with observe_stage('gateway'):
+            success, message = await PayoutService.process_payment_gateway(
+                payout.amount,
+                payout.currency,
+                payout.recipient_details,
+                external_id=external_id
+            )
+    except (CircuitOpenError, GatewayOverloadedError) as exc:
+        # Запрос к шлюзу не отправлялся — заявка остаётся в processing и продолжится позже
+        retry_after = getattr(exc, 'retry_after', 1.0)
+        logger.warning(f'[Async] {exc}, заявка {external_id} отложена на {retry_after:.0f}с')
+        return {'status': 'deferred', 'retry_after': retry_after, 'resume': True}
     
-    if success:
-        result = await sync_to_async(PayoutService.complete_payout)(external_id)
-    else:
-        result = await sync_to_async(PayoutService.fail_payout)(external_id, message)
+    await sync_to_async(gateway_results.record)(external_id, success, message)
+    return await _finish(external_id, success, message)
+
+
+async def _finish(external_id: str, success: bool, message: str) -> dict:
+    """Запись финального статуса по ответу шлюза."""
+    with observe_stage('db_transition'):
+        result = await _finalize(external_id, success, message)
     
     logger.info(f'[Async] Завершено: {result.status}')
     
@@ -90,3 +294,16 @@ async def _process_payout_coroutine(external_id: str) -> dict:
         'message': result.message,
         'success': result.success
     }
+
+
+async def _finalize(external_id: str, success: bool, reason: str = '') -> PayoutResult:
+    """
+    Финальный статус заявки: отдельной транзакцией или через буфер write-behind
+    (PAYOUT_WRITE_BEHIND), в обоих случаях корутина ждёт записи в БД.
+    """
+    if settings.PAYOUT_WRITE_BEHIND:
+        buffer = get_write_behind()
+        return await (buffer.complete(external_id) if success else buffer.fail(external_id, reason))
+    if success:
+        return await sync_to_async(PayoutService.complete_payout)(external_id)
+    return await sync_to_async(PayoutService.fail_payout)(external_id, reason)
@@ -1,22 +1,85 @@
+import asyncio
+import base64
+import csv
+import io
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+from datetime import timedelta
 from decimal import Decimal
-from unittest.mock import patch
+from unittest import skipUnless
+from unittest.mock import AsyncMock, MagicMock, Mock, patch
 
-from django.test import TestCase
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth import get_user_model
-from rest_framework.test import APITestCase
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Count, Sum
+from django.urls import resolve
+from django.utils import timezone
+from prometheus_client import REGISTRY
+import redis
+from rest_framework.authentication import BasicAuthentication
+from rest_framework.renderers import JSONRenderer
+from rest_framework.routers import DefaultRouter
+from rest_framework.test import APIRequestFactory, APITestCase, force_authenticate
 from rest_framework import status
 
-from .models import PayoutRequest
+from core import event_loop
+
+from .dispatch import enqueue_payouts
+from .events import EventPublisher, StatusHub, get_status_hub, publish_status
+from .fake_gateway import FakeGatewayServer
+from .fake_webhook_receiver import FakeWebhookReceiver
+from .gateway import GatewayError, HttpGateway, get_gateway
+from . import payout_cache, stats, status_log, transitions
+from .archive import archive_finalized_payouts
+from .async_views import async_read_routes, payout_list
+from .idempotency import request_fingerprint
+from .models import (
+    PayoutIdempotencyKey,
+    PayoutOutbox,
+    PayoutRequest,
+    PayoutRequestArchive,
+    PayoutStatsShard,
+    PayoutStatusEvent,
+    WebhookDelivery,
+    WebhookEndpoint,
+)
+from .outbox import drain_outbox, relay_outbox
+from .recipient_cache import RecipientValidationCache, get_recipient_cache
+from .routing import queue_for, route_task
+from .resilience import (
+    AdaptiveLimiter,
+    CircuitBreaker,
+    CircuitOpenError,
+    GatewayGuard,
+    GatewayOverloadedError,
+    get_gateway_guard,
+)
+from .serializers import PayoutRequestFastSerializer, PayoutRequestSerializer
 from .services import PayoutService
+from .sweeper import sweep_stuck_payouts
+from .tasks import _is_resumed, process_payout_async, process_payouts_batch
+from .views import PayoutRequestViewSet
+from .webhooks import WebhookDispatcher, deliver_webhooks, enqueue_webhooks, reset_endpoints_cache, retry_delay
+from .write_behind import WriteBehindBuffer, finalize_payouts
 
 User = get_user_model()
 
 
-@patch('payments.tasks.process_payout_async.delay')
 class PayoutRequestModelTest(TestCase):
     """Тесты модели PayoutRequest."""
     
-    def test_create_payout_request(self, mock_celery):
+    def test_create_payout_request(self):
         """Тест создания заявки."""
         payout = PayoutRequest.objects.create(
             amount=Decimal('1000.00'),
@@ -29,7 +92,7 @@ class PayoutRequestModelTest(TestCase):
         self.assertEqual(payout.status, PayoutRequest.Status.PENDING)
         self.assertEqual(payout.amount, Decimal('1000.00'))
     
-    def test_is_final_status(self, mock_celery):
+    def test_is_final_status(self):
         """Тест проверки финального статуса."""
         payout = PayoutRequest.objects.create(
             amount=Decimal('100'),
@@ -71,8 +134,7 @@ class PayoutAPITest(APITestCase):
             'description': 'Test payout'
         }
     
-    @patch('payments.tasks.process_payout_async.delay')
-    def test_create_payout_success(self, mock_celery):
+    def test_create_payout_success(self):
         """Тест успешного создания заявки."""
         response = self.client.post('/api/v1/payouts/', self.valid_payload, format='json')
         
@@ -81,20 +143,24 @@ class PayoutAPITest(APITestCase):
         self.assertEqual(response.data['currency'], 'RUB')
         self.assertIn('external_id', response.data)
     
-    @patch('payments.tasks.process_payout_async.delay')
-    def test_celery_task_called_on_create(self, mock_celery):
-        """Тест вызова Celery-задачи при создании заявки."""
+    @patch('payments.tasks.process_payouts_batch.apply_async')
+    def test_celery_task_called_on_create(self, mock_batch):
+        """Тест записи в outbox при создании заявки и публикации relay."""
         response = self.client.post('/api/v1/payouts/', self.valid_payload, format='json')
         
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        message = PayoutOutbox.objects.get()
+        self.assertEqual(str(message.external_id), response.data['external_id'])
+        mock_batch.assert_not_called()
         
-        mock_celery.assert_called_once()
+        self.assertEqual(relay_outbox(), 1)
         
-        call_args = mock_celery.call_args[0]
-        self.assertEqual(call_args[0], response.data['external_id'])
+        mock_batch.assert_called_once()
+        self.assertEqual(mock_batch.call_args[0][0], ([response.data['external_id']],))
+        self.assertEqual(mock_batch.call_args.kwargs['queue'], 'payouts')
+        self.assertFalse(PayoutOutbox.objects.exists())
     
-    @patch('payments.tasks.process_payout_async.delay')
-    def test_create_payout_invalid_recipient(self, mock_celery):
+    def test_create_payout_invalid_recipient(self):
         """Тест валидации реквизитов получателя."""
         invalid_payload = self.valid_payload.copy()
         invalid_payload['recipient_details'] = {'invalid': 'data'}
@@ -104,8 +170,7 @@ class PayoutAPITest(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
         self.assertIn('recipient_details', response.data)
     
-    @patch('payments.tasks.process_payout_async.delay')
-    def test_get_payout_by_external_id(self, mock_celery):
+    def test_get_payout_by_external_id(self):
         """Тест получения заявки по external_id."""
         create_response = self.client.post('/api/v1/payouts/', self.valid_payload, format='json')
         external_id = create_response.data['external_id']
@@ -115,8 +180,7 @@ class PayoutAPITest(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data['external_id'], external_id)
     
-    @patch('payments.tasks.process_payout_async.delay')
-    def test_update_payout_status(self, mock_celery):
+    def test_update_payout_status(self):
         """Тест обновления статуса заявки."""
         create_response = self.client.post('/api/v1/payouts/', self.valid_payload, format='json')
         external_id = create_response.data['external_id']
@@ -130,8 +194,7 @@ class PayoutAPITest(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data['status'], 'processing')
     
-    @patch('payments.tasks.process_payout_async.delay')
-    def test_cannot_delete_processing_payout(self, mock_celery):
+    def test_cannot_delete_processing_payout(self):
         """Тест запрета удаления заявки в обработке."""
         create_response = self.client.post('/api/v1/payouts/', self.valid_payload, format='json')
         external_id = create_response.data['external_id']
@@ -145,8 +208,7 @@ class PayoutAPITest(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
         self.assertIn('обработке', response.data['detail'])
     
-    @patch('payments.tasks.process_payout_async.delay')
-    def test_delete_pending_payout(self, mock_celery):
+    def test_delete_pending_payout(self):
         """Тест успешного удаления заявки в статусе pending."""
         create_response = self.client.post('/api/v1/payouts/', self.valid_payload, format='json')
         external_id = create_response.data['external_id']
@@ -156,6 +218,275 @@ class PayoutAPITest(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
         self.assertFalse(PayoutRequest.objects.filter(external_id=external_id).exists())
     
+    @override_settings(PAYOUT_BULK_CHUNK_SIZE=2)
+    @patch('payments.tasks.process_payouts_batch.apply_async')
+    def test_bulk_create_with_row_errors(self, mock_batch):
+        """Тест пакетного создания с ошибками в отдельных строках."""
+        invalid_row = self.valid_payload.copy()
+        invalid_row['recipient_details'] = {'invalid': 'data'}
+        rows = [self.valid_payload, invalid_row, self.valid_payload, self.valid_payload]
+        
+        response = self.client.post('/api/v1/payouts/bulk/', rows, format='json')
+        relay_outbox()
+        
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([row['index'] for row in response.data['created']], [0, 2, 3])
+        self.assertEqual(response.data['errors'][0]['index'], 1)
+        self.assertIn('recipient_details', response.data['errors'][0]['errors'])
+        self.assertEqual(PayoutRequest.objects.count(), 3)
+        
+        self.assertEqual(mock_batch.call_count, 2)
+        enqueued = [external_id for call in mock_batch.call_args_list for external_id in call[0][0][0]]
+        self.assertEqual(
+            enqueued,
+            [row['payout']['external_id'] for row in response.data['created']]
+        )
+        self.assertEqual({call.kwargs['queue'] for call in mock_batch.call_args_list}, {'payouts'})
+    
+    @patch('payments.tasks.process_payouts_batch.apply_async')
+    def test_bulk_create_split_by_queue(self, mock_batch):
+        """Тест раскладки пакета по очередям полос."""
+        urgent = {**self.valid_payload, 'priority': 'high'}
+        low = {**self.valid_payload, 'priority': 'low'}
+        
+        response = self.client.post(
+            '/api/v1/payouts/bulk/', [self.valid_payload, urgent, low, urgent], format='json'
+        )
+        relay_outbox()
+        
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        sent = {call.kwargs['queue']: call[0][0][0] for call in mock_batch.call_args_list}
+        created = [row['payout']['external_id'] for row in response.data['created']]
+        self.assertEqual(sent['payouts_high'], [created[1], created[3]])
+        self.assertEqual(sent['payouts'], [created[0]])
+        self.assertEqual(sent['payouts_low'], [created[2]])
+    
+    @patch('payments.tasks.process_payouts_batch.apply_async')
+    def test_bulk_create_all_rows_invalid(self, mock_batch):
+        """Тест пакетного создания, когда все строки невалидны."""
+        invalid_row = self.valid_payload.copy()
+        invalid_row['amount'] = '-1'
+        
+        response = self.client.post('/api/v1/payouts/bulk/', [invalid_row], format='json')
+        
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['created'], [])
+        self.assertFalse(PayoutRequest.objects.exists())
+    
+    def test_list_cursor_pagination(self):
+        """Тест обхода списка по курсорам next/previous."""
+        for _ in range(5):
+            self.client.post('/api/v1/payouts/', self.valid_payload, format='json')
+        expected = [
+            str(external_id) for external_id in
+            PayoutRequest.objects.order_by('-created_at', '-id').values_list('external_id', flat=True)
+        ]
+        
+        pages = []
+        url = '/api/v1/payouts/?page_size=2'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn('count', response.data)
+            pages.append(response.data)
+            url = response.data['next']
+        
+        self.assertEqual([len(page['results']) for page in pages], [2, 2, 1])
+        self.assertEqual(
+            [row['external_id'] for page in pages for row in page['results']],
+            expected
+        )
+        self.assertIsNone(pages[0]['previous'])
+        
+        response = self.client.get(pages[2]['previous'])
+        self.assertEqual(
+            [row['external_id'] for row in response.data['results']],
+            expected[2:4]
+        )
+    
+    def test_list_cursor_pagination_with_filter_and_ordering(self):
+        """Тест курсорной пагинации вместе с фильтром и сортировкой."""
+        for amount in ['300.00', '100.00', '200.00']:
+            payload = dict(self.valid_payload, amount=amount)
+            self.client.post('/api/v1/payouts/', payload, format='json')
+        PayoutRequest.objects.filter(amount=Decimal('300.00')).update(
+            status=PayoutRequest.Status.CANCELLED
+        )
+        
+        response = self.client.get('/api/v1/payouts/?status=pending&ordering=amount&page_size=1')
+        self.assertEqual(response.data['results'][0]['amount'], '100.00')
+        
+        response = self.client.get(response.data['next'])
+        self.assertEqual(response.data['results'][0]['amount'], '200.00')
+        self.assertIsNone(response.data['next'])
+    
+    def test_list_invalid_cursor(self):
+        """Тест ответа на повреждённый курсор."""
+        response = self.client.get('/api/v1/payouts/?cursor=broken')
+        
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+    
+    def test_export_ndjson_matches_api(self):
+        """Тест выгрузки NDJSON в формате API с учётом фильтров."""
+        for currency in ['RUB', 'USD', 'RUB']:
+            self.client.post('/api/v1/payouts/', dict(self.valid_payload, currency=currency), format='json')
+        
+        response = self.client.get('/api/v1/payouts/export/?currency=RUB')
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        rows = [
+            json.loads(line)
+            for line in b''.join(response.streaming_content).decode().splitlines()
+        ]
+        expected = self.client.get('/api/v1/payouts/?currency=RUB').json()['results']
+        self.assertEqual(rows, expected)
+    
+    def test_export_csv(self):
+        """Тест выгрузки CSV."""
+        self.client.post('/api/v1/payouts/', self.valid_payload, format='json')
+        
+        response = self.client.get('/api/v1/payouts/export/?export_format=csv')
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('text/csv'))
+        rows = list(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['amount'], '1500.00')
+        self.assertEqual(json.loads(rows[0]['recipient_details'])['type'], 'card')
+    
+    def test_export_unknown_format(self):
+        """Тест неизвестного формата выгрузки."""
+        response = self.client.get('/api/v1/payouts/export/?export_format=xml')
+        
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+    
+    def test_idempotent_create_replay(self):
+        """Тест повтора создания с тем же Idempotency-Key."""
+        cache.clear()
+        headers = {'HTTP_IDEMPOTENCY_KEY': 'order-42'}
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            first = self.client.post('/api/v1/payouts/', self.valid_payload, format='json', **headers)
+        with self.captureOnCommitCallbacks(execute=True):
+            second = self.client.post('/api/v1/payouts/', self.valid_payload, format='json', **headers)
+        
+        self.assertEqual(second.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(PayoutRequest.objects.count(), 1)
+        self.assertEqual(PayoutOutbox.objects.count(), 1)
+        
+        cache.clear()
+        reordered = dict(reversed(list(self.valid_payload.items())))
+        third = self.client.post('/api/v1/payouts/', reordered, format='json', **headers)
+        self.assertEqual(third.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(third.data['external_id'], first.data['external_id'])
+    
+    def test_idempotent_create_payload_mismatch(self):
+        """Тест повтора ключа с другим телом запроса."""
+        cache.clear()
+        headers = {'HTTP_IDEMPOTENCY_KEY': 'order-43'}
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/v1/payouts/', self.valid_payload, format='json', **headers)
+        
+        changed = dict(self.valid_payload, amount='1600.00')
+        cached = self.client.post('/api/v1/payouts/', changed, format='json', **headers)
+        cache.clear()
+        stored = self.client.post('/api/v1/payouts/', changed, format='json', **headers)
+        
+        self.assertEqual(cached.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.assertEqual(stored.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.assertEqual(PayoutRequest.objects.count(), 1)
+    
+    def test_idempotent_create_concurrent_duplicate(self):
+        """Тест гонки: дубликат по уникальному ключу сводится к одной заявке."""
+        cache.clear()
+        existing = PayoutRequest.objects.create(
+            amount=Decimal('10.00'),
+            recipient_details={'type': 'card', 'number': '4111111111111111'},
+            idempotency_key='race-key'
+        )
+        PayoutIdempotencyKey.objects.create(
+            key='race-key',
+            fingerprint=request_fingerprint(self.valid_payload),
+            external_id=existing.external_id
+        )
+        real_replay = PayoutRequestViewSet.get_idempotent_replay
+        calls = []
+        
+        def replay_after_race(view, key, fingerprint):
+            calls.append(key)
+            return None if len(calls) == 1 else real_replay(view, key, fingerprint)
+        
+        with patch.object(PayoutRequestViewSet, 'get_idempotent_replay', replay_after_race):
+            response = self.client.post(
+                '/api/v1/payouts/', self.valid_payload, format='json',
+                HTTP_IDEMPOTENCY_KEY='race-key'
+            )
+        
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['external_id'], str(existing.external_id))
+        self.assertEqual(PayoutRequest.objects.count(), 1)
+    
+    def test_idempotency_key_free_after_delete(self):
+        """Тест: после удаления заявки ключ свободен — повтор создаёт новую заявку, а не replay."""
+        cache.clear()
+        headers = {'HTTP_IDEMPOTENCY_KEY': 'order-43'}
+        with self.captureOnCommitCallbacks(execute=True):
+            first = self.client.post('/api/v1/payouts/', self.valid_payload, format='json', **headers)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f'/api/v1/payouts/{first.data["external_id"]}/')
+        
+        second = self.client.post('/api/v1/payouts/', self.valid_payload, format='json', **headers)
+        
+        self.assertEqual(second.status_code, status.HTTP_201_CREATED)
+        self.assertNotIn('Idempotent-Replayed', second)
+        self.assertNotEqual(second.data['external_id'], first.data['external_id'])
+        self.assertEqual(
+            str(PayoutIdempotencyKey.objects.get(key='order-43').external_id), second.data['external_id']
+        )
+    
+    @override_settings(PROMETHEUS_METRICS_TOKEN='scrape-token', PROMETHEUS_DB_METRICS_TTL=0)
+    def test_metrics_endpoint(self):
+        """Тест эндпоинта /metrics и метрик запросов к API."""
+        self.client.post('/api/v1/payouts/', self.valid_payload, format='json')
+        labels = {'action': 'list', 'method': 'GET', 'status_code': '200'}
+        before = REGISTRY.get_sample_value('payout_api_request_seconds_count', labels) or 0
+        
+        self.client.get('/api/v1/payouts/')
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape-token')
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            REGISTRY.get_sample_value('payout_api_request_seconds_count', labels),
+            before + 1
+        )
+        self.assertIn(b'payouts_by_status{status="pending"} 1.0', response.content)
+        self.assertIn(b'payout_stage_seconds', response.content)
+    
+    def test_metrics_access_and_cache(self):
+        """Тест доступа к /metrics и кэширования метрик из БД."""
+        with override_settings(PROMETHEUS_METRICS_TOKEN='', PROMETHEUS_METRICS_ALLOWED_IPS=[], DEBUG=False):
+            self.assertEqual(self.client.get('/metrics').status_code, status.HTTP_403_FORBIDDEN)
+        with override_settings(PROMETHEUS_METRICS_TOKEN='scrape-token', PROMETHEUS_METRICS_ALLOWED_IPS=['10.0.0.1']):
+            self.assertEqual(self.client.get('/metrics').status_code, status.HTTP_403_FORBIDDEN)
+            self.assertEqual(
+                self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code,
+                status.HTTP_403_FORBIDDEN
+            )
+            self.assertEqual(
+                self.client.get('/metrics', REMOTE_ADDR='10.0.0.1').status_code, status.HTTP_200_OK
+            )
+        
+        with override_settings(PROMETHEUS_METRICS_ALLOWED_IPS=['127.0.0.1'], PROMETHEUS_DB_METRICS_TTL=60):
+            self.client.get('/metrics')
+            with patch('payments.stats.snapshot') as snapshot, patch('payments.routing.queue_depths') as depths:
+                response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        snapshot.assert_not_called()
+        depths.assert_not_called()
+    
     def test_unauthorized_access(self):
         """Тест запрета доступа без авторизации."""
         self.client.force_authenticate(user=None)
@@ -165,7 +496,6 @@ class PayoutAPITest(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
 
 
-@patch('payments.tasks.process_payout_async.delay')
 class PayoutServiceTest(TestCase):
     """Тесты сервисного слоя."""
     
@@ -177,14 +507,14 @@ class PayoutServiceTest(TestCase):
             recipient_details={'type': 'card', 'number': '4111111111111111'}
         )
     
-    def test_start_processing(self, mock_celery):
+    def test_start_processing(self):
         """Тест начала обработки заявки."""
         result = PayoutService.start_processing(str(self.payout.external_id))
         
         self.assertIsNotNone(result)
         self.assertEqual(result.status, PayoutRequest.Status.PROCESSING)
     
-    def test_start_processing_already_processed(self, mock_celery):
+    def test_start_processing_already_processed(self):
         """Тест повторной обработки уже обработанной заявки."""
         self.payout.status = PayoutRequest.Status.COMPLETED
         self.payout.save()
@@ -193,15 +523,21 @@ class PayoutServiceTest(TestCase):
         
         self.assertIsNone(result)
     
-    def test_complete_payout(self, mock_celery):
+    def test_complete_payout(self):
         """Тест успешного завершения выплаты."""
+        PayoutService.start_processing(str(self.payout.external_id))
+        
         result = PayoutService.complete_payout(str(self.payout.external_id))
         
         self.assertTrue(result.success)
         self.assertEqual(result.status, PayoutRequest.Status.COMPLETED)
+        self.payout.refresh_from_db()
+        self.assertEqual(self.payout.status, PayoutRequest.Status.COMPLETED)
     
-    def test_fail_payout(self, mock_celery):
+    def test_fail_payout(self):
         """Тест неуспешного завершения выплаты."""
+        PayoutService.start_processing(str(self.payout.external_id))
+        
         result = PayoutService.fail_payout(
             str(self.payout.external_id),
             'Insufficient funds'
@@ -210,3 +546,1791 @@ class PayoutServiceTest(TestCase):
         self.assertFalse(result.success)
         self.assertEqual(result.status, PayoutRequest.Status.FAILED)
         self.assertIn('Insufficient funds', result.message)
+    
+    def test_complete_payout_requires_processing(self):
+        """Тест отказа завершить заявку, которая не в обработке."""
+        result = PayoutService.complete_payout(str(self.payout.external_id))
+        
+        self.assertFalse(result.success)
+        self.assertEqual(result.status, PayoutRequest.Status.PENDING)
+        self.payout.refresh_from_db()
+        self.assertEqual(self.payout.status, PayoutRequest.Status.PENDING)
+    
+    def test_fail_payout_does_not_overwrite_final_status(self):
+        """Тест того, что fail_payout не перезаписывает финальный статус."""
+        PayoutService.start_processing(str(self.payout.external_id))
+        PayoutService.complete_payout(str(self.payout.external_id))
+        
+        result = PayoutService.fail_payout(str(self.payout.external_id), 'late error')
+        
+        self.assertEqual(result.status, PayoutRequest.Status.COMPLETED)
+        self.payout.refresh_from_db()
+        self.assertEqual(self.payout.status, PayoutRequest.Status.COMPLETED)
+    
+    def test_start_processing_lost_race(self):
+        """Тест повторного старта: второй переход проигрывает гонку."""
+        first = PayoutService.start_processing(str(self.payout.external_id))
+        second = PayoutService.start_processing(str(self.payout.external_id))
+        
+        self.assertEqual(first.external_id, self.payout.external_id)
+        self.assertEqual(first.amount, Decimal('500.00'))
+        self.assertEqual(first.recipient_details['type'], 'card')
+        self.assertIsNone(second)
+    
+    def test_transition_unknown_payout(self):
+        """Тест перехода для несуществующей заявки."""
+        result = PayoutService.complete_payout('00000000-0000-0000-0000-000000000000')
+        
+        self.assertEqual(result.status, 'error')
+
+
+class PayoutBatchTaskTest(TransactionTestCase):
+    """Тесты пакетной обработки заявок."""
+    
+    def setUp(self):
+        """Создание тестовых заявок."""
+        self.payouts = [
+            PayoutRequest.objects.create(
+                amount=Decimal('100.00'),
+                currency='RUB',
+                recipient_details={'type': 'card', 'number': f'411111111111111{i}'}
+            )
+            for i in range(3)
+        ]
+    
+    @patch.object(PayoutService, 'validate_recipient', new_callable=AsyncMock, return_value=True)
+    def test_batch_isolates_failures(self, mock_validate):
+        """Тест: ошибка шлюза одной заявки не влияет на остальные и не переводит её в failed."""
+        broken = self.payouts[1].recipient_details['number']
+        
+        async def gateway(amount, currency, recipient_details, external_id=None):
+            if recipient_details['number'] == broken:
+                raise GatewayError('gateway timeout')
+            return True, 'ok'
+        
+        external_ids = [str(p.external_id) for p in self.payouts]
+        with patch.object(PayoutService, 'process_payment_gateway', side_effect=gateway), \
+                patch.object(process_payouts_batch, 'retry') as mock_retry:
+            results = process_payouts_batch(external_ids, concurrency=2)
+        
+        self.assertEqual([r['external_id'] for r in results], external_ids)
+        self.assertEqual(
+            [r['status'] for r in results],
+            [PayoutRequest.Status.COMPLETED, 'error', PayoutRequest.Status.COMPLETED]
+        )
+        self.assertIn('gateway timeout', results[1]['error'])
+        self.assertGreaterEqual(
+            REGISTRY.get_sample_value('payout_stage_seconds_count', {'stage': 'gateway'}), 3
+        )
+        self.assertEqual(
+            PayoutRequest.objects.get(pk=self.payouts[1].pk).status,
+            PayoutRequest.Status.PROCESSING
+        )
+        self.assertEqual(mock_retry.call_args.kwargs['args'][0], [external_ids[1]])
+        self.assertEqual(mock_retry.call_args.kwargs['kwargs'], {'resume': True})
+        
+        # Повтор продолжает заявку из processing с тем же ключом идемпотентности шлюза
+        with patch.object(
+            PayoutService, 'process_payment_gateway', new_callable=AsyncMock, return_value=(True, 'ok')
+        ) as mock_gateway:
+            results = process_payouts_batch([external_ids[1]], resume=True)
+        self.assertEqual(results[0]['status'], PayoutRequest.Status.COMPLETED)
+        self.assertEqual(mock_gateway.call_args.kwargs['external_id'], external_ids[1])
+    
+    @patch.object(PayoutService, 'validate_recipient', new_callable=AsyncMock, return_value=True)
+    def test_task_retries_unknown_outcome(self, mock_validate):
+        """Тест: таймаут шлюза — повтор задачи с тем же ключом, без перевода в failed."""
+        external_id = str(self.payouts[0].external_id)
+        statuses = []
+        
+        async def gateway(amount, currency, recipient_details, external_id=None):
+            statuses.append(await sync_to_async(
+                lambda: PayoutRequest.objects.get(external_id=external_id).status
+            )())
+            if len(statuses) == 1:
+                raise GatewayError('read timeout')
+            return True, 'ok'
+        
+        with patch.object(PayoutService, 'process_payment_gateway', side_effect=gateway), \
+                patch.object(PayoutService, 'fail_payout') as mock_fail:
+            result = process_payout_async.apply(args=(external_id,), throw=False).get()
+        
+        mock_fail.assert_not_called()
+        self.assertEqual(result['status'], PayoutRequest.Status.COMPLETED)
+        self.assertEqual(statuses, [PayoutRequest.Status.PROCESSING] * 2)
+    
+    @patch.object(PayoutService, 'validate_recipient', new_callable=AsyncMock, return_value=True)
+    def test_batch_skips_processed(self, mock_validate):
+        """Тест пропуска уже обработанных заявок в пакете."""
+        PayoutRequest.objects.filter(pk=self.payouts[0].pk).update(
+            status=PayoutRequest.Status.COMPLETED
+        )
+        
+        with patch.object(
+            PayoutService, 'process_payment_gateway',
+            new_callable=AsyncMock, return_value=(True, 'ok')
+        ):
+            results = process_payouts_batch([str(self.payouts[0].external_id)])
+        
+        self.assertEqual(results[0]['status'], 'skipped')
+    
+    def test_batch_deferred_when_circuit_open(self):
+        """Тест отложенной обработки при открытом circuit шлюза."""
+        guard = get_gateway_guard()
+        self.addCleanup(guard.breaker.record_success)
+        for _ in range(guard.breaker.failure_threshold):
+            guard.breaker.record_failure()
+        
+        external_ids = [str(p.external_id) for p in self.payouts]
+        with patch('payments.tasks.process_payouts_batch.apply_async') as mock_apply:
+            results = process_payouts_batch(external_ids)
+        
+        self.assertEqual({r['status'] for r in results}, {'deferred'})
+        self.assertEqual(mock_apply.call_args.args[0][0], external_ids)
+        self.assertGreater(mock_apply.call_args.kwargs['countdown'], 0)
+        self.assertFalse(
+            PayoutRequest.objects.exclude(status=PayoutRequest.Status.PENDING).exists()
+        )
+
+
+    @patch.object(PayoutService, 'validate_recipient', new_callable=AsyncMock, return_value=True)
+    def test_batch_deferred_after_start_processing(self, mock_validate):
+        """Тест: circuit открылся после start_processing — заявка отложена, а не failed."""
+        external_ids = [str(p.external_id) for p in self.payouts]
+        with patch.object(PayoutService, 'process_payment_gateway', side_effect=CircuitOpenError(3)), \
+                patch('payments.tasks.process_payouts_batch.apply_async') as mock_apply:
+            results = process_payouts_batch(external_ids)
+        
+        self.assertEqual({r['status'] for r in results}, {'deferred'})
+        self.assertEqual(mock_apply.call_args.args[0][0], external_ids)
+        self.assertEqual(mock_apply.call_args.args[1], {'resume': True})
+        self.assertEqual(mock_apply.call_args.kwargs['countdown'], 3)
+        self.assertFalse(
+            PayoutRequest.objects.exclude(status=PayoutRequest.Status.PROCESSING).exists()
+        )
+    
+    @patch.object(PayoutService, 'validate_recipient', new_callable=AsyncMock, return_value=True)
+    def test_redispatch_keeps_queue(self, mock_validate):
+        """Тест: повтор и переотправка публикуются явно в очередь полученного сообщения."""
+        deferred, failed = (p.recipient_details['number'] for p in self.payouts[:2])
+        
+        async def gateway(amount, currency, recipient_details, external_id=None):
+            if recipient_details['number'] == deferred:
+                raise CircuitOpenError(3)
+            if recipient_details['number'] == failed:
+                raise GatewayError('gateway timeout')
+            return True, 'ok'
+        
+        external_ids = [str(p.external_id) for p in self.payouts]
+        process_payouts_batch.push_request(delivery_info={'exchange': 'payouts_fx', 'routing_key': 'payouts_fx'})
+        self.addCleanup(process_payouts_batch.pop_request)
+        with patch.object(PayoutService, 'process_payment_gateway', side_effect=gateway), \
+                patch('payments.tasks.process_payouts_batch.apply_async') as mock_apply, \
+                patch.object(process_payouts_batch, 'retry') as mock_retry:
+            process_payouts_batch.run(external_ids)
+        
+        self.assertEqual(mock_apply.call_args.args[0][0], [external_ids[0]])
+        self.assertEqual(mock_apply.call_args.kwargs['queue'], 'payouts_fx')
+        self.assertEqual(mock_retry.call_args.kwargs['args'][0], [external_ids[1]])
+        self.assertEqual(mock_retry.call_args.kwargs['queue'], 'payouts_fx')
+
+
+class PayoutWriteBehindTest(TransactionTestCase):
+    """Тесты write-behind финальных статусов."""
+    
+    def setUp(self):
+        self.payouts = [
+            PayoutRequest.objects.create(
+                amount=Decimal('100.00'),
+                currency='RUB',
+                recipient_details={'type': 'card', 'number': f'411111111111111{i}'}
+            )
+            for i in range(4)
+        ]
+        self.external_ids = [str(p.external_id) for p in self.payouts]
+    
+    def flush_count(self) -> float:
+        return REGISTRY.get_sample_value('payout_write_behind_flush_size_count') or 0
+    
+    @override_settings(PAYOUT_WRITE_BEHIND=True)
+    @patch.object(PayoutService, 'validate_recipient', new_callable=AsyncMock, return_value=True)
+    def test_batch_flushes_final_statuses_together(self, mock_validate):
+        """Тест: финальные статусы пакета пишутся пачками, результат — после записи."""
+        declined = self.payouts[1].recipient_details['number']
+        
+        async def gateway(amount, currency, recipient_details, external_id=None):
+            if recipient_details['number'] == declined:
+                return False, 'declined'
+            return True, 'ok'
+        
+        PayoutRequest.objects.filter(pk=self.payouts[3].pk).update(status=PayoutRequest.Status.COMPLETED)
+        stats.rebuild()
+        flushes = self.flush_count()
+        buffer = WriteBehindBuffer(max_items=2, flush_interval=0.05)
+        with patch('payments.tasks.get_write_behind', return_value=buffer), \
+                patch.object(PayoutService, 'process_payment_gateway', side_effect=gateway), \
+                patch.object(PayoutService, 'complete_payout') as mock_complete:
+            results = process_payouts_batch(self.external_ids)
+        
+        mock_complete.assert_not_called()
+        self.assertEqual(
+            [r['status'] for r in results],
+            [PayoutRequest.Status.COMPLETED, PayoutRequest.Status.FAILED, PayoutRequest.Status.COMPLETED, 'skipped']
+        )
+        self.assertEqual(results[1]['message'], 'declined')
+        self.assertEqual(self.flush_count() - flushes, 2)
+        self.assertEqual(
+            list(PayoutRequest.objects.order_by('created_at', 'id').values_list('status', flat=True)),
+            ['completed', 'failed', 'completed', 'completed']
+        )
+        
+        before = stats.snapshot()
+        stats.rebuild()
+        self.assertEqual(stats.snapshot(), before)
+    
+    @override_settings(PAYOUT_WRITE_BEHIND=True)
+    @patch.object(PayoutService, 'validate_recipient', new_callable=AsyncMock, return_value=True)
+    def test_flush_error_retries_task_from_recorded_result(self, mock_validate):
+        """Тест: ошибка flush не переводит заявку в failed, повтор задачи завершает её без шлюза."""
+        external_id = self.external_ids[0]
+        calls = []
+        
+        def flaky_finalize(items):
+            calls.append(items)
+            if len(calls) == 1:
+                raise DatabaseError('connection lost')
+            return finalize_payouts(items)
+        
+        buffer = WriteBehindBuffer(max_items=1, flush_interval=0.05)
+        with patch('payments.tasks.get_write_behind', return_value=buffer), \
+                patch('payments.write_behind.finalize_payouts', side_effect=flaky_finalize), \
+                patch.object(
+                    PayoutService, 'process_payment_gateway', new_callable=AsyncMock, return_value=(True, 'ok')
+                ) as mock_gateway, \
+                patch.object(PayoutService, 'fail_payout') as mock_fail:
+            result = process_payout_async.apply(args=(external_id,), throw=False).get()
+        
+        self.assertEqual(result['status'], PayoutRequest.Status.COMPLETED)
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(mock_gateway.await_count, 1)
+        mock_fail.assert_not_called()
+        self.assertEqual(PayoutRequest.objects.get(external_id=external_id).status, PayoutRequest.Status.COMPLETED)
+    
+    def test_redelivered_message_resumes(self):
+        """Тест: повторно доставленное брокером сообщение продолжает заявку из processing."""
+        self.assertTrue(_is_resumed(Mock(delivery_info={'redelivered': True}), False))
+        self.assertTrue(_is_resumed(Mock(delivery_info=None), True))
+        self.assertFalse(_is_resumed(Mock(delivery_info={'redelivered': False}), False))
+        self.assertFalse(_is_resumed(Mock(delivery_info=None), False))
+    
+    def test_finalize_payouts_guards_status(self):
+        """Тест: один UPDATE на пачку, проигранные гонки, повторы и неизвестные заявки отклоняются."""
+        PayoutRequest.objects.filter(pk__in=[p.pk for p in self.payouts[:3]]).update(
+            status=PayoutRequest.Status.PROCESSING
+        )
+        PayoutRequest.objects.filter(pk=self.payouts[2].pk).update(status=PayoutRequest.Status.CANCELLED)
+        unknown = str(uuid.uuid4())
+        items = [
+            (self.external_ids[0], PayoutRequest.Status.COMPLETED, ''),
+            (self.external_ids[1], PayoutRequest.Status.FAILED, 'declined'),
+            (self.external_ids[0], PayoutRequest.Status.FAILED, 'duplicate'),
+            (self.external_ids[2], PayoutRequest.Status.COMPLETED, ''),
+            (self.external_ids[3], PayoutRequest.Status.COMPLETED, ''),
+            (unknown, PayoutRequest.Status.COMPLETED, ''),
+        ]
+        
+        with CaptureQueriesContext(connection) as queries:
+            results = finalize_payouts(items)
+        
+        updates = [q['sql'] for q in queries.captured_queries if 'UPDATE "payments_payoutrequest"' in q['sql']]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(
+            [(r.success, r.status) for r in results],
+            [
+                (True, 'completed'),
+                (False, 'failed'),
+                (False, 'completed'),
+                (False, 'cancelled'),
+                (False, 'pending'),
+                (False, 'error'),
+            ]
+        )
+        self.assertEqual(results[1].message, 'declined')
+        self.assertEqual(
+            list(PayoutRequest.objects.order_by('created_at', 'id').values_list('status', flat=True)),
+            ['completed', 'failed', 'cancelled', 'pending']
+        )
+    
+    def test_flush_error_is_raised_to_waiters(self):
+        """Тест: при ошибке записи ожидающие корутины получают исключение, статус не меняется."""
+        PayoutRequest.objects.update(status=PayoutRequest.Status.PROCESSING)
+        buffer = WriteBehindBuffer(max_items=10, flush_interval=0.01)
+        
+        async def finish():
+            return await asyncio.gather(
+                buffer.complete(self.external_ids[0]),
+                buffer.fail(self.external_ids[1], 'declined'),
+                return_exceptions=True,
+            )
+        
+        with patch('payments.write_behind.finalize_payouts', side_effect=RuntimeError('db down')):
+            results = event_loop.run(finish())
+        
+        self.assertTrue(all(isinstance(r, RuntimeError) for r in results))
+        self.assertFalse(PayoutRequest.objects.exclude(status=PayoutRequest.Status.PROCESSING).exists())
+        
+        results = event_loop.run(finish())
+        self.assertEqual([r.status for r in results], ['completed', 'failed'])
+
+
+class WorkerEventLoopTest(SimpleTestCase):
+    """Тесты event loop worker процесса."""
+    
+    def tearDown(self):
+        event_loop.shutdown()
+    
+    def test_loop_reused_between_runs(self):
+        """Тест повторного использования loop между задачами."""
+        async def running_loop():
+            return asyncio.get_running_loop()
+        
+        self.assertIs(event_loop.run(running_loop()), event_loop.run(running_loop()))
+    
+    def test_shutdown_closes_resources(self):
+        """Тест закрытия общих ресурсов при остановке worker."""
+        closed = []
+        
+        async def close(resource):
+            closed.append(resource)
+        
+        resource = event_loop.get_resource('client', object, close=close)
+        self.assertIs(event_loop.get_resource('client', object, close=close), resource)
+        
+        event_loop.shutdown()
+        
+        self.assertEqual(closed, [resource])
+        self.assertIsNot(event_loop.get_resource('client', object), resource)
+
+
+class RecipientValidationCacheTest(SimpleTestCase):
+    """Тесты кэша валидации реквизитов."""
+    
+    def setUp(self):
+        get_recipient_cache().clear()
+        cache.clear()
+    
+    @patch.object(PayoutService, 'check_recipient', new_callable=AsyncMock, return_value=True)
+    def test_repeat_recipient_hits_cache(self, mock_check):
+        """Тест повторной валидации того же получателя из кэша."""
+        details = {'type': 'card', 'number': '4111111111111111', 'holder': 'Test'}
+        reordered = {'holder': 'Test', 'number': '4111111111111111', 'type': 'card'}
+        
+        self.assertTrue(event_loop.run(PayoutService.validate_recipient(details)))
+        self.assertTrue(event_loop.run(PayoutService.validate_recipient(reordered)))
+        
+        mock_check.assert_called_once()
+        self.assertEqual(get_recipient_cache().stats()['hits_local'], 1)
+        self.assertEqual(get_recipient_cache().stats()['misses'], 1)
+    
+    @patch.object(PayoutService, 'check_recipient', new_callable=AsyncMock, return_value=False)
+    def test_negative_result_from_shared_tier(self, mock_check):
+        """Тест отрицательного результата из общего уровня кэша."""
+        details = {'type': 'card', 'number': '123'}
+        
+        self.assertFalse(event_loop.run(PayoutService.validate_recipient(details)))
+        get_recipient_cache().clear()
+        self.assertFalse(event_loop.run(PayoutService.validate_recipient(details)))
+        
+        mock_check.assert_called_once()
+        self.assertEqual(get_recipient_cache().stats()['hits_shared'], 1)
+    
+    def test_lru_eviction(self):
+        """Тест вытеснения самой старой записи."""
+        lru = RecipientValidationCache(max_size=2, ttl=60, negative_ttl=10)
+        for key in ('a', 'b', 'c'):
+            lru._set_local(key, True)
+        
+        self.assertIsNone(lru._get_local('a'))
+        self.assertTrue(lru._get_local('c'))
+    
+    def test_shared_hit_keeps_remaining_ttl(self):
+        """Тест: попадание в общий кэш не продлевает запись на полный TTL."""
+        recipient_cache = RecipientValidationCache(max_size=10, ttl=3600, negative_ttl=60)
+        event_loop.run(recipient_cache.set('key', True))
+        recipient_cache.clear()
+        
+        with patch('payments.recipient_cache.time.time', return_value=time.time() + 3590):
+            self.assertTrue(event_loop.run(recipient_cache.get('key')))
+        self.assertLessEqual(recipient_cache._local['key'][1] - time.monotonic(), 10)
+        
+        recipient_cache.clear()
+        with patch('payments.recipient_cache.time.time', return_value=time.time() + 3601):
+            self.assertIsNone(event_loop.run(recipient_cache.get('key')))
+    
+    def test_cache_follows_settings(self):
+        """Тест: кэш создаётся лениво и учитывает override_settings."""
+        with override_settings(PAYOUT_RECIPIENT_CACHE_SIZE=3):
+            self.assertEqual(get_recipient_cache().max_size, 3)
+        self.assertEqual(get_recipient_cache().max_size, settings.PAYOUT_RECIPIENT_CACHE_SIZE)
+
+
+class PayoutRequestFastSerializerTest(TestCase):
+    """Тесты быстрого сериализатора."""
+    
+    def setUp(self):
+        for amount, currency in [('1500.00', 'RUB'), ('0.5', 'USD'), ('42', 'AED')]:
+            PayoutRequest.objects.create(
+                amount=Decimal(amount),
+                currency=currency,
+                recipient_details={'type': 'wallet', 'wallet_id': 'кошелёк-1', 'extra': [1, None]},
+                description='Описание'
+            )
+    
+    def assertSameJson(self):
+        queryset = PayoutRequest.objects.order_by('id')
+        expected = JSONRenderer().render(PayoutRequestSerializer(queryset, many=True).data)
+        actual = JSONRenderer().render(PayoutRequestFastSerializer.serialize(
+            queryset.values(*PayoutRequestFastSerializer.value_fields)
+        ))
+        self.assertEqual(actual, expected)
+    
+    def test_json_identical(self):
+        """Тест побайтового совпадения JSON с PayoutRequestSerializer."""
+        self.assertSameJson()
+    
+    def test_json_identical_in_utc(self):
+        """Тест совпадения формата дат в UTC (суффикс Z)."""
+        with timezone.override('UTC'):
+            self.assertSameJson()
+
+
+class BenchmarkCommandTest(TransactionTestCase):
+    """Смоук-тест команды benchmark."""
+    
+    def test_benchmark_writes_results(self):
+        """Тест прогона бенчмарка и сохранения результатов."""
+        User = get_user_model()
+        existing = User.objects.create_user('benchmark')
+        log_level = logging.getLogger('payments').level
+        with tempfile.TemporaryDirectory() as tmp:
+            output = os.path.join(tmp, 'bench.json')
+            call_command(
+                'benchmark', payouts=10, requests=3, pipeline=5,
+                gateway_latency=0, output=output, stdout=io.StringIO()
+            )
+            with open(output, encoding='utf-8') as f:
+                results = json.load(f)
+            
+            call_command(
+                'benchmark', payouts=10, requests=3, pipeline=5,
+                gateway_latency=0, baseline=output, stdout=io.StringIO()
+            )
+        
+        for stage in ('seed', 'api_create', 'api_list', 'api_retrieve', 'pipeline_total', 'pipeline_gateway'):
+            self.assertIn('p95_ms', results['stages'][stage])
+        self.assertEqual(results['stages']['pipeline_total']['items'], 5)
+        self.assertFalse(PayoutRequest.objects.exists())
+        self.assertEqual(stats.snapshot()['total'], 0)
+        self.assertFalse(PayoutStatusEvent.objects.exists())
+        self.assertEqual(list(User.objects.all()), [existing])
+        self.assertEqual(logging.getLogger('payments').level, log_level)
+
+
+class HttpGatewayTest(SimpleTestCase):
+    """Тесты HTTP-адаптера шлюза на локальном stand-in."""
+    
+    def setUp(self):
+        self.server = FakeGatewayServer(latency=0.02).start()
+        self.addCleanup(self.server.stop)
+        self.addCleanup(event_loop.shutdown)
+    
+    def make_gateway(self, **options):
+        return HttpGateway(base_url=self.server.url, max_keepalive_connections=5, **options)
+    
+    def test_connections_reused(self):
+        """Тест переиспользования keep-alive соединений между платежами."""
+        gateway = self.make_gateway(max_connections=5)
+        
+        async def pay_many():
+            try:
+                return await asyncio.gather(*(
+                    gateway.pay(Decimal('10.00'), 'RUB', {'type': 'card'}, external_id=str(i))
+                    for i in range(20)
+                ))
+            finally:
+                await gateway.close()
+        
+        results = event_loop.run(pay_many())
+        
+        self.assertTrue(all(success for success, _ in results))
+        self.assertEqual(self.server.stats['requests'], 20)
+        self.assertLessEqual(self.server.stats['connections'], 5)
+    
+    def test_server_error_raises(self):
+        """Тест ответа 5xx как GatewayError."""
+        self.server.error_rate = 1.0
+        gateway = self.make_gateway()
+        
+        with self.assertRaises(GatewayError):
+            event_loop.run(gateway.pay(Decimal('10.00'), 'RUB', {'type': 'card'}))
+        event_loop.run(gateway.close())
+    
+    def test_decline(self):
+        """Тест отклонённого платежа."""
+        self.server.decline_rate = 1.0
+        gateway = self.make_gateway()
+        
+        success, message = event_loop.run(gateway.pay(Decimal('10.00'), 'RUB', {'type': 'card'}))
+        event_loop.run(gateway.close())
+        
+        self.assertFalse(success)
+        self.assertEqual(message, 'Недостаточно средств')
+    
+    def test_gateway_shared_per_loop(self):
+        """Тест одного адаптера на event loop worker'а."""
+        with override_settings(PAYOUT_GATEWAY={
+            'BACKEND': 'payments.gateway.HttpGateway',
+            'OPTIONS': {'base_url': self.server.url},
+        }):
+            gateway = get_gateway()
+            self.assertIsInstance(gateway, HttpGateway)
+            self.assertIs(get_gateway(), gateway)
+
+
+class GatewayGuardTest(SimpleTestCase):
+    """Тесты адаптивного лимитера и circuit breaker шлюза."""
+    
+    def tearDown(self):
+        event_loop.shutdown()
+    
+    def make_guard(self, **limiter_options):
+        limiter_options = {'initial_limit': 4, 'latency_target': 0.05, **limiter_options}
+        return GatewayGuard(
+            AdaptiveLimiter(**limiter_options),
+            CircuitBreaker(failure_threshold=3, reset_timeout=0.1),
+        )
+    
+    def test_limit_backs_off_on_slow_and_grows_on_fast(self):
+        """Тест мультипликативного снижения и аддитивного роста лимита."""
+        guard = self.make_guard()
+        
+        async def slow():
+            await asyncio.sleep(0.08)
+            return True, 'ok'
+        
+        async def fast():
+            await asyncio.sleep(0)
+            return True, 'ok'
+        
+        event_loop.run(guard.call(slow))
+        self.assertEqual(guard.limiter.effective_limit, 2)
+        
+        async def burst():
+            for _ in range(50):
+                await asyncio.gather(*(guard.call(fast) for _ in range(guard.limiter.effective_limit)))
+        
+        event_loop.run(burst())
+        self.assertGreater(guard.limiter.effective_limit, 2)
+        self.assertEqual(guard.limiter.inflight, 0)
+    
+    def test_concurrency_capped_by_limit(self):
+        """Тест ограничения одновременных запросов лимитом."""
+        guard = self.make_guard(initial_limit=3, max_limit=3, latency_target=10)
+        peak = {'current': 0, 'max': 0}
+        
+        async def call():
+            peak['current'] += 1
+            peak['max'] = max(peak['max'], peak['current'])
+            await asyncio.sleep(0.01)
+            peak['current'] -= 1
+            return True, 'ok'
+        
+        async def many():
+            return await asyncio.gather(*(guard.call(call) for _ in range(12)))
+        
+        event_loop.run(many())
+        self.assertLessEqual(peak['max'], 3)
+    
+    def test_acquire_timeout(self):
+        """Тест отказа при ожидании слота дольше acquire_timeout."""
+        limiter = AdaptiveLimiter(initial_limit=1, acquire_timeout=0.01)
+        
+        async def scenario():
+            await limiter.acquire()
+            await limiter.acquire()
+        
+        with self.assertRaises(GatewayOverloadedError):
+            event_loop.run(scenario())
+        self.assertEqual(limiter.inflight, 1)
+    
+    def test_circuit_opens_and_recovers(self):
+        """Тест открытия circuit после серии ошибок и закрытия после пробы."""
+        guard = self.make_guard()
+        
+        async def broken():
+            raise GatewayError('503')
+        
+        async def healthy():
+            return True, 'ok'
+        
+        for _ in range(3):
+            with self.assertRaises(GatewayError):
+                event_loop.run(guard.call(broken))
+        
+        self.assertEqual(guard.breaker.state, CircuitBreaker.OPEN)
+        self.assertGreater(guard.defer_for(), 0)
+        with self.assertRaises(CircuitOpenError):
+            event_loop.run(guard.call(healthy))
+        
+        self.assertEqual(REGISTRY.get_sample_value('payout_gateway_circuit_state'), 2)
+        
+        # half-open наступает по времени: метрика вычисляется при чтении, без вызовов breaker'а
+        event_loop.run(asyncio.sleep(0.1))
+        self.assertEqual(REGISTRY.get_sample_value('payout_gateway_circuit_state'), 1)
+        self.assertEqual(guard.breaker.state, CircuitBreaker.HALF_OPEN)
+        event_loop.run(guard.call(healthy))
+        self.assertEqual(guard.breaker.state, CircuitBreaker.CLOSED)
+        self.assertEqual(REGISTRY.get_sample_value('payout_gateway_circuit_state'), 0)
+    
+    def test_decline_is_not_failure(self):
+        """Тест: отклонённый платёж не считается ошибкой шлюза."""
+        guard = self.make_guard()
+        
+        async def declined():
+            return False, 'Недостаточно средств'
+        
+        for _ in range(5):
+            event_loop.run(guard.call(declined))
+        
+        self.assertEqual(guard.breaker.state, CircuitBreaker.CLOSED)
+        self.assertEqual(guard.breaker.failures, 0)
+
+
+@override_settings(PAYOUT_CURRENCY_QUEUES={'USD': 'payouts_fx'})
+class PayoutRoutingTest(TestCase):
+    """Тесты маршрутизации задач по очередям."""
+    
+    def test_queue_rules(self):
+        """Тест правил выбора очереди."""
+        Priority = PayoutRequest.Priority
+        
+        self.assertEqual(queue_for('RUB', Decimal('100'), Priority.NORMAL), 'payouts')
+        self.assertEqual(queue_for('RUB', Decimal('100'), Priority.HIGH), 'payouts_high')
+        self.assertEqual(queue_for('RUB', Decimal('1000000'), Priority.LOW), 'payouts_high')
+        self.assertEqual(queue_for('RUB', Decimal('100'), Priority.LOW), 'payouts_low')
+        self.assertEqual(queue_for('USD', Decimal('100'), Priority.NORMAL), 'payouts_fx')
+        self.assertEqual(queue_for('USD', Decimal('50000'), Priority.NORMAL), 'payouts_high')
+    
+    def test_router_uses_payout_from_args(self):
+        """Тест роутера Celery: очередь по заявке, пачка — в самую срочную полосу."""
+        normal = PayoutRequest.objects.create(
+            amount=Decimal('100.00'), currency='RUB', recipient_details={'type': 'card'}
+        )
+        urgent = PayoutRequest.objects.create(
+            amount=Decimal('100.00'), currency='RUB', recipient_details={'type': 'card'},
+            priority=PayoutRequest.Priority.HIGH
+        )
+        single = 'payments.tasks.process_payout_async'
+        batch = 'payments.tasks.process_payouts_batch'
+        
+        self.assertEqual(route_task(single, [str(normal.external_id)], {}, {}), {'queue': 'payouts'})
+        self.assertEqual(
+            route_task(batch, [[str(normal.external_id), str(urgent.external_id)]], {}, {}),
+            {'queue': 'payouts_high'}
+        )
+        self.assertIsNone(route_task(single, [str(urgent.external_id)], {}, {'queue': 'manual'}))
+        self.assertEqual(route_task(single, ['not-a-uuid'], {}, {}), {'queue': 'payouts'})
+
+
+@patch('payments.tasks.process_payouts_batch.apply_async')
+class PayoutStatsTest(APITestCase):
+    """Тесты инкрементального агрегата по статусам и валютам."""
+    
+    def setUp(self):
+        self.admin = User.objects.create_superuser('statsadmin', 'stats@test.com', 'pass')
+        self.client.force_authenticate(user=self.admin)
+        self.payload = {
+            'amount': '100.50',
+            'currency': 'RUB',
+            'recipient_details': {'type': 'card', 'number': '4111111111111111'},
+        }
+    
+    def assertMatchesTable(self):
+        """Агрегат совпадает с GROUP BY по таблице заявок."""
+        expected = {
+            (row['status'], row['currency']): (row['count'], '{:f}'.format(Decimal(row['amount']).quantize(Decimal('0.01'))))
+            for row in PayoutRequest.objects.order_by().values('status', 'currency')
+            .annotate(count=Count('id'), amount=Sum('amount'))
+        }
+        actual = {
+            (row['status'], row['currency']): (row['count'], row['amount'])
+            for row in stats.snapshot()['results']
+        }
+        self.assertEqual(actual, expected)
+    
+    def test_counters_follow_lifecycle(self, mock_batch):
+        """Тест обновления агрегата при создании, переходах, правке и удалении."""
+        created = [
+            self.client.post('/api/v1/payouts/', self.payload, format='json').data['external_id']
+            for _ in range(3)
+        ]
+        self.client.post(
+            '/api/v1/payouts/bulk/', [{**self.payload, 'currency': 'USD'}] * 2, format='json'
+        )
+        self.assertMatchesTable()
+        
+        PayoutService.start_processing(created[0])
+        PayoutService.complete_payout(created[0])
+        PayoutService.start_processing(created[1])
+        PayoutService.fail_payout(created[1], 'test')
+        PayoutService.complete_payout(created[1])
+        self.client.patch(f'/api/v1/payouts/{created[2]}/', {'status': 'cancelled'}, format='json')
+        self.client.delete(f'/api/v1/payouts/{created[0]}/')
+        self.assertMatchesTable()
+        
+        response = self.client.get('/api/v1/payouts/stats/')
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['total'], 4)
+        self.assertEqual(response.data['by_status']['pending'], 2)
+        self.assertEqual(response.data['by_status']['completed'], 0)
+        self.assertIn(
+            {'status': 'failed', 'currency': 'RUB', 'count': 1, 'amount': '100.50'},
+            response.json()['results']
+        )
+    
+    def test_rows_spread_across_shards(self, mock_batch):
+        """Тест распределения записи по шардам."""
+        with override_settings(PAYOUT_STATS_SHARDS=4):
+            for _ in range(40):
+                stats.record_created([PayoutRequest(**{**self.payload, 'amount': Decimal('1')})])
+        
+        self.assertGreater(PayoutStatsShard.objects.count(), 1)
+        self.assertEqual(stats.snapshot()['by_status']['pending'], 40)
+    
+    def test_delete_queryset_and_rebuild(self, mock_batch):
+        """Тест удаления queryset'а с учётом в агрегате и полного пересчёта."""
+        for currency in ('RUB', 'USD', 'EUR'):
+            self.client.post('/api/v1/payouts/', {**self.payload, 'currency': currency}, format='json')
+        
+        deleted = stats.delete_queryset(PayoutRequest.objects.filter(currency='USD'), batch_size=1)
+        self.assertEqual(deleted, 1)
+        self.assertMatchesTable()
+        
+        PayoutRequest.objects.filter(currency='EUR').update(status=PayoutRequest.Status.CANCELLED)
+        stats.rebuild()
+        self.assertMatchesTable()
+
+
+@patch('payments.tasks.process_payouts_batch.apply_async')
+class StuckPayoutSweeperTest(TestCase):
+    """Тесты sweeper'а зависших заявок."""
+    
+    def setUp(self):
+        self.payouts = {
+            name: PayoutRequest.objects.create(
+                amount=Decimal('100.00'),
+                currency='RUB',
+                recipient_details={'type': 'card', 'number': '4111111111111111'}
+            )
+            for name in ('stuck', 'stuck_pending', 'fresh', 'completed')
+        }
+        long_ago = timezone.now() - timedelta(hours=1)
+        for name, payout_status in [
+            ('stuck', PayoutRequest.Status.PROCESSING),
+            ('stuck_pending', PayoutRequest.Status.PENDING),
+            ('completed', PayoutRequest.Status.COMPLETED),
+        ]:
+            PayoutRequest.objects.filter(pk=self.payouts[name].pk).update(
+                status=payout_status, updated_at=long_ago
+            )
+        PayoutRequest.objects.filter(pk=self.payouts['fresh'].pk).update(
+            status=PayoutRequest.Status.PROCESSING
+        )
+        stats.rebuild()
+    
+    def test_sweep_redispatches_stale_rows(self, mock_batch):
+        """Тест возврата зависших заявок в очередь."""
+        PayoutOutbox.objects.all().delete()
+        swept = sweep_stuck_payouts()
+        relay_outbox()
+        
+        self.assertEqual(swept, {'processing': 1, 'pending': 1})
+        enqueued = {external_id for call in mock_batch.call_args_list for external_id in call[0][0][0]}
+        self.assertEqual(enqueued, {
+            str(self.payouts['stuck'].external_id),
+            str(self.payouts['stuck_pending'].external_id),
+        })
+        statuses = dict(PayoutRequest.objects.values_list('pk', 'status'))
+        self.assertEqual(statuses[self.payouts['stuck'].pk], PayoutRequest.Status.PENDING)
+        self.assertEqual(statuses[self.payouts['fresh'].pk], PayoutRequest.Status.PROCESSING)
+        self.assertEqual(statuses[self.payouts['completed'].pk], PayoutRequest.Status.COMPLETED)
+        self.assertEqual(stats.snapshot()['by_status']['pending'], 2)
+        
+        self.assertEqual(sweep_stuck_payouts(), {'processing': 0, 'pending': 0})
+    
+    def test_sweep_bounded_batches(self, mock_batch):
+        """Тест ограничения числа пачек за один запуск."""
+        with self.captureOnCommitCallbacks(execute=True):
+            PayoutRequest.objects.filter(pk=self.payouts['fresh'].pk).update(
+                updated_at=timezone.now() - timedelta(hours=1)
+            )
+            swept = sweep_stuck_payouts(batch_size=1, max_batches=1)
+        
+        self.assertEqual(swept, {'processing': 1, 'pending': 1})
+        self.assertEqual(
+            PayoutRequest.objects.filter(status=PayoutRequest.Status.PROCESSING).count(), 1
+        )
+    
+    def test_beat_schedule(self, mock_batch):
+        """Тест регистрации периодической задачи."""
+        from core.celery import app
+        
+        task_name = settings.CELERY_BEAT_SCHEDULE['sweep-stuck-payouts']['task']
+        self.assertIn(task_name, app.tasks)
+
+
+class PayoutArchiveTest(APITestCase):
+    """Тесты переноса финальных заявок в архив и чтения из обеих таблиц."""
+    
+    def setUp(self):
+        User = get_user_model()
+        self.admin = User.objects.create_superuser('archiveadmin', 'archive@test.com', 'pass')
+        self.client.force_authenticate(user=self.admin)
+        
+        now = timezone.now()
+        long_ago = now - timedelta(days=settings.PAYOUT_ARCHIVE_AFTER_DAYS + 1)
+        self.payouts = []
+        for index in range(6):
+            payout = PayoutRequest.objects.create(
+                amount=Decimal('100.00') + index,
+                currency='RUB',
+                recipient_details={'type': 'card', 'number': '4111111111111111'},
+                idempotency_key=f'archive-{index}',
+            )
+            PayoutIdempotencyKey.objects.create(
+                key=payout.idempotency_key,
+                fingerprint=request_fingerprint(self.archive_payload(index)),
+                external_id=payout.external_id
+            )
+            self.payouts.append(payout)
+        # Старые финальные (0, 2, 4), свежая финальная (1), старая и новая активные (3, 5)
+        for index, payout in enumerate(self.payouts):
+            payout_status = PayoutRequest.Status.PENDING if index in (3, 5) else PayoutRequest.Status.COMPLETED
+            PayoutRequest.objects.filter(pk=payout.pk).update(
+                status=payout_status,
+                created_at=now - timedelta(minutes=10 - index),
+                updated_at=now if index in (1, 5) else long_ago,
+            )
+        stats.rebuild()
+        self.archived_ids = {str(self.payouts[index].external_id) for index in (0, 2, 4)}
+    
+    def archive(self):
+        self.assertEqual(archive_finalized_payouts(), 3)
+    
+    @staticmethod
+    def archive_payload(index: int) -> dict:
+        return {
+            'amount': f'{100 + index}.00',
+            'currency': 'RUB',
+            'recipient_details': {'type': 'card', 'number': '4111111111111111'},
+        }
+    
+    def test_archive_moves_only_old_final_rows(self):
+        """Тест переноса только старых финальных заявок без изменения статистики."""
+        before = stats.snapshot()
+        self.archive()
+        
+        self.assertEqual(
+            {str(external_id) for external_id in PayoutRequestArchive.objects.values_list('external_id', flat=True)},
+            self.archived_ids
+        )
+        self.assertEqual(PayoutRequest.objects.count(), 3)
+        archived = PayoutRequestArchive.objects.get(pk=self.payouts[0].pk)
+        self.assertEqual(archived.amount, Decimal('100.00'))
+        self.assertEqual(archived.idempotency_key, 'archive-0')
+        self.assertEqual(stats.snapshot(), before)
+        self.assertEqual(stats.rebuild(), 2)
+        self.assertEqual(stats.snapshot(), before)
+        self.assertEqual(archive_finalized_payouts(), 0)
+    
+    def test_archive_bounded_batches(self):
+        """Тест ограничения размера и числа пачек."""
+        self.assertEqual(archive_finalized_payouts(batch_size=2, max_batches=1), 2)
+        self.assertEqual(archive_finalized_payouts(batch_size=2, max_batches=1), 1)
+    
+    def test_retrieve_archived(self):
+        """Тест получения заявки из архива тем же запросом."""
+        expected = self.client.get(f'/api/v1/payouts/{self.payouts[0].external_id}/').json()
+        self.archive()
+        
+        response = self.client.get(f'/api/v1/payouts/{self.payouts[0].external_id}/')
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json(), expected)
+    
+    def test_list_scopes_and_pagination(self):
+        """Тест списка по обеим таблицам с курсорной пагинацией."""
+        expected = self.client.get('/api/v1/payouts/').json()['results']
+        self.archive()
+        
+        results = []
+        url = '/api/v1/payouts/?page_size=2'
+        while url:
+            page = self.client.get(url).json()
+            results += page['results']
+            url = page['next']
+        self.assertEqual(results, expected)
+        
+        second = self.client.get(self.client.get('/api/v1/payouts/?page_size=2').json()['next']).json()
+        self.assertEqual(self.client.get(second['previous']).json()['results'], expected[:2])
+        
+        active = self.client.get('/api/v1/payouts/?scope=active').json()['results']
+        archived = self.client.get('/api/v1/payouts/?scope=archived&ordering=created_at').json()['results']
+        self.assertEqual(len(active), 3)
+        self.assertEqual(
+            [row['external_id'] for row in archived],
+            [str(self.payouts[index].external_id) for index in (0, 2, 4)]
+        )
+        self.assertEqual(len(self.client.get('/api/v1/payouts/?status=pending').json()['results']), 2)
+        self.assertEqual(self.client.get('/api/v1/payouts/?scope=cold').status_code, status.HTTP_400_BAD_REQUEST)
+    
+    def test_export_includes_archive(self):
+        """Тест выгрузки из обеих таблиц в порядке списка."""
+        self.archive()
+        
+        response = self.client.get('/api/v1/payouts/export/?ordering=amount')
+        
+        rows = [
+            json.loads(line)
+            for line in b''.join(response.streaming_content).decode().splitlines()
+        ]
+        self.assertEqual([row['amount'] for row in rows], [f'{100 + index}.00' for index in range(6)])
+    
+    def test_idempotent_replay_after_archive(self):
+        """Тест повтора запроса с ключом заявки, перенесённой в архив."""
+        self.archive()
+        cache.clear()
+        
+        response = self.client.post(
+            '/api/v1/payouts/', self.archive_payload(0), format='json', HTTP_IDEMPOTENCY_KEY='archive-0'
+        )
+        
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response['Idempotent-Replayed'], 'true')
+        self.assertEqual(response.json()['external_id'], str(self.payouts[0].external_id))
+    
+    def test_idempotent_create_races_archive(self):
+        """Тест гонки с архивацией: ключ заявки из архива не создаёт дубликат."""
+        self.archive()
+        cache.clear()
+        real_replay = PayoutRequestViewSet.get_idempotent_replay
+        calls = []
+        
+        def replay_after_archive(view, key, fingerprint):
+            calls.append(key)
+            return None if len(calls) == 1 else real_replay(view, key, fingerprint)
+        
+        with patch.object(PayoutRequestViewSet, 'get_idempotent_replay', replay_after_archive):
+            response = self.client.post(
+                '/api/v1/payouts/', self.archive_payload(2), format='json', HTTP_IDEMPOTENCY_KEY='archive-2'
+            )
+        
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.json()['external_id'], str(self.payouts[2].external_id))
+        self.assertEqual(PayoutRequest.objects.count(), 3)
+    
+    def test_beat_schedule(self):
+        """Тест регистрации периодической задачи архивации."""
+        from core.celery import app
+        
+        task_name = settings.CELERY_BEAT_SCHEDULE['archive-finalized-payouts']['task']
+        self.assertIn(task_name, app.tasks)
+
+
+@patch('payments.tasks.process_payouts_batch.apply_async')
+class PayoutOutboxTest(TestCase):
+    """Тесты transactional outbox и relay."""
+    
+    def create_payout(self, **kwargs):
+        return PayoutRequest.objects.create(
+            amount=Decimal('100.00'),
+            currency='RUB',
+            recipient_details={'type': 'card', 'number': '4111111111111111'},
+            **kwargs
+        )
+    
+    def test_outbox_rolled_back_with_payout(self, mock_batch):
+        """Тест: сообщение не переживает откат транзакции заявки."""
+        try:
+            with transaction.atomic():
+                self.create_payout()
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        
+        self.assertFalse(PayoutOutbox.objects.exists())
+        self.assertEqual(relay_outbox(), 0)
+        mock_batch.assert_not_called()
+    
+    def test_publish_failure_keeps_messages(self, mock_batch):
+        """Тест: при ошибке брокера строки остаются в outbox для повтора."""
+        payout = self.create_payout()
+        mock_batch.side_effect = ConnectionError('broker down')
+        
+        with self.assertRaises(ConnectionError):
+            relay_outbox()
+        self.assertEqual(PayoutOutbox.objects.count(), 1)
+        
+        mock_batch.side_effect = None
+        self.assertEqual(relay_outbox(), 1)
+        self.assertEqual(mock_batch.call_args[0][0], ([str(payout.external_id)],))
+    
+    @override_settings(PAYOUT_BULK_CHUNK_SIZE=2)
+    def test_drain_batches_and_deduplicates(self, mock_batch):
+        """Тест публикации пачками: повтор заявки схлопывается, сообщения чанкуются по очередям."""
+        payouts = [self.create_payout() for _ in range(4)]
+        urgent = self.create_payout(priority=PayoutRequest.Priority.HIGH)
+        enqueue_payouts(payouts[3:])
+        
+        self.assertEqual(drain_outbox(batch_size=3), 6)
+        
+        self.assertFalse(PayoutOutbox.objects.exists())
+        sent = [(call.kwargs['queue'], call[0][0][0]) for call in mock_batch.call_args_list]
+        ids = [str(payout.external_id) for payout in payouts]
+        self.assertEqual(sent, [
+            ('payouts', ids[:2]),
+            ('payouts', ids[2:3]),
+            ('payouts', ids[3:4]),
+            ('payouts_high', [str(urgent.external_id)]),
+        ])
+    
+    def test_beat_schedule(self, mock_batch):
+        """Тест регистрации периодической задачи relay."""
+        from core.celery import app
+        
+        task_name = settings.CELERY_BEAT_SCHEDULE['relay-payout-outbox']['task']
+        self.assertIn(task_name, app.tasks)
+
+
+class PayoutCacheTest(APITestCase):
+    """Тесты read-through кэша получения заявки."""
+    
+    def setUp(self):
+        cache.clear()
+        User = get_user_model()
+        self.admin = User.objects.create_superuser('cacheadmin', 'cache@test.com', 'pass')
+        self.client.force_authenticate(user=self.admin)
+        self.payout = PayoutRequest.objects.create(
+            amount=Decimal('100.00'),
+            currency='RUB',
+            recipient_details={'type': 'card', 'number': '4111111111111111'}
+        )
+        self.url = f'/api/v1/payouts/{self.payout.external_id}/'
+    
+    def test_repeated_retrieve_served_from_cache(self):
+        """Тест: повторный запрос не обращается к БД."""
+        first = self.client.get(self.url).json()
+        
+        with self.assertNumQueries(0):
+            second = self.client.get(self.url).json()
+        
+        self.assertEqual(second, first)
+        with self.assertNumQueries(1):
+            self.client.get(f'{self.url}?status=pending')
+    
+    def test_transition_invalidates(self):
+        """Тест сброса кэша переходом статуса в сервисе и PATCH."""
+        self.client.get(self.url)
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            PayoutService.start_processing(str(self.payout.external_id))
+        self.assertEqual(self.client.get(self.url).json()['status'], 'processing')
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(self.url, {'description': 'обновлено'}, format='json')
+        self.assertEqual(self.client.get(self.url).json()['description'], 'обновлено')
+    
+    @override_settings(PAYOUT_CACHE_TTL=0)
+    def test_only_final_status_cached_long(self):
+        """Тест: с нулевым TTL активных заявок кэшируются только финальные."""
+        self.client.get(self.url)
+        with self.assertNumQueries(1):
+            self.client.get(self.url)
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            PayoutService.start_processing(str(self.payout.external_id))
+            PayoutService.complete_payout(str(self.payout.external_id))
+        self.assertEqual(self.client.get(self.url).json()['status'], 'completed')
+        with self.assertNumQueries(0):
+            self.client.get(self.url)
+    
+    def test_destroy_leaves_tombstone(self):
+        """Тест: после удаления заявка не отдаётся из кэша."""
+        self.client.get(self.url)
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(self.url)
+        
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+    
+    @override_settings(PAYOUT_CACHE_LOCK_WAIT=2.0)
+    def test_stampede_waits_for_loader(self):
+        """Тест: при занятой блокировке ждём значение, загруженное другим процессом."""
+        external_id = str(self.payout.external_id)
+        cache.add(payout_cache._lock_key(external_id), 1)
+        threading.Timer(
+            0.05, cache.set, args=(payout_cache._cache_key(external_id), {'status': 'pending'})
+        ).start()
+        loader = Mock()
+        
+        self.assertEqual(payout_cache.get_payout(external_id, loader), {'status': 'pending'})
+        loader.assert_not_called()
+    
+    @override_settings(PAYOUT_CACHE_LOCK_WAIT=0.05)
+    def test_stampede_wait_times_out(self):
+        """Тест: не дождавшись другого процесса, читаем из БД сами."""
+        external_id = str(self.payout.external_id)
+        cache.add(payout_cache._lock_key(external_id), 1)
+        
+        self.assertEqual(
+            payout_cache.get_payout(external_id, lambda: {'status': 'pending'}),
+            {'status': 'pending'}
+        )
+    
+    def test_lock_unavailable_falls_back_to_loader(self):
+        """Тест: недоступный кэш при взятии блокировки не ломает чтение."""
+        broken = Mock()
+        broken.get.return_value = None
+        broken.add.side_effect = redis.ConnectionError('down')
+        broken.aget = AsyncMock(return_value=None)
+        broken.aadd = AsyncMock(side_effect=redis.ConnectionError('down'))
+        
+        async def aloader():
+            return {'status': 'pending'}
+        
+        with patch('payments.payout_cache.cache', broken):
+            self.assertEqual(payout_cache.get_payout('x', lambda: {'status': 'pending'}), {'status': 'pending'})
+            self.assertEqual(asyncio.run(payout_cache.aget_payout('x', aloader)), {'status': 'pending'})
+            broken.get.side_effect = None
+            broken.add.side_effect = None
+            broken.add.return_value = True
+            broken.delete.side_effect = redis.ConnectionError('down')
+            self.assertEqual(payout_cache.get_payout('x', lambda: {'status': 'pending'}), {'status': 'pending'})
+
+
+async def listen_without_redis(hub):
+    """Подписка StatusHub без Redis: события передаются через hub.dispatch."""
+    hub._ready.set()
+    await asyncio.Event().wait()
+
+
+class AsyncReadViewsTest(APITestCase):
+    """Тесты async-маршрутов чтения (список, заявка, статус)."""
+    
+    def setUp(self):
+        cache.clear()
+        User = get_user_model()
+        self.admin = User.objects.create_superuser('asyncadmin', 'async@test.com', 'pass')
+        self.client.force_authenticate(user=self.admin)
+        for currency in ['RUB', 'USD', 'RUB']:
+            self.payout = PayoutRequest.objects.create(
+                amount=Decimal('100.00'),
+                currency=currency,
+                recipient_details={'type': 'card', 'number': '4111111111111111'}
+            )
+        self.status_url = f'/api/v1/payouts/{self.payout.external_id}/status/'
+    
+    def sync_response(self, actions, path, **kwargs):
+        request = APIRequestFactory().get(path)
+        force_authenticate(request, user=self.admin)
+        response = PayoutRequestViewSet.as_view(actions)(request, **kwargs)
+        return json.loads(response.render().content)
+    
+    def test_routes_are_async(self):
+        """Тест: GET-маршруты обслуживаются корутинами, viewset остаётся для схемы."""
+        for path in ['/api/v1/payouts/', f'/api/v1/payouts/{self.payout.external_id}/', self.status_url]:
+            match = resolve(path)
+            self.assertTrue(asyncio.iscoroutinefunction(match.func))
+            self.assertIs(match.func.cls, PayoutRequestViewSet)
+        
+        # Запись тех же URL выполняет sync viewset
+        response = self.client.delete(f'/api/v1/payouts/{self.payout.external_id}/')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+    
+    def test_atomic_requests_keep_sync_routes(self):
+        """Тест: с ATOMIC_REQUESTS маршруты остаются sync viewset'ом."""
+        for atomic_requests, is_async in [(False, True), (True, False)]:
+            router = DefaultRouter()
+            router.register(r'payouts', PayoutRequestViewSet, basename='payout')
+            with patch.dict(connection.settings_dict, ATOMIC_REQUESTS=atomic_requests):
+                async_read_routes(router.urls, {'payout-list': payout_list})
+            callbacks = {pattern.name: pattern.callback for pattern in router.urls if hasattr(pattern, 'name')}
+            self.assertEqual(asyncio.iscoroutinefunction(callbacks['payout-list']), is_async)
+            self.assertFalse(asyncio.iscoroutinefunction(callbacks['payout-detail']))
+    
+    def test_responses_match_sync_viewset(self):
+        """Тест совпадения JSON с sync viewset."""
+        path = '/api/v1/payouts/?currency=RUB&ordering=created_at&page_size=1'
+        self.assertEqual(self.client.get(path).json(), self.sync_response({'get': 'list'}, path))
+        
+        path = f'/api/v1/payouts/{self.payout.external_id}/'
+        self.assertEqual(
+            self.client.get(path).json(),
+            self.sync_response({'get': 'retrieve'}, path, external_id=str(self.payout.external_id))
+        )
+        self.assertEqual(
+            self.client.get(self.status_url).json(),
+            self.sync_response({'get': 'payout_status'}, self.status_url, external_id=str(self.payout.external_id))
+        )
+    
+    def test_auth_and_permissions(self):
+        """Тест Basic-аутентификации и IsAdminUser как у viewset."""
+        User = get_user_model()
+        User.objects.create_user('asyncuser', 'user@test.com', 'pass')
+        self.client.force_authenticate(user=None)
+        
+        unauthenticated = self.client.get('/api/v1/payouts/')
+        self.assertEqual(unauthenticated.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(unauthenticated.json(), self.client.get('/api/v1/payouts/stats/').json())
+        
+        for username, password, expected in [
+            ('asyncadmin', 'pass', status.HTTP_200_OK),
+            ('asyncadmin', 'wrong', status.HTTP_403_FORBIDDEN),
+            ('asyncuser', 'pass', status.HTTP_403_FORBIDDEN),
+        ]:
+            credentials = base64.b64encode(f'{username}:{password}'.encode()).decode()
+            self.client.credentials(HTTP_AUTHORIZATION=f'Basic {credentials}')
+            self.assertEqual(self.client.get('/api/v1/payouts/').status_code, expected)
+    
+    @patch.object(PayoutRequestViewSet, 'authentication_classes', [BasicAuthentication])
+    def test_authentication_classes_of_viewset(self):
+        """Тест: схемы аутентификации и ответ 401 с WWW-Authenticate берутся из viewset'а."""
+        self.client.force_authenticate(user=None)
+        for path in ['/api/v1/payouts/', self.status_url, '/api/v1/payouts/stats/']:
+            response = self.client.get(path)
+            self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+            self.assertEqual(response['WWW-Authenticate'], 'Basic realm="api"')
+        
+        self.client.login(username='asyncadmin', password='pass')
+        self.assertEqual(self.client.get('/api/v1/payouts/').status_code, status.HTTP_401_UNAUTHORIZED)
+        
+        credentials = base64.b64encode(b'asyncadmin:pass').decode()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Basic {credentials}')
+        self.assertEqual(self.client.get('/api/v1/payouts/').status_code, status.HTTP_200_OK)
+    
+    @override_settings(PAYOUT_STATUS_POLL_INTERVAL=0.01)
+    @patch.object(StatusHub, '_listen', listen_without_redis)
+    def test_status_long_polling(self):
+        """Тест ожидания изменения статуса."""
+        pending = PayoutRequestFastSerializer.to_representation(
+            PayoutRequest.objects.values(*PayoutRequestFastSerializer.value_fields).get(pk=self.payout.pk)
+        )
+        processing = {**pending, 'status': 'processing', 'status_display': 'В обработке'}
+        
+        with patch('payments.async_views.payout_cache.aget_payout', side_effect=[pending, pending, processing]) as lookup:
+            data = self.client.get(f'{self.status_url}?since=pending&wait=5').json()
+        self.assertEqual(data['status'], 'processing')
+        self.assertFalse(data['is_final'])
+        self.assertEqual(lookup.call_count, 3)
+        
+        started_at = time.monotonic()
+        data = self.client.get(f'{self.status_url}?since=pending&wait=0.05').json()
+        self.assertEqual(data['status'], 'pending')
+        self.assertGreaterEqual(time.monotonic() - started_at, 0.05)
+        
+        for query in ['wait=abc', 'wait=-1', 'since=unknown']:
+            self.assertEqual(
+                self.client.get(f'{self.status_url}?{query}').status_code, status.HTTP_400_BAD_REQUEST
+            )
+        self.assertEqual(
+            self.client.get(f'/api/v1/payouts/{uuid.uuid4()}/status/').status_code, status.HTTP_404_NOT_FOUND
+        )
+
+
+@patch.object(StatusHub, '_listen', listen_without_redis)
+class PayoutStatusEventsTest(APITestCase):
+    """Тесты событий статуса: публикация в Redis и SSE-поток."""
+    
+    def setUp(self):
+        cache.clear()
+        User = get_user_model()
+        self.admin = User.objects.create_superuser('sseadmin', 'sse@test.com', 'pass')
+        self.payout = PayoutRequest.objects.create(
+            amount=Decimal('100.00'),
+            currency='RUB',
+            recipient_details={'type': 'card', 'number': '4111111111111111'}
+        )
+        self.events_url = f'/api/v1/payouts/{self.payout.external_id}/events/'
+    
+    @staticmethod
+    def parse_event(chunk) -> dict:
+        lines = chunk.decode().strip().split('\n')
+        assert lines[0] == 'event: status', lines
+        return json.loads(lines[1].removeprefix('data: '))
+    
+    def event(self, payout_status: str, seconds: int) -> dict:
+        return PayoutRequestFastSerializer.status_event(
+            self.payout.external_id, payout_status, self.payout.updated_at + timedelta(seconds=seconds)
+        )
+    
+    def test_publish_after_commit(self):
+        """Тест: событие публикуется в фоне после коммита, ошибка Redis не ломает переход."""
+        publisher = MagicMock()
+        pipe = publisher.pipeline.return_value.__enter__.return_value
+        event_publisher = EventPublisher(queue_size=10, retry_interval=60)
+        with patch('payments.events._get_publisher', return_value=publisher), \
+                patch('payments.events.get_event_publisher', return_value=event_publisher):
+            with self.captureOnCommitCallbacks(execute=True):
+                PayoutService.transition(self.payout.external_id, 'processing')
+                pipe.publish.assert_not_called()
+            event_publisher.flush()
+            
+            channel, message = pipe.publish.call_args.args
+            self.assertEqual(channel, settings.PAYOUT_EVENTS_CHANNEL)
+            self.assertEqual(json.loads(message)['status'], 'processing')
+            self.assertEqual(json.loads(message)['external_id'], str(self.payout.external_id))
+            pipe.execute.assert_called_once()
+            
+            # После ошибки Redis события отбрасываются до истечения retry_interval
+            pipe.execute.side_effect = redis.RedisError('down')
+            with self.assertLogs('payments.events', 'WARNING'):
+                for _ in range(3):
+                    with self.captureOnCommitCallbacks(execute=True):
+                        publish_status([self.payout])
+                    event_publisher.flush()
+            self.assertEqual(pipe.execute.call_count, 2)
+            self.assertTrue(event_publisher._failing)
+    
+    async def test_stream_until_final_status(self):
+        """Тест SSE: текущий статус, новые события по порядку, закрытие на финальном статусе."""
+        await self.async_client.aforce_login(self.admin)
+        response = await self.async_client.get(self.events_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+        
+        stream = aiter(response.streaming_content)
+        self.assertEqual(self.parse_event(await anext(stream))['status'], 'pending')
+        hub = get_status_hub()
+        self.assertEqual(hub.subscriber_count, 1)
+        
+        hub.dispatch(self.event('processing', 1))
+        self.assertEqual(self.parse_event(await anext(stream))['status'], 'processing')
+        
+        # Запоздавшее событие пропускается
+        hub.dispatch(self.event('pending', 0))
+        hub.dispatch(self.event('completed', 2))
+        data = self.parse_event(await anext(stream))
+        self.assertEqual(data['status'], 'completed')
+        self.assertTrue(data['is_final'])
+        
+        with self.assertRaises(StopAsyncIteration):
+            await anext(stream)
+        self.assertEqual(hub.subscriber_count, 0)
+    
+    @override_settings(PAYOUT_EVENTS_KEEPALIVE=0.01)
+    async def test_keepalive_and_errors(self):
+        """Тест keepalive с перечитыванием статуса, 404 и доступа."""
+        response = await self.async_client.get(self.events_url)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        
+        await self.async_client.aforce_login(self.admin)
+        response = await self.async_client.get(f'/api/v1/payouts/{uuid.uuid4()}/events/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(get_status_hub().subscriber_count, 0)
+        
+        response = await self.async_client.get(self.events_url)
+        stream = aiter(response.streaming_content)
+        self.assertEqual(self.parse_event(await anext(stream))['status'], 'pending')
+        
+        # Без событий статус перечитывается; удалённая заявка закрывает поток
+        with patch('payments.async_views.payout_cache.aget_payout', return_value=None):
+            self.assertEqual(await anext(stream), b': keepalive\n\n')
+            with self.assertRaises(StopAsyncIteration):
+                await anext(stream)
+        self.assertEqual(get_status_hub().subscriber_count, 0)
+    
+    def test_sync_fallback_single_event(self):
+        """Тест sync viewset: одно событие с текущим статусом для EventSource."""
+        request = APIRequestFactory().get(self.events_url, HTTP_ACCEPT='text/event-stream')
+        force_authenticate(request, user=self.admin)
+        # Как в роутере: renderer_classes из @action
+        view = PayoutRequestViewSet.as_view({'get': 'payout_events'}, **PayoutRequestViewSet.payout_events.kwargs)
+        response = view(request, external_id=str(self.payout.external_id))
+        response.render()
+        self.assertEqual(response['Content-Type'], 'text/event-stream; charset=utf-8')
+        self.assertEqual(self.parse_event(response.content)['status'], 'pending')
+
+
+class PayoutWebhookTest(TransactionTestCase):
+    """Тесты вебхуков: постановка в очередь переходами статуса и доставка на stand-in получателя."""
+    
+    def setUp(self):
+        self.addCleanup(reset_endpoints_cache)
+        self.addCleanup(event_loop.shutdown)
+        self.receiver = FakeWebhookReceiver(secret='s3cret').start()
+        self.addCleanup(self.receiver.stop)
+        self.endpoint = WebhookEndpoint.objects.create(
+            url=self.receiver.url, secret='s3cret', max_concurrency=2, max_batch_size=5
+        )
+        self.payouts = [
+            PayoutRequest.objects.create(
+                amount=Decimal('100.00'),
+                currency='RUB',
+                recipient_details={'type': 'card', 'number': f'41111111111111{i:02d}'}
+            )
+            for i in range(20)
+        ]
+    
+    def enqueue_completed(self, payouts) -> list[int]:
+        for payout in payouts:
+            payout.status = PayoutRequest.Status.COMPLETED
+        enqueue_webhooks(payouts)
+        return list(WebhookDelivery.objects.order_by('id').values_list('id', flat=True))
+    
+    def test_transitions_enqueue_subscribed_statuses(self):
+        """Тест: событие ставится только для подписанных статусов и активных endpoint'ов."""
+        WebhookEndpoint.objects.create(url='http://127.0.0.1:9/inactive', is_active=False)
+        external_id = str(self.payouts[0].external_id)
+        
+        PayoutService.start_processing(external_id)
+        self.assertFalse(WebhookDelivery.objects.exists())
+        
+        PayoutService.complete_payout(external_id)
+        delivery = WebhookDelivery.objects.get()
+        self.assertEqual(delivery.endpoint, self.endpoint)
+        self.assertEqual(delivery.payload['external_id'], external_id)
+        self.assertEqual(delivery.payload['status'], 'completed')
+        self.assertTrue(delivery.payload['is_final'])
+    
+    def test_delivery_batched_signed_and_limited(self):
+        """Тест доставки: подпись, пачки и не больше max_concurrency запросов одновременно."""
+        self.receiver.latency = 0.05
+        delivery_ids = self.enqueue_completed(self.payouts)
+        
+        self.assertEqual(event_loop.run(deliver_webhooks()), 20)
+        
+        self.assertEqual(sorted(event['id'] for event in self.receiver.events), delivery_ids)
+        self.assertEqual(self.receiver.stats['bad_signatures'], 0)
+        # 20 событий, 2 параллельных запроса, до 5 событий в запросе
+        self.assertEqual(self.receiver.stats['requests'], 4)
+        self.assertLessEqual(self.receiver.stats['max_inflight'], 2)
+        self.assertFalse(WebhookDelivery.objects.exists())
+    
+    def test_failed_delivery_retried_with_backoff(self):
+        """Тест повтора после ошибки endpoint'а и перевода в failed после исчерпания попыток."""
+        self.receiver = FakeWebhookReceiver(secret='s3cret', fail_first=1, retry_after=30).start()
+        self.addCleanup(self.receiver.stop)
+        WebhookEndpoint.objects.filter(pk=self.endpoint.pk).update(url=self.receiver.url)
+        self.enqueue_completed(self.payouts[:1])
+        
+        event_loop.run(deliver_webhooks())
+        delivery = WebhookDelivery.objects.get()
+        self.assertEqual(delivery.state, WebhookDelivery.State.PENDING)
+        self.assertEqual(delivery.attempts, 1)
+        self.assertIn('503', delivery.last_error)
+        self.assertGreaterEqual(delivery.next_attempt_at, timezone.now() + timedelta(seconds=29))
+        
+        # Не созрела — не отправляется
+        self.assertEqual(event_loop.run(deliver_webhooks()), 0)
+        WebhookDelivery.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(event_loop.run(deliver_webhooks()), 1)
+        self.assertEqual(len(self.receiver.events), 1)
+        self.assertFalse(WebhookDelivery.objects.exists())
+        
+        self.receiver.error_rate = 1.0
+        self.enqueue_completed(self.payouts[1:2])
+        with override_settings(PAYOUT_WEBHOOK_MAX_ATTEMPTS=1):
+            event_loop.run(deliver_webhooks())
+        self.assertEqual(WebhookDelivery.objects.get().state, WebhookDelivery.State.FAILED)
+    
+    def test_claim_limits_slow_endpoint_backlog(self):
+        """Тест: очередь одного endpoint'а не забирает всю выборку."""
+        slow = WebhookEndpoint.objects.create(url='http://127.0.0.1:9/slow', max_concurrency=1, max_batch_size=2)
+        WebhookDelivery.objects.bulk_create(
+            WebhookDelivery(endpoint=slow, payload={'external_id': str(uuid.uuid4())}) for _ in range(10)
+        )
+        self.enqueue_completed(self.payouts[:3])
+        
+        # Старые строки медленного endpoint'а идут первыми, но выборка не уходит на них целиком
+        dispatcher = WebhookDispatcher(client=None, batch_size=3)
+        claimed = dispatcher.claim({self.endpoint.pk: 9})
+        counts = {endpoint_id: 0 for endpoint_id in (slow.pk, self.endpoint.pk)}
+        for delivery in claimed:
+            counts[delivery.endpoint_id] += 1
+        self.assertEqual(counts, {slow.pk: 2, self.endpoint.pk: 1})
+        
+        # Взятые строки арендованы и не выбираются повторно
+        dispatcher.batch_size = 100
+        second = dispatcher.claim({})
+        self.assertEqual(len(second), 4)
+        self.assertFalse({delivery.pk for delivery in claimed} & {delivery.pk for delivery in second})
+    
+    def test_retry_delay_jitter(self):
+        """Тест границ задержки повтора."""
+        for attempts in range(1, 12):
+            delay = retry_delay(attempts, base=2.0, cap=600.0)
+            self.assertGreaterEqual(delay, 0)
+            self.assertLessEqual(delay, min(600.0, 2.0 * 2 ** (attempts - 1)))
+        self.assertGreaterEqual(retry_delay(1, base=2.0, cap=600.0, retry_after=30), 30)
+        self.assertEqual(retry_delay(1, base=2.0, cap=60.0, retry_after=3600), 60.0)
+
+
+class PayoutBulkTransitionTest(APITestCase):
+    """Тесты массовой смены статуса через API и админку."""
+    
+    def setUp(self):
+        cache.clear()
+        User = get_user_model()
+        self.admin = User.objects.create_superuser('bulkadmin', 'bulk@test.com', 'pass')
+        self.client.force_authenticate(user=self.admin)
+        self.url = '/api/v1/payouts/bulk-transition/'
+        self.payouts = {}
+        for payout_status, currency in [
+            ('pending', 'RUB'), ('pending', 'RUB'), ('pending', 'RUB'),
+            ('processing', 'RUB'), ('processing', 'RUB'),
+            ('completed', 'RUB'), ('pending', 'USD'),
+        ]:
+            payout = PayoutRequest.objects.create(
+                amount=Decimal('100.00'),
+                currency=currency,
+                recipient_details={'type': 'card', 'number': '4111111111111111'}
+            )
+            if payout_status != 'pending':
+                PayoutRequest.objects.filter(pk=payout.pk).update(status=payout_status)
+            self.payouts.setdefault((payout_status, currency), []).append(str(payout.external_id))
+        stats.rebuild()
+    
+    def statuses(self, currency: str) -> dict:
+        return dict(
+            PayoutRequest.objects.filter(currency=currency).values_list('status')
+            .annotate(count=Count('id')).order_by()
+        )
+    
+    @override_settings(PAYOUT_BULK_TRANSITION_CHUNK_SIZE=2)
+    def test_cancel_by_filter(self):
+        """Тест отмены по фильтру чанками: счётчики, агрегат, кэш."""
+        cached_id = self.payouts[('pending', 'RUB')][0]
+        self.client.get(f'/api/v1/payouts/{cached_id}/')
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                self.url, {'status': 'cancelled', 'filter': {'currency': 'RUB'}}, format='json'
+            )
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {
+            'status': 'cancelled',
+            'matched': 6,
+            'updated': {'pending': 3, 'processing': 2},
+            'skipped': {'completed': 1},
+        })
+        self.assertEqual(self.statuses('RUB'), {'cancelled': 5, 'completed': 1})
+        self.assertEqual(self.statuses('USD'), {'pending': 1})
+        self.assertEqual(self.client.get(f'/api/v1/payouts/{cached_id}/').data['status'], 'cancelled')
+        
+        before = stats.snapshot()
+        stats.rebuild()
+        self.assertEqual(stats.snapshot(), before)
+    
+    def test_fail_by_ids_uses_patch_transitions(self):
+        """Тест: в failed переводятся только processing, как в PATCH; неизвестные id считаются."""
+        ids = [
+            *self.payouts[('pending', 'RUB')][:1],
+            *self.payouts[('processing', 'RUB')],
+            str(uuid.uuid4()),
+        ]
+        response = self.client.post(self.url, {'status': 'failed', 'ids': ids + ids[:1]}, format='json')
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['updated'], {'processing': 2})
+        self.assertEqual(response.data['skipped'], {'pending': 1})
+        self.assertEqual(response.data['not_found'], 1)
+        self.assertEqual(self.statuses('RUB'), {'pending': 3, 'failed': 2, 'completed': 1})
+        
+        for pending_id in self.payouts[('pending', 'RUB')][:1]:
+            patch_response = self.client.patch(f'/api/v1/payouts/{pending_id}/', {'status': 'failed'}, format='json')
+            self.assertEqual(patch_response.status_code, status.HTTP_400_BAD_REQUEST)
+    
+    def test_validation(self):
+        """Тест: нужен ровно один из ids/filter, непустой фильтр и целевой статус перехода."""
+        ids = self.payouts[('pending', 'RUB')]
+        for payload in [
+            {'status': 'cancelled'},
+            {'status': 'cancelled', 'ids': ids, 'filter': {'currency': 'RUB'}},
+            {'status': 'cancelled', 'filter': {}},
+            {'status': 'cancelled', 'ids': []},
+            {'status': 'pending', 'ids': ids},
+            {'status': 'processing', 'ids': ids},
+            {'status': 'completed', 'ids': ids},
+            {'status': 'cancelled', 'filter': {'status': ['unknown']}},
+        ]:
+            response = self.client.post(self.url, payload, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, payload)
+        self.assertEqual(self.statuses('RUB')['pending'], 3)
+    
+    def test_finalized_metric_counted_on_commit(self):
+        """Тест: payouts_finalized_total растёт только после коммита перехода."""
+        labels = {'status': 'cancelled', 'currency': 'RUB'}
+        
+        def finalized():
+            return REGISTRY.get_sample_value('payouts_finalized_total', labels) or 0
+        
+        before = finalized()
+        with self.assertRaises(DatabaseError):
+            with transaction.atomic():
+                transitions.bulk_transition_ids(self.payouts[('pending', 'RUB')], PayoutRequest.Status.CANCELLED)
+                raise DatabaseError('rollback')
+        self.assertEqual(finalized(), before)
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            transitions.bulk_transition_ids(self.payouts[('pending', 'RUB')][:2], PayoutRequest.Status.CANCELLED)
+            response = self.client.patch(
+                f'/api/v1/payouts/{self.payouts[("pending", "RUB")][2]}/', {'status': 'cancelled'}, format='json'
+            )
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(finalized(), before)
+        self.assertEqual(finalized(), before + 3)
+    
+    def test_admin_action(self):
+        """Тест действия админки для выбранных заявок."""
+        self.client.force_login(self.admin)
+        selected = PayoutRequest.objects.filter(
+            external_id__in=self.payouts[('pending', 'RUB')] + self.payouts[('completed', 'RUB')]
+        ).values_list('pk', flat=True)
+        
+        response = self.client.post('/admin/payments/payoutrequest/', {
+            'action': 'cancel_payouts',
+            '_selected_action': list(selected),
+        }, follow=True)
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.statuses('RUB'), {'cancelled': 3, 'processing': 2, 'completed': 1})
+
+
+class PayoutStatusLogTest(APITestCase):
+    """Тесты журнала переходов статуса и времени в статусах."""
+    
+    def setUp(self):
+        User = get_user_model()
+        self.admin = User.objects.create_superuser('logadmin', 'log@test.com', 'pass')
+        self.client.force_authenticate(user=self.admin)
+        self.url = '/api/v1/payouts/stats/time-in-state/'
+        self.hour = timezone.now().replace(minute=0, second=0, microsecond=0) - timedelta(hours=3)
+    
+    def create_payout(self) -> str:
+        response = self.client.post('/api/v1/payouts/', {
+            'amount': '100.00',
+            'currency': 'RUB',
+            'recipient_details': {'type': 'card', 'number': '4111111111111111'},
+        }, format='json')
+        return response.data['external_id']
+    
+    def events(self, external_id: str) -> list:
+        return list(
+            PayoutStatusEvent.objects.filter(external_id=external_id).order_by('id')
+            .values_list('from_status', 'to_status', 'entered_at', 'created_at')
+        )
+    
+    def test_transitions_are_logged(self):
+        """Тест: создание, переходы PayoutService, PATCH и массовый переход пишут события."""
+        external_id = self.create_payout()
+        PayoutService.start_processing(external_id)
+        PayoutService.complete_payout(external_id)
+        
+        events = self.events(external_id)
+        self.assertEqual(
+            [(from_status, to_status) for from_status, to_status, _, _ in events],
+            [('', 'pending'), ('pending', 'processing'), ('processing', 'completed')]
+        )
+        self.assertIsNone(events[0][2])
+        self.assertEqual([entered_at for _, _, entered_at, _ in events[1:]], [events[0][3], events[1][3]])
+        payout = PayoutRequest.objects.get(external_id=external_id)
+        self.assertEqual(events[-1][3], payout.updated_at)
+        
+        patched_id = self.create_payout()
+        self.client.patch(f'/api/v1/payouts/{patched_id}/', {'status': 'cancelled'}, format='json')
+        bulk_id = self.create_payout()
+        transitions.bulk_transition_ids([bulk_id], PayoutRequest.Status.CANCELLED)
+        
+        for cancelled_id in (patched_id, bulk_id):
+            self.assertEqual(
+                [(from_status, to_status) for from_status, to_status, _, _ in self.events(cancelled_id)],
+                [('', 'pending'), ('pending', 'cancelled')]
+            )
+    
+    def log(self, status_from: str, currency: str, durations, offset: timedelta = timedelta(minutes=10)):
+        created_at = self.hour + offset
+        PayoutStatusEvent.objects.bulk_create([
+            PayoutStatusEvent(
+                external_id=uuid.uuid4(),
+                currency=currency,
+                from_status=status_from,
+                to_status='completed',
+                entered_at=created_at - timedelta(seconds=seconds),
+                created_at=created_at,
+            )
+            for seconds in durations
+        ])
+    
+    def test_time_in_state_percentiles(self):
+        """Тест перцентилей по валютам и часам (percentile_cont)."""
+        self.log('pending', 'RUB', range(1, 101))
+        self.log('pending', 'RUB', [7], offset=timedelta(minutes=70))
+        self.log('processing', 'USD', [2, 4])
+        # Вне периода и первые события заявок не учитываются
+        self.log('pending', 'RUB', [1000], offset=timedelta(hours=2))
+        PayoutStatusEvent.objects.create(
+            external_id=uuid.uuid4(), currency='RUB', to_status='pending', created_at=self.hour
+        )
+        
+        params = {'since': self.hour.isoformat(), 'until': (self.hour + timedelta(hours=2)).isoformat()}
+        response = self.client.get(self.url, params)
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['group'], 'hour')
+        self.assertEqual(response.data['results'], [
+            {'hour': self.hour, 'status': 'pending', 'currency': 'RUB', 'count': 100,
+             'p50': 50.5, 'p95': 95.05, 'p99': 99.01},
+            {'hour': self.hour, 'status': 'processing', 'currency': 'USD', 'count': 2,
+             'p50': 3.0, 'p95': 3.9, 'p99': 3.98},
+            {'hour': self.hour + timedelta(hours=1), 'status': 'pending', 'currency': 'RUB', 'count': 1,
+             'p50': 7.0, 'p95': 7.0, 'p99': 7.0},
+        ])
+        
+        response = self.client.get(self.url, {**params, 'group': 'total'})
+        self.assertEqual(
+            [(row['status'], row['currency'], row['count'], row['p50']) for row in response.data['results']],
+            [('pending', 'RUB', 101, 50.0), ('processing', 'USD', 2, 3.0)]
+        )
+        self.assertNotIn('hour', response.data['results'][0])
+    
+    def test_time_in_state_validation(self):
+        """Тест: период должен быть непустым и не длиннее PAYOUT_TIME_IN_STATE_MAX_DAYS."""
+        for params in [
+            {'since': self.hour.isoformat(), 'until': self.hour.isoformat()},
+            {'since': (self.hour - timedelta(days=settings.PAYOUT_TIME_IN_STATE_MAX_DAYS + 1)).isoformat()},
+            {'group': 'minute'},
+        ]:
+            response = self.client.get(self.url, params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, params)
+        
+        self.assertEqual(self.client.get(self.url).data['results'], [])
+    
+    @skipUnless(connection.vendor == 'postgresql', 'percentile_cont есть только в PostgreSQL')
+    def test_sql_percentiles_match_python(self):
+        """Тест: перцентили PostgreSQL совпадают с расчётом в Python."""
+        self.log('pending', 'RUB', [0.5, 1.25, 3, 8, 13.75])
+        self.log('processing', 'EUR', range(30), offset=timedelta(minutes=90))
+        since, until = self.hour, self.hour + timedelta(hours=2)
+        
+        for by_hour in (True, False):
+            sql_rows = status_log._time_in_state_sql(since, until, by_hour)
+            python_rows = status_log._time_in_state_python(since, until, by_hour)
+            self.assertEqual([row[:4] for row in sql_rows], [row[:4] for row in python_rows])
+            for sql_row, python_row in zip(sql_rows, python_rows):
+                for sql_value, python_value in zip(sql_row[4], python_row[4]):
+                    self.assertAlmostEqual(sql_value, python_value, places=6)
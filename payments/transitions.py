@@ -0,0 +1,191 @@
+"""
+Массовый переход статуса заявок (отмена или перевод в failed при инциденте шлюза).
+
+Заявки обходятся чанками по PAYOUT_BULK_TRANSITION_CHUNK_SIZE первичных
+ключей (keyset по id). На чанк — транзакция с одним условным
+UPDATE ... WHERE id IN (...) AND status = %s RETURNING на каждый исходный
+статус, из которого переход допустим (PayoutRequest.ALLOWED_TRANSITIONS).
+Блокировки строк держатся только до коммита чанка. Заявку, которую worker
+успел перевести дальше, UPDATE не найдёт, и она попадёт в skipped со своим
+текущим статусом. Агрегат статистики, кэш заявок, события статуса и вебхуки
+обновляются так же, как при одиночном переходе.
+"""
+import logging
+
+from collections import Counter
+from typing import Iterable, Iterator, Optional
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, QuerySet
+from django.utils import timezone
+
+from . import payout_cache, stats, status_log
+from .events import publish_status
+from .metrics import PAYOUTS_FINALIZED
+from .models import PayoutRequest
+from .webhooks import enqueue_webhooks
+
+logger = logging.getLogger(__name__)
+
+RETURNING_FIELDS = ('id', 'external_id', 'amount', 'currency', 'status', 'updated_at')
+
+
+def source_statuses(to_status: str) -> list[str]:
+    """Статусы, из которых допустим переход в to_status."""
+    return [
+        from_status for from_status, targets in PayoutRequest.ALLOWED_TRANSITIONS.items()
+        if to_status in targets
+    ]
+
+
+def bulk_transition(queryset: QuerySet, to_status: str, chunk_size: Optional[int] = None) -> dict:
+    """
+    Перевод заявок queryset в to_status по допустимым переходам.
+
+    Args:
+        queryset: Заявки рабочей таблицы
+        to_status: Целевой статус
+        chunk_size: Заявок в транзакции (по умолчанию PAYOUT_BULK_TRANSITION_CHUNK_SIZE)
+
+    Returns:
+        {'status', 'matched', 'updated': {исходный статус: n}, 'skipped': {текущий статус: n}}
+    """
+    chunk_size = chunk_size or settings.PAYOUT_BULK_TRANSITION_CHUNK_SIZE
+    pks = queryset.order_by('pk').values_list('pk', flat=True)
+
+    def chunks() -> Iterator[list[int]]:
+        last_pk = 0
+        while True:
+            chunk = list(pks.filter(pk__gt=last_pk)[:chunk_size])
+            if not chunk:
+                return
+            last_pk = chunk[-1]
+            yield chunk
+
+    return _run(chunks(), to_status)
+
+
+def bulk_transition_ids(external_ids: Iterable, to_status: str, chunk_size: Optional[int] = None) -> dict:
+    """
+    Перевод заявок по списку external_id в to_status по допустимым переходам.
+
+    Список делится на чанки сам, чтобы не передавать десятки тысяч
+    параметров в каждый запрос.
+
+    Args:
+        external_ids: UUID заявок (повторы схлопываются)
+        to_status: Целевой статус
+        chunk_size: Заявок в транзакции (по умолчанию PAYOUT_BULK_TRANSITION_CHUNK_SIZE)
+
+    Returns:
+        Как bulk_transition, плюс 'not_found' — сколько заявок нет в рабочей таблице
+    """
+    chunk_size = chunk_size or settings.PAYOUT_BULK_TRANSITION_CHUNK_SIZE
+    external_ids = list(dict.fromkeys(str(external_id) for external_id in external_ids))
+
+    def chunks() -> Iterator[list[int]]:
+        for i in range(0, len(external_ids), chunk_size):
+            yield list(
+                PayoutRequest.objects.filter(external_id__in=external_ids[i:i + chunk_size])
+                .values_list('pk', flat=True)
+            )
+
+    result = _run(chunks(), to_status)
+    result['not_found'] = len(external_ids) - result['matched']
+    return result
+
+
+def _run(chunks: Iterable[list[int]], to_status: str) -> dict:
+    """Переход по чанкам первичных ключей и сводка по статусам."""
+    from_statuses = source_statuses(to_status)
+    matched = 0
+    updated = Counter()
+    skipped = Counter()
+    for chunk in chunks:
+        if not chunk:
+            continue
+        matched += len(chunk)
+        chunk_updated, chunk_skipped = _transition_chunk(chunk, from_statuses, to_status)
+        updated.update(chunk_updated)
+        skipped.update(chunk_skipped)
+
+    logger.info(
+        f'[BulkTransition] → {to_status}: найдено {matched}, '
+        f'изменено {dict(updated)}, пропущено {dict(skipped)}'
+    )
+    return {
+        'status': to_status,
+        'matched': matched,
+        'updated': dict(updated),
+        'skipped': dict(skipped),
+    }
+
+
+@transaction.atomic
+def _transition_chunk(pks: list[int], from_statuses: list[str], to_status: str) -> tuple[Counter, Counter]:
+    """Один чанк: условные UPDATE по исходным статусам и подсчёт пропущенных."""
+    now = timezone.now()
+    updated = Counter()
+    payouts = []
+    events = []
+    deltas = []
+    for from_status in from_statuses:
+        rows = _update(pks, from_status, to_status, now)
+        updated[from_status] += len(rows)
+        payouts.extend(rows)
+        events.extend((payout, from_status) for payout in rows)
+        deltas.extend(
+            delta
+            for payout in rows
+            for delta in (
+                (from_status, payout.currency, -1, -payout.amount),
+                (to_status, payout.currency, 1, payout.amount),
+            )
+        )
+
+    skipped = Counter(dict(
+        PayoutRequest.objects.filter(pk__in=pks)
+        .exclude(pk__in=[payout.pk for payout in payouts])
+        .values_list('status')
+        .annotate(count=Count('pk'))
+        .order_by()
+    ))
+
+    if payouts:
+        stats.record(deltas)
+        status_log.record(events)
+        payout_cache.invalidate(payout.external_id for payout in payouts)
+        publish_status(payouts)
+        enqueue_webhooks(payouts)
+        if to_status in PayoutRequest.FINAL_STATUSES:
+            finalized = Counter(payout.currency for payout in payouts)
+            transaction.on_commit(lambda: _count_finalized(to_status, finalized))
+    return +updated, skipped
+
+
+def _count_finalized(to_status: str, finalized: Counter) -> None:
+    """PAYOUTS_FINALIZED по валютам — после коммита чанка, откат не учитывается."""
+    for currency, count in finalized.items():
+        PAYOUTS_FINALIZED.labels(status=to_status, currency=currency).inc(count)
+
+
+def _update(pks: list[int], from_status: str, to_status: str, now) -> list[PayoutRequest]:
+    """UPDATE ... WHERE id IN (...) AND status = from_status RETURNING изменённые строки."""
+    opts = PayoutRequest._meta
+    qn = connection.ops.quote_name
+    columns = ', '.join(qn(opts.get_field(name).column) for name in RETURNING_FIELDS)
+    placeholders = ', '.join(['%s'] * len(pks))
+    sql = (
+        f'UPDATE {qn(opts.db_table)} '
+        f'SET {qn("status")} = %s, {qn("updated_at")} = %s '
+        f'WHERE {qn("id")} IN ({placeholders}) AND {qn("status")} = %s '
+        f'RETURNING {columns}'
+    )
+    params = [
+        to_status,
+        opts.get_field('updated_at').get_db_prep_value(now, connection),
+        *pks,
+        from_status,
+    ]
+    return list(PayoutRequest.objects.raw(sql, params))
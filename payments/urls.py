@@ -1,12 +1,20 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 
+from .async_views import async_read_routes, payout_detail, payout_events, payout_list, payout_status
 from .views import PayoutRequestViewSet
 
 router = DefaultRouter()
 router.register(r'payouts', PayoutRequestViewSet, basename='payout')
 
+# GET-маршруты чтения обслуживаются async views, остальные методы — viewset
+async_read_routes(router.urls, {
+    'payout-list': payout_list,
+    'payout-detail': payout_detail,
+    'payout-status': payout_status,
+    'payout-events': payout_events,
+})
+
 urlpatterns = [
     path('', include(router.urls)),
 ]
-
@@ -1,23 +1,60 @@
-from django.db import transaction
+import time
+
+from typing import Optional
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import Http404, StreamingHttpResponse
 from rest_framework import viewsets, status
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.generics import get_object_or_404
 from rest_framework.permissions import IsAdminUser
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import OrderingFilter
 from drf_spectacular.utils import extend_schema, extend_schema_view, OpenApiParameter
 
-from .models import PayoutRequest
+from . import payout_cache, status_log, transitions
+from .events import EventStreamRenderer, format_event, publish_status
+from .export import EXPORT_FORMATS, iter_export_rows
+from .idempotency import (
+    IDEMPOTENCY_HEADER, MAX_KEY_LENGTH, cache_response, forget_response, get_cached_response,
+    request_fingerprint,
+)
+from .metrics import API_REQUEST_SECONDS, PAYOUTS_FINALIZED
+from .models import PayoutIdempotencyKey, PayoutRequest, PayoutRequestArchive
+from .pagination import PayoutCursorPagination
 from .serializers import (
     PayoutRequestSerializer,
+    PayoutRequestFastSerializer,
     PayoutRequestCreateSerializer,
+    PayoutRequestBulkCreateSerializer,
     PayoutRequestUpdateSerializer,
+    PayoutBulkTransitionSerializer,
+    PayoutTimeInStateQuerySerializer,
+)
+from .stats import record_deleted, record_transition, snapshot
+from .webhooks import enqueue_webhooks
+
+SCOPES = ('all', 'active', 'archived')
+
+SCOPE_PARAMETER = OpenApiParameter(
+    name='scope',
+    description='Таблицы для чтения: all (по умолчанию) — рабочая и архив, '
+                'active — только рабочая, archived — только архив финальных заявок.',
+    required=False,
+    type=str,
+    enum=list(SCOPES),
 )
 
 
 @extend_schema_view(
     list=extend_schema(
         summary='Список заявок на выплату',
-        description='Получение списка всех заявок с возможностью фильтрации и сортировки.',
+        description='Получение списка заявок с возможностью фильтрации и сортировки. '
+                    'Курсорная пагинация: переход по ссылкам next/previous.',
         tags=['Платежи'],
         operation_id='1_payouts_list',
         parameters=[
@@ -28,19 +65,31 @@ from .serializers import (
                 required=False,
                 type=str,
             ),
+            SCOPE_PARAMETER,
         ],
     ),
     retrieve=extend_schema(
         summary='Получение заявки',
-        description='Получение детальной информации о заявке по внешнему идентификатору uuid.',
+        description='Получение детальной информации о заявке по внешнему идентификатору uuid '
+                    '(в том числе из архива).',
         tags=['Платежи'],
         operation_id='2_payouts_retrieve',
     ),
     create=extend_schema(
         summary='Создание заявки',
-        description='Создание новой заявки на выплату.',
+        description='Создание новой заявки на выплату. Повтор запроса с тем же заголовком '
+                    'Idempotency-Key возвращает исходный ответ без создания новой заявки.',
         tags=['Платежи'],
         operation_id='3_payouts_create',
+        parameters=[
+            OpenApiParameter(
+                name=IDEMPOTENCY_HEADER,
+                location=OpenApiParameter.HEADER,
+                description='Уникальный ключ запроса для безопасных повторов.',
+                required=False,
+                type=str,
+            ),
+        ],
     ),
     partial_update=extend_schema(
         summary='Обновление заявки',
@@ -54,6 +103,91 @@ from .serializers import (
         tags=['Платежи'],
         operation_id='5_payouts_destroy',
     ),
+    bulk=extend_schema(
+        summary='Пакетное создание заявок',
+        description='Создание списка заявок одним запросом. Невалидные строки возвращаются '
+                    'в errors с индексом и не мешают созданию остальных.',
+        tags=['Платежи'],
+        operation_id='6_payouts_bulk_create',
+    ),
+    bulk_transition=extend_schema(
+        summary='Массовая смена статуса',
+        description='Перевод заявок по списку ids или фильтру в статус cancelled или failed (например, '
+                    'отмена pending-заявок при инциденте шлюза). Допустимы те же переходы, что и в '
+                    'PATCH; остальные заявки пропускаются. Ответ: сколько заявок изменено по исходным '
+                    'статусам и сколько пропущено по текущим.',
+        tags=['Платежи'],
+        operation_id='11_payouts_bulk_transition',
+        responses={200: dict},
+    ),
+    export=extend_schema(
+        summary='Выгрузка заявок',
+        description='Потоковая выгрузка заявок в NDJSON или CSV. '
+                    'Поддерживает те же фильтры и сортировку, что и список.',
+        tags=['Платежи'],
+        operation_id='7_payouts_export',
+        parameters=[
+            OpenApiParameter(
+                name='export_format',
+                description='Формат выгрузки: ndjson (по умолчанию) или csv.',
+                required=False,
+                type=str,
+                enum=list(EXPORT_FORMATS),
+            ),
+            SCOPE_PARAMETER,
+        ],
+        responses={(200, 'application/x-ndjson'): str, (200, 'text/csv'): str},
+    ),
+    payout_status=extend_schema(
+        summary='Статус заявки',
+        description='Статус заявки для опроса клиентом. С параметрами since и wait запрос '
+                    'ждёт до wait секунд, пока статус равен since (long polling).',
+        tags=['Платежи'],
+        operation_id='9_payouts_status',
+        parameters=[
+            OpenApiParameter(
+                name='since',
+                description='Статус, изменения которого нужно дождаться.',
+                required=False,
+                type=str,
+                enum=PayoutRequest.Status.values,
+            ),
+            OpenApiParameter(
+                name='wait',
+                description='Максимальное ожидание изменения статуса, секунды.',
+                required=False,
+                type=float,
+            ),
+        ],
+        responses={200: dict},
+    ),
+    payout_events=extend_schema(
+        summary='События статуса заявки',
+        description='Server-Sent Events: текущий статус заявки, затем каждое его изменение '
+                    '(event: status, data — как у статуса заявки). Поток закрывается на '
+                    'финальном статусе. Под WSGI отдаётся только текущий статус.',
+        tags=['Платежи'],
+        operation_id='10_payouts_events',
+        responses={(200, 'text/event-stream'): str},
+    ),
+    stats=extend_schema(
+        summary='Статистика заявок',
+        description='Количество и суммы заявок по статусам и валютам. Читается из агрегата, '
+                    'который обновляется вместе с заявками, без GROUP BY по всей таблице.',
+        tags=['Платежи'],
+        operation_id='8_payouts_stats',
+        responses={200: dict},
+    ),
+    time_in_state=extend_schema(
+        summary='Время в статусах',
+        description='p50/p95/p99 времени (секунды) пребывания заявок в статусе по валютам и часам '
+                    'выхода из статуса. Считается по журналу переходов PayoutStatusEvent за период '
+                    '[since, until) (по умолчанию — последние сутки).',
+        tags=['Платежи'],
+        operation_id='12_payouts_time_in_state',
+        parameters=[PayoutTimeInStateQuerySerializer],
+        responses={200: dict},
+    ),
 )
 class PayoutRequestViewSet(viewsets.ModelViewSet):
     """
@@ -62,37 +196,359 @@ class PayoutRequestViewSet(viewsets.ModelViewSet):
     Поддерживает все CRUD-операции:
     - GET /api/v1/payouts/ — список заявок
     - GET /api/v1/payouts/{external_id}/ — получение заявки
+    - GET /api/v1/payouts/{external_id}/status/ — опрос статуса (long polling)
     - POST /api/v1/payouts/ — создание заявки (+ автозапуск Celery через signal)
     - PATCH /api/v1/payouts/{external_id}/ — обновление заявки
     - DELETE /api/v1/payouts/{external_id}/ — удаление заявки
+    - POST /api/v1/payouts/bulk/ — пакетное создание заявок
+    - POST /api/v1/payouts/bulk-transition/ — массовая смена статуса
+    - GET /api/v1/payouts/export/ — потоковая выгрузка (NDJSON/CSV)
+    - GET /api/v1/payouts/stats/ — агрегаты по статусам и валютам
+    - GET /api/v1/payouts/stats/time-in-state/ — перцентили времени в статусах
+
+    GET/HEAD списка, заявки, статуса и событий на тех же URL передаются
+    async-версиям из payments.async_views (см. payments.urls) с теми же
+    фильтрами, пагинацией и ответами; остальные методы выполняет viewset.
+    С ATOMIC_REQUESTS все методы остаются за viewset'ом.
     """
     queryset = PayoutRequest.objects.all()
     lookup_field = 'external_id'
     permission_classes = [IsAdminUser]
     filter_backends = [DjangoFilterBackend, OrderingFilter]
-    filterset_fields = ['status', 'currency']
+    filterset_fields = ['status', 'currency', 'priority']
     ordering_fields = ['created_at', 'updated_at', 'amount']
     ordering = ['-created_at']
+    pagination_class = PayoutCursorPagination
     http_method_names = ['get', 'post', 'patch', 'delete', 'head', 'options']
 
+    def initial(self, request, *args, **kwargs):
+        """Засечка времени запроса для метрик."""
+        self._started_at = time.perf_counter()
+        super().initial(request, *args, **kwargs)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        """Запись времени обработки запроса в гистограмму по action."""
+        response = super().finalize_response(request, response, *args, **kwargs)
+        started_at = getattr(self, '_started_at', None)
+        if started_at is not None:
+            API_REQUEST_SECONDS.labels(
+                action=self.action or 'unknown',
+                method=request.method,
+                status_code=response.status_code,
+            ).observe(time.perf_counter() - started_at)
+        return response
+
     def get_serializer_class(self):
         """Выбор сериализатора в зависимости от действия."""
         if self.action == 'create':
             return PayoutRequestCreateSerializer
+        elif self.action == 'bulk':
+            return PayoutRequestBulkCreateSerializer
         elif self.action == 'partial_update':
             return PayoutRequestUpdateSerializer
+        elif self.action == 'bulk_transition':
+            return PayoutBulkTransitionSerializer
         return PayoutRequestSerializer
 
+    def get_scoped_querysets(self) -> list:
+        """
+        Отфильтрованные querysets рабочей таблицы и/или архива по параметру scope.
+
+        При scope=all архив не читается, если фильтр по статусу заведомо
+        исключает финальные заявки (в архиве только они).
+        """
+        scope = self.request.query_params.get('scope', 'all')
+        if scope not in SCOPES:
+            raise ValidationError({'scope': f'Допустимые значения: {", ".join(SCOPES)}.'})
+
+        querysets = []
+        if scope != 'archived':
+            querysets.append(self.filter_queryset(self.get_queryset()))
+        if scope == 'archived' or (scope == 'all' and self.archive_may_match()):
+            querysets.append(self.filter_queryset(PayoutRequestArchive.objects.all()))
+        return querysets
+
+    def archive_may_match(self) -> bool:
+        """Может ли в архиве найтись заявка с запрошенным статусом."""
+        payout_status = self.request.query_params.get('status')
+        return not payout_status or payout_status in PayoutRequest.FINAL_STATUSES
+
+    def list(self, request, *args, **kwargs):
+        """Список заявок через быстрый сериализатор (строки из .values())."""
+        querysets = [
+            queryset.values(*PayoutRequestFastSerializer.value_fields)
+            for queryset in self.get_scoped_querysets()
+        ]
+        page = self.paginate_queryset(querysets)
+        if page is None:
+            return Response([
+                row
+                for queryset in querysets
+                for row in PayoutRequestFastSerializer.serialize(queryset)
+            ])
+        return self.get_paginated_response(PayoutRequestFastSerializer.serialize(page))
+
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Получение заявки через быстрый сериализатор.
+
+        Без фильтров в query string ответ берётся из read-through кэша
+        (payments.payout_cache); не найденная в рабочей таблице заявка ищется в архиве.
+        """
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        lookup_value = self.kwargs[lookup_url_kwarg]
+        if request.query_params:
+            data = self.load_payout(lookup_value)
+        else:
+            data = payout_cache.get_payout(lookup_value, lambda: self.load_payout(lookup_value))
+        if data is None:
+            raise Http404
+        self.check_object_permissions(request, data)
+        return Response(data)
+
+    def load_payout(self, lookup_value) -> Optional[dict]:
+        """Представление заявки из рабочей таблицы или архива (None, если нет ни там, ни там)."""
+        for queryset in (self.get_queryset(), PayoutRequestArchive.objects.all()):
+            queryset = self.filter_queryset(queryset).values(*PayoutRequestFastSerializer.value_fields)
+            try:
+                row = get_object_or_404(queryset, **{self.lookup_field: lookup_value})
+            except Http404:
+                continue
+            return PayoutRequestFastSerializer.to_representation(row)
+        return None
+
     def create(self, request, *args, **kwargs):
-        """Создание заявки."""
+        """Создание заявки (с поддержкой заголовка Idempotency-Key)."""
+        idempotency_key = request.headers.get(IDEMPOTENCY_HEADER)
+        fingerprint = ''
+        
+        if idempotency_key is not None:
+            if not idempotency_key or len(idempotency_key) > MAX_KEY_LENGTH:
+                return Response(
+                    {'detail': f'Заголовок {IDEMPOTENCY_HEADER} должен содержать '
+                               f'от 1 до {MAX_KEY_LENGTH} символов.'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            fingerprint = request_fingerprint(request.data)
+            replay = self.get_idempotent_replay(idempotency_key, fingerprint)
+            if replay is not None:
+                return replay
+        
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         
-        payout = serializer.save()
+        try:
+            with transaction.atomic():
+                payout = serializer.save(idempotency_key=idempotency_key)
+                if idempotency_key is not None:
+                    # Уникальность ключа — в отдельной таблице, которую не трогает архивация
+                    PayoutIdempotencyKey.objects.create(
+                        key=idempotency_key,
+                        fingerprint=fingerprint,
+                        external_id=payout.external_id
+                    )
+        except IntegrityError:
+            # Параллельный запрос с тем же ключом успел создать заявку
+            replay = self.get_idempotent_replay(idempotency_key, fingerprint) if idempotency_key else None
+            if replay is None:
+                raise
+            return replay
         
         output_serializer = PayoutRequestSerializer(payout)
+        if idempotency_key is not None:
+            data = output_serializer.data
+            transaction.on_commit(lambda: cache_response(idempotency_key, fingerprint, data))
         return Response(output_serializer.data, status=status.HTTP_201_CREATED)
 
+    def get_idempotent_replay(self, idempotency_key: str, fingerprint: str):
+        """
+        Ответ на повторный запрос с тем же ключом (кэш, затем БД) или None.
+
+        Args:
+            idempotency_key: Значение заголовка Idempotency-Key
+            fingerprint: Отпечаток тела текущего запроса
+
+        Returns:
+            Исходный ответ, 422 если тело отличается от исходного запроса,
+            None если ключ ещё не использовался
+        """
+        cached = get_cached_response(idempotency_key)
+        if cached is None:
+            record = PayoutIdempotencyKey.objects.filter(key=idempotency_key).first()
+            if record is None:
+                return None
+            payout = (
+                PayoutRequest.objects.filter(external_id=record.external_id).first()
+                or PayoutRequestArchive.objects.filter(external_id=record.external_id).first()
+            )
+            if payout is None:
+                return None
+            cached = (record.fingerprint, PayoutRequestSerializer(payout).data)
+            cache_response(idempotency_key, *cached)
+        
+        original_fingerprint, data = cached
+        # Пустой отпечаток — ключ заведён до появления проверки
+        if original_fingerprint and original_fingerprint != fingerprint:
+            return Response(
+                {'detail': f'Ключ {IDEMPOTENCY_HEADER} уже использован для запроса с другим телом.'},
+                status=status.HTTP_422_UNPROCESSABLE_ENTITY
+            )
+        return Response(
+            data,
+            status=status.HTTP_201_CREATED,
+            headers={'Idempotent-Replayed': 'true'}
+        )
+
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk(self, request, *args, **kwargs):
+        """Пакетное создание заявок с построчными ошибками."""
+        serializer = self.get_serializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        
+        errors = [
+            {'index': index, 'errors': row_errors}
+            for index, row_errors in serializer.row_errors.items()
+        ]
+        if not serializer.row_indexes:
+            return Response(
+                {'created': [], 'errors': errors},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        payouts = serializer.save()
+        
+        created = [
+            {'index': index, 'payout': data}
+            for index, data in zip(
+                serializer.row_indexes,
+                PayoutRequestSerializer(payouts, many=True).data
+            )
+        ]
+        return Response(
+            {'created': created, 'errors': errors},
+            status=status.HTTP_201_CREATED
+        )
+
+    @action(
+        detail=False,
+        methods=['post'],
+        url_path='bulk-transition',
+        url_name='bulk-transition',
+        pagination_class=None,
+        filter_backends=[],
+    )
+    def bulk_transition(self, request, *args, **kwargs):
+        """Массовая смена статуса чанками set-based UPDATE (без блокировки каждой заявки отдельно)."""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        
+        to_status = serializer.validated_data['status']
+        if 'ids' in serializer.validated_data:
+            result = transitions.bulk_transition_ids(serializer.validated_data['ids'], to_status)
+        else:
+            queryset = serializer.filter_queryset(PayoutRequest.objects.all())
+            result = transitions.bulk_transition(queryset, to_status)
+        return Response(result)
+
+    @action(detail=False, methods=['get'], url_path='export', pagination_class=None)
+    def export(self, request, *args, **kwargs):
+        """Потоковая выгрузка заявок без буферизации всего ответа."""
+        export_format = request.query_params.get('export_format', 'ndjson')
+        if export_format not in EXPORT_FORMATS:
+            return Response(
+                {'detail': f'Формат выгрузки должен быть одним из: {", ".join(EXPORT_FORMATS)}.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        render, content_type = EXPORT_FORMATS[export_format]
+        querysets = self.get_scoped_querysets()
+        
+        response = StreamingHttpResponse(
+            render(iter_export_rows(*querysets)),
+            content_type=content_type
+        )
+        response['Content-Disposition'] = f'attachment; filename="payouts.{export_format}"'
+        return response
+
+    @action(detail=True, methods=['get'], url_path='status', url_name='status', filter_backends=[])
+    def payout_status(self, request, *args, **kwargs):
+        """
+        Текущий статус заявки из кэша заявок.
+
+        Ожидание изменения (wait) выполняет async-маршрут (payments.async_views);
+        здесь параметры только проверяются, ответ возвращается сразу.
+        """
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        lookup_value = self.kwargs[lookup_url_kwarg]
+        self.get_status_wait()
+        data = payout_cache.get_payout(lookup_value, lambda: self.load_payout(lookup_value))
+        if data is None:
+            raise Http404
+        return Response(PayoutRequestFastSerializer.status_representation(data))
+
+    @action(
+        detail=True,
+        methods=['get'],
+        url_path='events',
+        url_name='events',
+        filter_backends=[],
+        renderer_classes=[EventStreamRenderer, JSONRenderer],
+    )
+    def payout_events(self, request, *args, **kwargs):
+        """
+        Поток событий статуса заявки (SSE).
+
+        Поток выполняет async-маршрут (payments.async_views); под WSGI
+        отдаётся одно событие с текущим статусом, EventSource переподключится.
+        """
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        lookup_value = self.kwargs[lookup_url_kwarg]
+        data = payout_cache.get_payout(lookup_value, lambda: self.load_payout(lookup_value))
+        if data is None:
+            raise Http404
+        response = Response(format_event(PayoutRequestFastSerializer.status_representation(data)))
+        response['Cache-Control'] = 'no-cache'
+        return response
+
+    def get_status_wait(self) -> tuple[Optional[str], float]:
+        """Параметры long polling: (since, wait в секундах, не больше PAYOUT_STATUS_MAX_WAIT)."""
+        since = self.request.query_params.get('since')
+        if since is not None and since not in PayoutRequest.Status.values:
+            raise ValidationError({'since': f'Допустимые значения: {", ".join(PayoutRequest.Status.values)}.'})
+        try:
+            wait = float(self.request.query_params.get('wait', 0))
+        except ValueError:
+            raise ValidationError({'wait': 'Ожидается число секунд.'})
+        if not 0 <= wait < float('inf'):
+            raise ValidationError({'wait': 'Ожидается число секунд.'})
+        return since, min(wait, settings.PAYOUT_STATUS_MAX_WAIT)
+
+    @action(detail=False, methods=['get'], url_path='stats', pagination_class=None, filter_backends=[])
+    def stats(self, request, *args, **kwargs):
+        """Количество и суммы заявок по статусам и валютам из инкрементального агрегата."""
+        return Response(snapshot())
+
+    @action(
+        detail=False,
+        methods=['get'],
+        url_path='stats/time-in-state',
+        url_name='time-in-state',
+        pagination_class=None,
+        filter_backends=[],
+    )
+    def time_in_state(self, request, *args, **kwargs):
+        """Перцентили времени в статусах по журналу переходов."""
+        serializer = PayoutTimeInStateQuerySerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        since, until = serializer.validated_data['since'], serializer.validated_data['until']
+        group = serializer.validated_data['group']
+        return Response({
+            'since': since,
+            'until': until,
+            'group': group,
+            'results': status_log.time_in_state(since, until, by_hour=group == 'hour'),
+        })
+
     def get_object_for_update(self):
         """Получение объекта с блокировкой для обновления (защита от race condition)."""
         lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
@@ -105,10 +561,21 @@ class PayoutRequestViewSet(viewsets.ModelViewSet):
     def partial_update(self, request, *args, **kwargs):
         """Обновление заявки с блокировкой записи."""
         instance = self.get_object_for_update()
+        previous_status = instance.status
         serializer = self.get_serializer(instance, data=request.data, partial=True)
         serializer.is_valid(raise_exception=True)
         self.perform_update(serializer)
         
+        payout_cache.invalidate([instance.external_id])
+        if instance.status != previous_status:
+            publish_status([instance])
+            enqueue_webhooks([instance])
+            record_transition(instance.currency, instance.amount, previous_status, instance.status)
+            status_log.record([(instance, previous_status)])
+            if instance.is_final_status:
+                counter = PAYOUTS_FINALIZED.labels(status=instance.status, currency=instance.currency)
+                transaction.on_commit(counter.inc)
+        
         output_serializer = PayoutRequestSerializer(instance)
         return Response(output_serializer.data)
 
@@ -124,4 +591,11 @@ class PayoutRequestViewSet(viewsets.ModelViewSet):
             )
         
         self.perform_destroy(instance)
+        if instance.idempotency_key:
+            # Ключ удалённой заявки снова свободен: строка ключа и сохранённый ответ
+            idempotency_key = instance.idempotency_key
+            PayoutIdempotencyKey.objects.filter(key=idempotency_key).delete()
+            transaction.on_commit(lambda: forget_response(idempotency_key))
+        record_deleted([instance])
+        payout_cache.mark_deleted(instance.external_id)
         return Response(status=status.HTTP_204_NO_CONTENT)
@@ -0,0 +1,439 @@
+"""
+Вебхуки о смене статуса заявок.
+
+Постановка: переходы статуса (PayoutService.transition, sweeper, PATCH) в той же
+транзакции пишут WebhookDelivery на каждый активный endpoint, подписанный на
+новый статус, поэтому событие не теряется при падении после коммита.
+
+Доставка (WebhookDispatcher): созревшие строки забираются пачками с SELECT ...
+FOR UPDATE SKIP LOCKED и арендуются сдвигом next_attempt_at на
+PAYOUT_WEBHOOK_LEASE, поэтому несколько диспетчеров не берут одни и те же
+строки. Запросы идут через общий httpx.AsyncClient с пулом keep-alive
+соединений, не больше max_concurrency одновременно на endpoint. Когда у
+endpoint'а копится очередь, события уходят пачками до max_batch_size в запросе.
+Каждый запрос сам завершает свои строки, поэтому медленный endpoint не
+задерживает остальные.
+
+Ошибка (сеть, таймаут, ответ не 2xx) — повтор с экспоненциальной задержкой
+и full jitter, не раньше Retry-After. После PAYOUT_WEBHOOK_MAX_ATTEMPTS
+попыток строка переходит в failed. Доставка at-least-once: получатель
+дедуплицирует события по id.
+"""
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import math
+import random
+import time
+
+from collections import defaultdict
+from datetime import timedelta
+from typing import Iterable, Optional
+
+import httpx
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, Value, When, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+
+from core import event_loop
+
+from .metrics import WEBHOOK_EVENTS, WEBHOOK_REQUEST_SECONDS
+from .models import WebhookDelivery, WebhookEndpoint
+from .serializers import PayoutRequestFastSerializer
+
+logger = logging.getLogger(__name__)
+
+SIGNATURE_HEADER = 'X-Payout-Signature'
+TIMESTAMP_HEADER = 'X-Payout-Timestamp'
+
+_endpoints: tuple[float, list[tuple[int, frozenset]]] = (0.0, [])
+
+
+def active_endpoints() -> list[tuple[int, frozenset]]:
+    """
+    Активные endpoint'ы и их статусы: [(pk, статусы)].
+
+    Кэшируется в процессе на PAYOUT_WEBHOOK_ENDPOINTS_TTL, чтобы переход
+    статуса не читал таблицу подписок. Изменения в этом процессе сбрасывают
+    кэш сразу (payments.signals), в остальных применяются по TTL.
+    """
+    global _endpoints
+    expires_at, endpoints = _endpoints
+    now = time.monotonic()
+    if now >= expires_at:
+        endpoints = [
+            (pk, frozenset(statuses))
+            for pk, statuses in WebhookEndpoint.objects.filter(is_active=True).values_list('pk', 'statuses')
+        ]
+        _endpoints = (now + settings.PAYOUT_WEBHOOK_ENDPOINTS_TTL, endpoints)
+    return endpoints
+
+
+def reset_endpoints_cache() -> None:
+    global _endpoints
+    _endpoints = (0.0, [])
+
+
+def enqueue_webhooks(payouts: Iterable) -> int:
+    """
+    Постановка событий статуса в очередь доставки (в текущей транзакции).
+
+    Args:
+        payouts: Заявки (или строки) с external_id, status и updated_at
+
+    Returns:
+        Количество созданных доставок
+    """
+    endpoints = active_endpoints()
+    if not endpoints:
+        return 0
+
+    deliveries = []
+    for payout in payouts:
+        subscribed = [pk for pk, statuses in endpoints if payout.status in statuses]
+        if not subscribed:
+            continue
+        payload = PayoutRequestFastSerializer.status_event(
+            payout.external_id, payout.status, payout.updated_at
+        )
+        deliveries.extend(WebhookDelivery(endpoint_id=pk, payload=payload) for pk in subscribed)
+
+    WebhookDelivery.objects.bulk_create(deliveries)
+    return len(deliveries)
+
+
+def sign(secret: str, timestamp: int, body: bytes) -> str:
+    """Подпись запроса: HMAC-SHA256 от "{timestamp}.{body}" в hex."""
+    digest = hmac.new(secret.encode(), f'{timestamp}.'.encode() + body, hashlib.sha256).hexdigest()
+    return f'sha256={digest}'
+
+
+def retry_delay(attempts: int, base: float, cap: float, retry_after: Optional[float] = None) -> float:
+    """
+    Задержка повтора: full jitter, случайно от 0 до min(cap, base * 2^(attempts - 1)).
+
+    Args:
+        attempts: Номер неудачной попытки (с 1)
+        base: Базовая задержка, секунды
+        cap: Максимальная задержка, секунды
+        retry_after: Retry-After из ответа endpoint'а, секунды
+
+    Returns:
+        Задержка, секунды
+    """
+    delay = random.uniform(0, min(cap, base * 2 ** min(attempts - 1, 32)))
+    if retry_after:
+        delay = max(delay, min(retry_after, cap))
+    return delay
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-After в секундах (формат HTTP-даты не поддерживается)."""
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def create_client() -> httpx.AsyncClient:
+    timeout = settings.PAYOUT_WEBHOOK_TIMEOUT
+    return httpx.AsyncClient(
+        timeout=httpx.Timeout(timeout, connect=min(timeout, 5.0)),
+        limits=httpx.Limits(
+            max_connections=settings.PAYOUT_WEBHOOK_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.PAYOUT_WEBHOOK_MAX_CONNECTIONS,
+            keepalive_expiry=30.0,
+        ),
+    )
+
+
+def get_webhook_client() -> httpx.AsyncClient:
+    """HTTP-клиент вебхуков, общий для всех доставок на event loop процесса."""
+    return event_loop.get_resource(
+        'webhook_client',
+        create_client,
+        close=lambda client: client.aclose(),
+    )
+
+
+class WebhookDispatcher:
+    """
+    Доставка событий вебхуков на event loop.
+
+    Args:
+        client: HTTP-клиент (общий пул соединений)
+        batch_size: Строк за одну выборку
+        lease: Аренда выбранных строк, секунды
+        max_attempts: Попыток до перевода в failed
+        backoff_base: Базовая задержка повтора, секунды
+        backoff_max: Максимальная задержка повтора, секунды
+    """
+
+    def __init__(
+        self,
+        client: httpx.AsyncClient,
+        batch_size: int = 1000,
+        lease: int = 60,
+        max_attempts: int = 12,
+        backoff_base: float = 2.0,
+        backoff_max: float = 3600.0,
+    ):
+        self.client = client
+        self.batch_size = batch_size
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        # Строк endpoint'а в доставке и семафоры max_concurrency
+        self._inflight: defaultdict[int, int] = defaultdict(int)
+        self._semaphores: dict[int, tuple[int, asyncio.Semaphore]] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+    @classmethod
+    def from_settings(cls, batch_size: Optional[int] = None) -> 'WebhookDispatcher':
+        return cls(
+            client=get_webhook_client(),
+            batch_size=batch_size or settings.PAYOUT_WEBHOOK_BATCH_SIZE,
+            lease=settings.PAYOUT_WEBHOOK_LEASE,
+            max_attempts=settings.PAYOUT_WEBHOOK_MAX_ATTEMPTS,
+            backoff_base=settings.PAYOUT_WEBHOOK_BACKOFF_BASE,
+            backoff_max=settings.PAYOUT_WEBHOOK_BACKOFF_MAX,
+        )
+
+    async def dispatch(self) -> int:
+        """
+        Выборка созревших строк и запуск запросов (ответы не ожидаются).
+
+        Returns:
+            Количество взятых в доставку строк
+        """
+        deliveries = await sync_to_async(self.claim)(dict(self._inflight))
+
+        by_endpoint = defaultdict(list)
+        for delivery in deliveries:
+            by_endpoint[delivery.endpoint_id].append(delivery)
+
+        for endpoint_deliveries in by_endpoint.values():
+            endpoint = endpoint_deliveries[0].endpoint
+            self._inflight[endpoint.pk] += len(endpoint_deliveries)
+            for batch in self.split(endpoint, endpoint_deliveries):
+                task = asyncio.create_task(self.send(endpoint, batch))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+        return len(deliveries)
+
+    async def wait(self) -> None:
+        """Ожидание всех запущенных запросов."""
+        while self._tasks:
+            await asyncio.gather(*self._tasks)
+
+    async def drain(self, max_batches: int) -> int:
+        """
+        Доставка, пока есть созревшие строки (не больше max_batches выборок).
+
+        Returns:
+            Количество обработанных строк
+        """
+        processed = 0
+        for _ in range(max_batches):
+            count = await self.dispatch()
+            await self.wait()
+            processed += count
+            if not count:
+                break
+        return processed
+
+    async def run(self, poll_interval: float) -> None:
+        """Бесконечный цикл: выборка, пока есть строки, иначе пауза poll_interval."""
+        while True:
+            try:
+                count = await self.dispatch()
+            except Exception as exc:
+                # БД недоступна: строки остались в очереди, повтор после паузы
+                logger.error(f'[Webhooks] Ошибка выборки доставок: {exc}')
+                count = 0
+            if count < self.batch_size:
+                await asyncio.sleep(poll_interval)
+
+    @transaction.atomic
+    def claim(self, inflight: dict[int, int]) -> list[WebhookDelivery]:
+        """
+        Аренда созревших строк.
+
+        На endpoint берётся не больше max_concurrency * max_batch_size строк
+        с учётом уже отправляемых. Ограничение применяется в SQL до LIMIT
+        (ROW_NUMBER() OVER (PARTITION BY endpoint_id)), поэтому очередь
+        медленного endpoint'а не вытесняет остальные из выборки и аренда не
+        истекает в ожидании семафора.
+
+        Args:
+            inflight: Строк в доставке по endpoint'ам
+        """
+        now = timezone.now()
+        room = (
+            F('endpoint__max_concurrency') * F('endpoint__max_batch_size')
+            - Case(
+                *[When(endpoint_id=endpoint_id, then=Value(count)) for endpoint_id, count in inflight.items() if count],
+                default=Value(0),
+            )
+        )
+        candidates = (
+            WebhookDelivery.objects
+            .filter(
+                state=WebhookDelivery.State.PENDING,
+                next_attempt_at__lte=now,
+                endpoint__is_active=True,
+            )
+            .annotate(
+                position=Window(RowNumber(), partition_by=F('endpoint_id'), order_by=F('next_attempt_at').asc()),
+                room=room,
+            )
+            .filter(position__lte=F('room'))
+            .order_by('next_attempt_at')
+            .values('pk')[:self.batch_size]
+        )
+        # FOR UPDATE несовместим с оконными функциями — блокируются уже выбранные строки
+        claimed = list(
+            WebhookDelivery.objects.select_for_update(skip_locked=True, of=('self',))
+            .select_related('endpoint')
+            .filter(pk__in=candidates)
+            .order_by('next_attempt_at')
+        )
+
+        if claimed:
+            WebhookDelivery.objects.filter(pk__in=[delivery.pk for delivery in claimed]).update(
+                next_attempt_at=now + timedelta(seconds=self.lease)
+            )
+        return claimed
+
+    @staticmethod
+    def split(endpoint: WebhookEndpoint, deliveries: list[WebhookDelivery]) -> list[list[WebhookDelivery]]:
+        """
+        Запросы на endpoint: события делятся на max_concurrency запросов, но не
+        больше max_batch_size событий в запросе. Пока очередь короткая, событие
+        уходит отдельным запросом; очередь медленного endpoint'а уходит пачками.
+        """
+        size = min(endpoint.max_batch_size, max(1, math.ceil(len(deliveries) / endpoint.max_concurrency)))
+        return [deliveries[i:i + size] for i in range(0, len(deliveries), size)]
+
+    def _semaphore(self, endpoint: WebhookEndpoint) -> asyncio.Semaphore:
+        limit, semaphore = self._semaphores.get(endpoint.pk, (None, None))
+        if limit != endpoint.max_concurrency:
+            semaphore = asyncio.Semaphore(endpoint.max_concurrency)
+            self._semaphores[endpoint.pk] = (endpoint.max_concurrency, semaphore)
+        return semaphore
+
+    async def send(self, endpoint: WebhookEndpoint, batch: list[WebhookDelivery]) -> None:
+        """Запрос с пачкой событий и фиксация результата."""
+        try:
+            async with self._semaphore(endpoint):
+                error, retry_after = await self.post(endpoint, batch)
+            await sync_to_async(self.finish)(endpoint, batch, error, retry_after)
+        except Exception as exc:
+            # Строки вернутся в доставку после истечения аренды
+            logger.error(f'[Webhooks] Ошибка доставки на {endpoint.url}: {exc}')
+        finally:
+            self._inflight[endpoint.pk] -= len(batch)
+
+    async def post(self, endpoint: WebhookEndpoint, batch: list[WebhookDelivery]) -> tuple[Optional[str], Optional[float]]:
+        """
+        POST {"events": [...]} с подписью.
+
+        Returns:
+            (None, None) при ответе 2xx, иначе (ошибка, Retry-After)
+        """
+        events = [{'id': delivery.pk, **delivery.payload} for delivery in batch]
+        body = json.dumps({'events': events}, ensure_ascii=False, separators=(',', ':')).encode()
+        timestamp = int(time.time())
+        headers = {
+            'Content-Type': 'application/json',
+            TIMESTAMP_HEADER: str(timestamp),
+            SIGNATURE_HEADER: sign(endpoint.secret, timestamp, body),
+        }
+
+        error = retry_after = None
+        started_at = time.perf_counter()
+        try:
+            response = await self.client.post(endpoint.url, content=body, headers=headers)
+        except httpx.TimeoutException as exc:
+            outcome, error = 'timeout', f'Таймаут: {exc.__class__.__name__}'
+        except (httpx.HTTPError, httpx.InvalidURL) as exc:
+            outcome, error = 'transport_error', f'Endpoint недоступен: {exc}'
+        else:
+            if response.is_success:
+                outcome = 'success'
+            else:
+                outcome, error = 'http_error', f'Endpoint ответил {response.status_code}'
+                retry_after = parse_retry_after(response.headers.get('Retry-After'))
+        WEBHOOK_REQUEST_SECONDS.labels(outcome=outcome).observe(time.perf_counter() - started_at)
+        return error, retry_after
+
+    def finish(
+        self,
+        endpoint: WebhookEndpoint,
+        batch: list[WebhookDelivery],
+        error: Optional[str],
+        retry_after: Optional[float],
+    ) -> None:
+        """Удаление доставленных строк или планирование повтора."""
+        if error is None:
+            WebhookDelivery.objects.filter(pk__in=[delivery.pk for delivery in batch]).delete()
+            WEBHOOK_EVENTS.labels(result='delivered').inc(len(batch))
+            return
+
+        now = timezone.now()
+        exhausted = 0
+        for delivery in batch:
+            delivery.attempts += 1
+            delivery.last_error = error
+            if delivery.attempts >= self.max_attempts:
+                delivery.state = WebhookDelivery.State.FAILED
+                exhausted += 1
+            else:
+                delay = retry_delay(delivery.attempts, self.backoff_base, self.backoff_max, retry_after)
+                delivery.next_attempt_at = now + timedelta(seconds=delay)
+        WebhookDelivery.objects.bulk_update(batch, ['attempts', 'last_error', 'state', 'next_attempt_at'])
+
+        WEBHOOK_EVENTS.labels(result='retry').inc(len(batch) - exhausted)
+        WEBHOOK_EVENTS.labels(result='failed').inc(exhausted)
+        logger.warning(
+            f'[Webhooks] {endpoint.url}: {error}, событий: {len(batch)}, '
+            f'исчерпали попытки: {exhausted}'
+        )
+
+
+async def deliver_webhooks(batch_size: Optional[int] = None, max_batches: Optional[int] = None) -> int:
+    """
+    Доставка созревших событий до опустошения очереди.
+
+    Args:
+        batch_size: Строк за выборку (по умолчанию PAYOUT_WEBHOOK_BATCH_SIZE)
+        max_batches: Максимум выборок (по умолчанию PAYOUT_WEBHOOK_MAX_BATCHES)
+
+    Returns:
+        Количество обработанных строк
+    """
+    dispatcher = WebhookDispatcher.from_settings(batch_size)
+    return await dispatcher.drain(max_batches or settings.PAYOUT_WEBHOOK_MAX_BATCHES)
+
+
+def run_dispatcher(poll_interval: Optional[float] = None, batch_size: Optional[int] = None) -> None:
+    """
+    Бесконечный цикл доставки на event loop процесса.
+
+    Args:
+        poll_interval: Пауза при пустой очереди, секунды (по умолчанию PAYOUT_WEBHOOK_POLL_INTERVAL)
+        batch_size: Строк за выборку (по умолчанию PAYOUT_WEBHOOK_BATCH_SIZE)
+    """
+    poll_interval = poll_interval if poll_interval is not None else settings.PAYOUT_WEBHOOK_POLL_INTERVAL
+    logger.info(f'[Webhooks] Диспетчер запущен: опрос каждые {poll_interval}с')
+    try:
+        event_loop.run(WebhookDispatcher.from_settings(batch_size).run(poll_interval))
+    finally:
+        event_loop.shutdown()
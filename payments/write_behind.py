@@ -0,0 +1,240 @@
+"""
+Write-behind финальных статусов заявок.
+
+Вместо отдельной транзакции на каждый complete_payout/fail_payout корутины
+worker'а складывают результат в буфер event loop'а и ждут его записи. Буфер
+сбрасывается раз в PAYOUT_WRITE_BEHIND_FLUSH_INTERVAL секунд или по
+накоплении PAYOUT_WRITE_BEHIND_MAX_ITEMS результатов одним запросом:
+
+    WITH v(external_id, from_status, to_status) AS (VALUES ...)
+    UPDATE ... FROM v WHERE external_id = v.external_id AND status = v.from_status
+    RETURNING ...
+
+Условие по статусу — тот же compare-and-set, что в PayoutService.transition.
+Корутина получает PayoutResult только после коммита пачки, поэтому задача
+Celery завершается (и с acks_late подтверждается брокеру) не раньше, чем
+статус записан в БД. Ошибка flush пробрасывается в корутины пачки без
+fail_payout: заявки остаются в processing, задача повторяется с resume. Если
+процесс упал до flush, сообщение остаётся у брокера и доставляется повторно.
+Повтор завершает заявку по ответу шлюза, сохранённому в
+payments.gateway_results, не запрашивая шлюз второй раз.
+"""
+import asyncio
+import logging
+import uuid
+
+from collections import Counter
+from typing import Optional
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from core import event_loop
+
+from . import payout_cache, stats, status_log
+from .events import publish_status
+from .metrics import PAYOUTS_FINALIZED, WRITE_BEHIND_FLUSH_SIZE
+from .models import PayoutRequest
+from .services import PayoutResult, PayoutService
+from .webhooks import enqueue_webhooks
+
+logger = logging.getLogger(__name__)
+
+RETURNING_FIELDS = ('id', 'external_id', 'amount', 'currency', 'status', 'updated_at')
+
+
+def finalize_payouts(items: list[tuple[str, str, str]]) -> list[PayoutResult]:
+    """
+    Перевод пачки заявок в финальные статусы одним UPDATE ... FROM (VALUES ...).
+
+    Args:
+        items: (external_id, целевой статус, причина ошибки) в порядке поступления
+
+    Returns:
+        PayoutResult для каждого элемента items, как у complete_payout/fail_payout
+    """
+    results: list[Optional[PayoutResult]] = [None] * len(items)
+    # Повтор заявки в одной пачке обрабатывается как проигранная гонка
+    indexes: dict[uuid.UUID, int] = {}
+    for index, (external_id, to_status, reason) in enumerate(items):
+        try:
+            key = uuid.UUID(str(external_id))
+        except ValueError:
+            results[index] = PayoutService._rejected_result(external_id, None)
+            continue
+        indexes.setdefault(key, index)
+
+    with transaction.atomic():
+        rows = {}
+        if indexes:
+            rows = {
+                payout.external_id: payout
+                for payout in _update([(key, items[index][1]) for key, index in indexes.items()])
+            }
+        if rows:
+            payouts = list(rows.values())
+            stats.record(
+                delta
+                for payout in payouts
+                for delta in (
+                    (PayoutService.TRANSITIONS[payout.status], payout.currency, -1, -payout.amount),
+                    (payout.status, payout.currency, 1, payout.amount),
+                )
+            )
+            status_log.record((payout, PayoutService.TRANSITIONS[payout.status]) for payout in payouts)
+            payout_cache.invalidate(payout.external_id for payout in payouts)
+            publish_status(payouts)
+            enqueue_webhooks(payouts)
+
+    for (payout_status, currency), count in Counter(
+        (payout.status, payout.currency) for payout in rows.values()
+    ).items():
+        PAYOUTS_FINALIZED.labels(status=payout_status, currency=currency).inc(count)
+
+    current = dict(
+        PayoutRequest.objects.filter(external_id__in=[key for key in indexes if key not in rows])
+        .values_list('external_id', 'status')
+    )
+    for index, (external_id, to_status, reason) in enumerate(items):
+        if results[index] is not None:
+            continue
+        key = uuid.UUID(str(external_id))
+        if indexes[key] == index and key in rows:
+            if to_status == PayoutRequest.Status.COMPLETED:
+                results[index] = PayoutResult(True, str(external_id), to_status, 'Выплата выполнена успешно')
+            else:
+                logger.warning(f'Заявка {external_id}: ошибка — {reason}')
+                results[index] = PayoutResult(
+                    False, str(external_id), to_status, reason or 'Ошибка обработки выплаты'
+                )
+        else:
+            results[index] = PayoutService._rejected_result(
+                external_id, rows[key].status if key in rows else current.get(key)
+            )
+
+    WRITE_BEHIND_FLUSH_SIZE.observe(len(items))
+    logger.info(f'[WriteBehind] Записано {len(rows)} из {len(items)} финальных статусов')
+    return results
+
+
+def _update(items: list[tuple[uuid.UUID, str]]) -> list[PayoutRequest]:
+    """UPDATE ... FROM (VALUES ...) с условием по исходному статусу, RETURNING изменённые строки."""
+    opts = PayoutRequest._meta
+    qn = connection.ops.quote_name
+    table = qn(opts.db_table)
+    external_id_field = opts.get_field('external_id')
+    columns = ', '.join(f'{table}.{qn(opts.get_field(name).column)}' for name in RETURNING_FIELDS)
+    values = ', '.join(['(%s, %s, %s)'] * len(items))
+    sql = (
+        f'WITH v (external_id, from_status, to_status) AS (VALUES {values}) '
+        f'UPDATE {table} '
+        f'SET {qn("status")} = v.to_status, {qn("updated_at")} = %s '
+        f'FROM v '
+        f'WHERE {table}.{qn("external_id")} = v.external_id '
+        f'AND {table}.{qn("status")} = v.from_status '
+        f'RETURNING {columns}'
+    )
+    params = []
+    for external_id, to_status in items:
+        params += [
+            external_id_field.get_db_prep_value(external_id, connection),
+            PayoutService.TRANSITIONS[to_status],
+            to_status,
+        ]
+    params.append(opts.get_field('updated_at').get_db_prep_value(timezone.now(), connection))
+    return list(PayoutRequest.objects.raw(sql, params))
+
+
+class WriteBehindBuffer:
+    """
+    Буфер финальных статусов на event loop процесса.
+
+    Args:
+        max_items: Размер пачки, при котором flush начинается сразу
+        flush_interval: Максимальное ожидание первого результата в буфере, секунды
+    """
+
+    def __init__(self, max_items: int, flush_interval: float):
+        self.max_items = max(1, max_items)
+        self.flush_interval = flush_interval
+        self._items: list[tuple[str, str, str]] = []
+        self._futures: list[asyncio.Future] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._flushes: set[asyncio.Task] = set()
+
+    @classmethod
+    def from_settings(cls) -> 'WriteBehindBuffer':
+        return cls(
+            max_items=settings.PAYOUT_WRITE_BEHIND_MAX_ITEMS,
+            flush_interval=settings.PAYOUT_WRITE_BEHIND_FLUSH_INTERVAL,
+        )
+
+    async def complete(self, external_id: str) -> PayoutResult:
+        """processing → completed после ближайшего flush."""
+        return await self.put(external_id, PayoutRequest.Status.COMPLETED)
+
+    async def fail(self, external_id: str, reason: str = '') -> PayoutResult:
+        """processing → failed после ближайшего flush."""
+        return await self.put(external_id, PayoutRequest.Status.FAILED, reason)
+
+    async def put(self, external_id: str, to_status: str, reason: str = '') -> PayoutResult:
+        """
+        Добавление результата в буфер и ожидание его записи.
+
+        Raises:
+            Исключение flush (ошибка БД) — статус не записан
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._items.append((str(external_id), to_status, reason))
+        self._futures.append(future)
+        if len(self._items) >= self.max_items:
+            self.flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.flush_interval, self.flush)
+        return await future
+
+    def flush(self) -> Optional[asyncio.Task]:
+        """Запуск записи накопленных результатов (не ждёт её окончания)."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._items:
+            return None
+        items, futures = self._items, self._futures
+        self._items, self._futures = [], []
+        task = asyncio.get_running_loop().create_task(self._write(items, futures))
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+        return task
+
+    async def close(self) -> None:
+        """Запись остатка буфера и ожидание незавершённых flush."""
+        self.flush()
+        if self._flushes:
+            await asyncio.gather(*self._flushes, return_exceptions=True)
+
+    @staticmethod
+    async def _write(items: list[tuple[str, str, str]], futures: list[asyncio.Future]) -> None:
+        try:
+            results = await sync_to_async(finalize_payouts)(items)
+        except Exception as exc:
+            logger.error(f'[WriteBehind] Ошибка записи {len(items)} финальных статусов: {exc}')
+            for future in futures:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+        for future, result in zip(futures, results):
+            if not future.done():
+                future.set_result(result)
+
+
+def get_write_behind() -> WriteBehindBuffer:
+    """Буфер write-behind event loop'а процесса (остаток записывается при shutdown)."""
+    return event_loop.get_resource(
+        'payout_write_behind',
+        WriteBehindBuffer.from_settings,
+        close=lambda buffer: buffer.close(),
+    )